@@ -0,0 +1,71 @@
+"""
+Time of one transactional batch update of salaries and promotion dates.
+
+Run:
+    python -m benchmarks.batch_update [--rows 100000]
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from shift_fastapi_service.config import Settings
+from shift_fastapi_service.database import create_database_engine
+from shift_fastapi_service.domain import UserUpdate
+from shift_fastapi_service.models import User
+from shift_fastapi_service.repository import Repository
+
+
+def main(rows: int) -> None:
+    db_path = Path(tempfile.mkdtemp()) / "bench.db"
+    engine = create_database_engine(
+        Settings(database_url=f"sqlite+pysqlite:///{db_path}")
+    )
+    db = Repository(engine)
+    db.generate_schema()
+    with Session(engine) as session:
+        session.execute(
+            insert(User),
+            [
+                {
+                    "username": f"user{i}",
+                    "email": f"user{i}@example.com",
+                    "salary": i,
+                    "next_promotion_date": date(year=2030, month=1, day=1),
+                    "disabled": False,
+                    "hashed_password": "not a hash",
+                }
+                for i in range(rows)
+            ],
+        )
+        session.commit()
+    updates = [
+        UserUpdate(
+            username=f"user{i}",
+            salary=i + 100,
+            next_promotion_date=date(year=2031, month=1, day=1)
+            + timedelta(days=i % 365),
+        )
+        for i in range(rows)
+    ]
+    start = time.perf_counter()
+    results = db.update_users(updates)
+    seconds = time.perf_counter() - start
+    engine.dispose()
+    updated = sum(result.updated for result in results)
+    print(
+        f"rows={rows} updated={updated} seconds={seconds:.2f} "
+        f"rows_per_second={rows / seconds:.0f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+    main(args.rows)
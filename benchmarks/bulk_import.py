@@ -0,0 +1,85 @@
+"""
+Bulk import throughput in rows per second.
+
+Rows carry ready hashed passwords unless --hash is given,
+so the numbers show parsing and insert throughput.
+
+Run:
+    python -m benchmarks.bulk_import [--rows 50000] [--batch-size 1000]
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from shift_fastapi_service.auth.hashing import HashingPool, get_password_hash
+from shift_fastapi_service.bulk_import import import_users
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def generate_ndjson(
+    rows: int, hash_passwords: bool
+) -> AsyncIterator[bytes]:
+    password = {"hashed_password": get_password_hash("secret")}
+    buffer = []
+    for i in range(rows):
+        row = {
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "salary": i,
+            "next_promotion_date": "2030-01-01",
+        } | ({"password": "secret"} if hash_passwords else password)
+        buffer.append(json.dumps(row))
+        if len(buffer) == 1000:
+            yield ("\n".join(buffer) + "\n").encode()
+            buffer = []
+    if buffer:
+        yield "\n".join(buffer).encode()
+
+
+async def main(
+    rows: int, batch_size: int, hash_passwords: bool, workers: int
+) -> None:
+    from shift_fastapi_service.repository import AsyncRepository
+
+    db_path = Path(tempfile.mkdtemp()) / "bench.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    db = AsyncRepository(engine)
+    await db.generate_schema()
+    hashing_pool = HashingPool(
+        workers=workers, queue_size=workers, executor="process"
+    )
+    try:
+        report = await import_users(
+            generate_ndjson(rows, hash_passwords),
+            "ndjson",
+            db,
+            hashing_pool,
+            batch_size,
+            allow_hashed_password=True,
+        )
+    finally:
+        hashing_pool.shutdown()
+        await engine.dispose()
+    print(
+        f"rows={report.rows} created={report.created} "
+        f"errors={len(report.errors)} batch_size={batch_size} "
+        f"seconds={report.seconds:.2f} "
+        f"rows_per_second={report.rows_per_second:.0f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--hash", action="store_true")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.batch_size, args.hash, args.workers))
@@ -0,0 +1,96 @@
+"""
+Throughput of read-only endpoints with and without claims-carrying tokens.
+
+Modes are switched through environment variables between runs, each run
+logs in again to get a token of its mode.
+
+Run:
+    python -m benchmarks.claims_tokens [--concurrency 16] [--requests 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.utils import (
+    TEST_PASSWORD,
+    TEST_USERNAME,
+    load_app,
+    open_client,
+    print_summary,
+    summarize,
+)
+
+PATHS = ("/user/me", "/salary/me", "/promotion/me")
+
+MODES: dict[str, dict[str, str]] = {
+    "db, no principal cache": {
+        "TOKEN_CLAIMS_MODE": "off",
+        "PRINCIPAL_CACHE_SIZE": "0",
+    },
+    "db, principal cache": {"TOKEN_CLAIMS_MODE": "off"},
+    "claims": {"TOKEN_CLAIMS_MODE": "claims"},
+    "strict claims": {"TOKEN_CLAIMS_MODE": "strict"},
+}
+
+
+def apply_mode(environ: dict[str, str]) -> None:
+    from shift_fastapi_service.cache import (
+        get_principal_cache,
+        get_token_cache,
+    )
+    from shift_fastapi_service.config import get_settings
+
+    os.environ.pop("PRINCIPAL_CACHE_SIZE", None)
+    os.environ.update(environ)
+    for getter in (get_settings, get_principal_cache, get_token_cache):
+        getter.cache_clear()
+
+
+async def run_mode(
+    client: httpx.AsyncClient, requests: int, concurrency: int
+) -> tuple[list[float], float]:
+    response = await client.post(
+        "/token", data={"username": TEST_USERNAME, "password": TEST_PASSWORD}
+    )
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    latencies: list[float] = []
+
+    async def worker(worker_id: int) -> None:
+        for i in range(worker_id, requests, concurrency):
+            start = time.perf_counter()
+            response = await client.get(PATHS[i % len(PATHS)], headers=headers)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    await worker(0)
+    latencies.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latencies, len(latencies) / (time.perf_counter() - start)
+
+
+async def main(requests: int, concurrency: int) -> None:
+    app = load_app(Path(tempfile.mkdtemp(prefix="claims_tokens_")))
+    async with open_client(app) as client:
+        await client.get("/create_schema")
+        await client.get("/load_data")
+        for name, environ in MODES.items():
+            apply_mode(environ)
+            latencies, rps = await run_mode(client, requests, concurrency)
+            print_summary(name, summarize(latencies))
+            print(f"{'':<32} rps={rps:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
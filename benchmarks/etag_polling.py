@@ -0,0 +1,95 @@
+"""
+Dashboard polling of the /me endpoints with and without If-None-Match.
+
+Every poll requests /user/me, /salary/me and /promotion/me. Conditional
+polls send the last ETag of each endpoint, one user update in the middle
+of the run shows that changes still reach the client.
+
+Run:
+    python -m benchmarks.etag_polling [--polls 1000]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.utils import (
+    TEST_USERNAME,
+    load_app,
+    open_client,
+    prepare_client,
+    print_summary,
+    summarize,
+)
+
+PATHS = ("/user/me", "/salary/me", "/promotion/me")
+
+
+def response_size(response: httpx.Response) -> int:
+    headers = sum(
+        len(name) + len(value) + 4 for name, value in response.headers.raw
+    )
+    return headers + len(response.content)
+
+
+async def poll(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    polls: int,
+    conditional: bool,
+) -> tuple[list[float], int, dict[int, int]]:
+    from shift_fastapi_service.domain import UserUpdate
+    from shift_fastapi_service.repository import AsyncRepository
+
+    etags: dict[str, str] = {}
+    latencies: list[float] = []
+    transferred = 0
+    statuses: dict[int, int] = {}
+    for i in range(polls):
+        if i == polls // 2:
+            await AsyncRepository().update_users(
+                [UserUpdate(username=TEST_USERNAME, salary=i)]
+            )
+        for path in PATHS:
+            request_headers = headers
+            if conditional and path in etags:
+                request_headers = headers | {"If-None-Match": etags[path]}
+            start = time.perf_counter()
+            response = await client.get(path, headers=request_headers)
+            latencies.append(time.perf_counter() - start)
+            transferred += response_size(response)
+            statuses[response.status_code] = (
+                statuses.get(response.status_code, 0) + 1
+            )
+            if response.status_code == 200:
+                etags[path] = response.headers["ETag"]
+    return latencies, transferred, statuses
+
+
+async def main(polls: int) -> None:
+    app = load_app(Path(tempfile.mkdtemp(prefix="etag_polling_")))
+    async with open_client(app) as client:
+        headers = await prepare_client(client)
+        for name, conditional in (
+            ("unconditional", False),
+            ("If-None-Match", True),
+        ):
+            latencies, transferred, statuses = await poll(
+                client, headers, polls, conditional
+            )
+            print_summary(name, summarize(latencies))
+            print(
+                f"{'':<32} bytes/response="
+                f"{transferred / len(latencies):.1f} statuses={statuses}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--polls", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.polls))
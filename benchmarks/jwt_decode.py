@@ -0,0 +1,47 @@
+"""
+Access token decode cost with and without the verified-token cache.
+
+Run:
+    python -m benchmarks.jwt_decode [--number 20000]
+"""
+
+import argparse
+import os
+import secrets
+import timeit
+from datetime import timedelta
+
+from jose import jwt
+
+
+def main(number: int) -> None:
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+    os.environ.setdefault("ALGORITHM", "HS256")
+    import shift_fastapi_service.auth.auth as auth
+    from shift_fastapi_service.config import get_settings
+
+    settings = get_settings()
+    token = auth.create_access_token(
+        data={"sub": "alice"}, expires_delta=timedelta(minutes=15)
+    )
+    auth.decode_access_token(token)
+    timings = {
+        "jwt.decode": lambda: jwt.decode(
+            token=token,
+            key=settings.secret_key.get_secret_value(),
+            algorithms=[settings.algorithm],
+        ),
+        "decode_access_token (cached)": lambda: auth.decode_access_token(
+            token
+        ),
+    }
+    for name, func in timings.items():
+        best = min(timeit.repeat(func, number=number, repeat=5)) / number
+        print(f"{name:<32} {best * 1_000_000:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20_000)
+    args = parser.parse_args()
+    main(args.number)
@@ -0,0 +1,76 @@
+"""
+Signing and verification cost of access tokens by algorithm.
+
+"pem" passes key material to python-jose, which parses it on every call,
+"key set" uses keys constructed once by KeySet.
+
+Run:
+    python -m benchmarks.jwt_signing [--number 2000]
+"""
+
+import argparse
+import tempfile
+import timeit
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwt
+
+from shift_fastapi_service.auth.keys import load_key_set
+
+CLAIMS = {"sub": "alice", "exp": 4_102_444_800}
+
+
+def write_keys(keys_dir: Path) -> dict[str, tuple[str, bytes, bytes]]:
+    private_keys = {
+        "ES256": ec.generate_private_key(ec.SECP256R1()),
+        "RS256": rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        ),
+    }
+    pems = {}
+    for algorithm, private_key in private_keys.items():
+        private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        (keys_dir / f"{algorithm}.pem").write_bytes(private_pem)
+        pems[algorithm] = (algorithm, private_pem, public_pem)
+    return pems
+
+
+def main(number: int) -> None:
+    keys_dir = Path(tempfile.mkdtemp(prefix="jwt_signing_"))
+    pems = write_keys(keys_dir)
+    pems["HS256"] = ("HS256", b"secret", b"secret")
+    for kid, (algorithm, private_pem, public_pem) in pems.items():
+        key_set = load_key_set(
+            "secret", "HS256", str(keys_dir), None if kid == "HS256" else kid
+        )
+        token = key_set.encode(CLAIMS)
+        timings = {
+            "sign pem": lambda: jwt.encode(
+                CLAIMS, private_pem.decode(), algorithm=algorithm
+            ),
+            "sign key set": lambda: key_set.encode(CLAIMS),
+            "verify pem": lambda: jwt.decode(
+                token, public_pem.decode(), algorithms=[algorithm]
+            ),
+            "verify key set": lambda: key_set.decode(token),
+        }
+        for name, func in timings.items():
+            best = min(timeit.repeat(func, number=number, repeat=3)) / number
+            print(f"{algorithm} {name:<24} {best * 1_000_000:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.number)
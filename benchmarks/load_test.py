@@ -0,0 +1,308 @@
+"""
+Load test of the HTTP API with seeded users.
+
+Drives the service app in-process over ASGI transport, or a running
+server with --url. Every scenario sends --requests requests from
+--concurrency workers, each worker logged in as its own seeded user,
+after --warmup requests that aren't measured.
+
+Run:
+    python -m benchmarks.load_test [--concurrency 16] [--requests 1000]
+    python -m benchmarks.load_test --output results.json
+    python -m benchmarks.load_test --baseline results.json [--tolerance 0.2]
+    python -m benchmarks.load_test --url http://127.0.0.1:8000
+
+In-process runs disable login throttling, run the --url target with
+LOGIN_THROTTLE_ENABLED=false as well.
+
+Exits with status 1 if a scenario is slower than the baseline by more
+than the tolerance, or if any request fails.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import secrets
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from benchmarks.utils import load_app, open_client, print_summary, summarize
+
+SEED_PASSWORD = "bench12345"
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+class Users:
+    """
+    Seeded users and access tokens of the workers.
+    """
+
+    def __init__(self, prefix: str, count: int) -> None:
+        self.usernames = [f"{prefix}_{i}" for i in range(count)]
+        self.headers: list[dict[str, str]] = []
+        self.created = itertools.count()
+        self.prefix = prefix
+
+    def get_headers(self, worker: int) -> dict[str, str]:
+        return self.headers[worker % len(self.headers)]
+
+    def next_new_user(self) -> dict:
+        username = f"{self.prefix}_new_{next(self.created)}"
+        return {
+            "username": username,
+            "email": f"{username}@example.com",
+            "salary": 100,
+            "next_promotion_date": "2030-01-01",
+            "disabled": False,
+            "password": SEED_PASSWORD,
+        }
+
+
+async def seed_users(
+    client: httpx.AsyncClient, users: Users, logins: int
+) -> None:
+    from shift_fastapi_service.auth.hashing import get_password_hash
+
+    await client.get("/create_schema")
+    hashed_password = get_password_hash(SEED_PASSWORD)
+    body = "\n".join(
+        json.dumps(
+            {
+                "username": username,
+                "email": f"{username}@example.com",
+                "salary": i,
+                "next_promotion_date": "2030-01-01",
+                "disabled": False,
+                "hashed_password": hashed_password,
+            }
+        )
+        for i, username in enumerate(users.usernames)
+    )
+    response = await client.post(
+        "/user/import",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    response.raise_for_status()
+    for username in users.usernames[:logins]:
+        response = await client.post(
+            "/token", data={"username": username, "password": SEED_PASSWORD}
+        )
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        users.headers.append({"Authorization": f"Bearer {token}"})
+
+
+def get_scenarios(users: Users) -> dict[str, tuple[Request, int]]:
+    """
+    Get requests of scenarios and their expected status codes.
+
+    Args:
+        users (Users): Seeded users
+
+    Returns:
+        dict[str, tuple[Request, int]]: Request and status by scenario
+    """
+
+    def get(path: str) -> Request:
+        def request(
+            client: httpx.AsyncClient, worker: int
+        ) -> Awaitable[httpx.Response]:
+            return client.get(path, headers=users.get_headers(worker))
+
+        return request
+
+    def login(
+        client: httpx.AsyncClient, worker: int
+    ) -> Awaitable[httpx.Response]:
+        username = users.usernames[worker % len(users.usernames)]
+        return client.post(
+            "/token", data={"username": username, "password": SEED_PASSWORD}
+        )
+
+    def create_user(
+        client: httpx.AsyncClient, worker: int
+    ) -> Awaitable[httpx.Response]:
+        return client.post("/user/create", json=users.next_new_user())
+
+    return {
+        "token": (login, 200),
+        "user_me": (get("/user/me"), 200),
+        "salary_me": (get("/salary/me"), 200),
+        "promotion_me": (get("/promotion/me"), 200),
+        "user_create": (create_user, 201),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    request: Request,
+    expected_status: int,
+    requests: int,
+    concurrency: int,
+) -> dict[str, float]:
+    remaining = itertools.count()
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker(worker_id: int) -> None:
+        nonlocal errors
+        while next(remaining) < requests:
+            start = time.perf_counter()
+            response = await request(client, worker_id)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != expected_status:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    summary = summarize(latencies)
+    summary["rps"] = len(latencies) / elapsed
+    summary["errors"] = errors
+    return summary
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    """
+    Find scenarios that regressed against baseline.
+
+    Args:
+        results (dict[str, dict[str, float]]): Summaries by scenario
+        baseline (dict[str, dict[str, float]]): Baseline summaries
+        tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%
+
+    Returns:
+        list[str]: Descriptions of regressions
+    """
+    regressions = []
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if summary[key] > base[key] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {key} {summary[key]:.3f} > "
+                    f"baseline {base[key]:.3f}"
+                )
+        if summary["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name} rps {summary['rps']:.1f} < "
+                f"baseline {base['rps']:.1f}"
+            )
+    return regressions
+
+
+@asynccontextmanager
+async def open_target(url: str | None) -> AsyncIterator[httpx.AsyncClient]:
+    if url is None:
+        app = load_app(
+            Path(tempfile.mkdtemp(prefix="load_test_")),
+            environ={"LOGIN_THROTTLE_ENABLED": "false"},
+        )
+        async with open_client(app) as client:
+            yield client
+        return
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+        yield client
+
+
+async def main(args: argparse.Namespace) -> int:
+    users = Users(f"bench_{secrets.token_hex(4)}", args.users)
+    results: dict[str, dict[str, float]] = {}
+    async with open_target(args.url) as client:
+        await seed_users(client, users, min(args.users, args.concurrency))
+        scenarios = get_scenarios(users)
+        for name in args.scenarios:
+            request, expected_status = scenarios[name]
+            await run_scenario(
+                client, request, expected_status, args.warmup, args.concurrency
+            )
+            results[name] = await run_scenario(
+                client,
+                request,
+                expected_status,
+                args.requests,
+                args.concurrency,
+            )
+            print_summary(name, results[name])
+            print(
+                f"{'':<32} rps={results[name]['rps']:.1f} "
+                f"errors={results[name]['errors']}"
+            )
+    report = {
+        "meta": {
+            "target": args.url or "asgi",
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "users": args.users,
+            "python": platform.python_version(),
+            "created_at": datetime.now(tz=timezone.utc).isoformat(),
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"results saved to {args.output}")
+    failed = [name for name, summary in results.items() if summary["errors"]]
+    for name in failed:
+        print(f"FAILED: {name} had {results[name]['errors']} errors")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["scenarios"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if not regressions:
+            print(f"no regressions against {args.baseline}")
+        failed.extend(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--url", help="target a running server")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=32)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=[
+            "token",
+            "user_me",
+            "salary_me",
+            "promotion_me",
+            "user_create",
+        ],
+        choices=[
+            "token",
+            "user_me",
+            "salary_me",
+            "promotion_me",
+            "user_create",
+        ],
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,84 @@
+"""
+/user/me latency with and without a concurrent login storm.
+
+Run:
+    python -m benchmarks.login_storm [--logins 64] [--requests 500]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.utils import (
+    TEST_PASSWORD,
+    TEST_USERNAME,
+    load_app,
+    open_client,
+    prepare_client,
+    print_summary,
+    summarize,
+)
+
+
+async def measure_user_me(
+    client: httpx.AsyncClient, headers: dict[str, str], requests: int
+) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get("/user/me", headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return latencies
+
+
+async def login_storm(
+    client: httpx.AsyncClient, logins: int, stop: asyncio.Event
+) -> dict[int, int]:
+    statuses: dict[int, int] = {}
+
+    async def login_loop() -> None:
+        while not stop.is_set():
+            response = await client.post(
+                "/token",
+                data={"username": TEST_USERNAME, "password": TEST_PASSWORD},
+            )
+            statuses[response.status_code] = (
+                statuses.get(response.status_code, 0) + 1
+            )
+
+    await asyncio.gather(*(login_loop() for _ in range(logins)))
+    return statuses
+
+
+async def main(logins: int, requests: int) -> None:
+    app = load_app(
+        Path(tempfile.mkdtemp(prefix="login_storm_")),
+        environ={"LOGIN_THROTTLE_ENABLED": "false"},
+    )
+    async with open_client(app) as client:
+        headers = await prepare_client(client)
+        print_summary(
+            "/user/me idle",
+            summarize(await measure_user_me(client, headers, requests)),
+        )
+        stop = asyncio.Event()
+        storm = asyncio.create_task(login_storm(client, logins, stop))
+        await asyncio.sleep(0.5)
+        latencies = await measure_user_me(client, headers, requests)
+        stop.set()
+        statuses = await storm
+        print_summary(f"/user/me during {logins} logins", summarize(latencies))
+        print(f"/token statuses during storm: {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.requests))
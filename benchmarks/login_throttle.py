@@ -0,0 +1,106 @@
+"""
+/user/me latency during a credential stuffing attack on /token.
+
+The attack runs from one client address with wrong passwords, once with
+login throttling disabled and once enabled.
+
+Run:
+    python -m benchmarks.login_throttle [--attackers 64] [--interval 0.01]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import tempfile
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.login_storm import measure_user_me
+from benchmarks.utils import (
+    TEST_USERNAME,
+    load_app,
+    open_client,
+    prepare_client,
+    print_summary,
+    summarize,
+)
+
+ATTACKER_ADDRESS = ("203.0.113.7", 40000)
+
+
+async def attack(
+    app: FastAPI, attackers: int, interval: float, stop: asyncio.Event
+) -> dict[int, int]:
+    statuses: dict[int, int] = {}
+    attempts = itertools.count()
+    transport = httpx.ASGITransport(
+        app=app, client=ATTACKER_ADDRESS  # type: ignore[arg-type]
+    )
+
+    async def attack_loop(client: httpx.AsyncClient) -> None:
+        while not stop.is_set():
+            attempt = next(attempts)
+            username = TEST_USERNAME if attempt % 2 else f"user{attempt}"
+            response = await client.post(
+                "/token",
+                data={"username": username, "password": f"guess{attempt}"},
+            )
+            statuses[response.status_code] = (
+                statuses.get(response.status_code, 0) + 1
+            )
+            # attackers ignore Retry-After, interval stands for
+            # the network round trip
+            await asyncio.sleep(interval)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        await asyncio.gather(*(attack_loop(client) for _ in range(attackers)))
+    return statuses
+
+
+def set_throttle(enabled: bool) -> None:
+    from shift_fastapi_service.auth.throttling import get_login_throttle
+    from shift_fastapi_service.config import get_settings
+
+    os.environ["LOGIN_THROTTLE_ENABLED"] = str(enabled).lower()
+    get_settings.cache_clear()
+    get_login_throttle.cache_clear()
+
+
+async def main(attackers: int, interval: float, requests: int) -> None:
+    app = load_app(Path(tempfile.mkdtemp(prefix="login_throttle_")))
+    async with open_client(app) as client:
+        headers = await prepare_client(client)
+        print_summary(
+            "/user/me idle",
+            summarize(await measure_user_me(client, headers, requests)),
+        )
+        for enabled in (False, True):
+            set_throttle(enabled)
+            stop = asyncio.Event()
+            attack_task = asyncio.create_task(
+                attack(app, attackers, interval, stop)
+            )
+            await asyncio.sleep(0.5)
+            latencies = await measure_user_me(client, headers, requests)
+            stop.set()
+            statuses = await attack_task
+            name = "on" if enabled else "off"
+            print_summary(
+                f"/user/me under attack, throttle {name}",
+                summarize(latencies),
+            )
+            print(f"{'':<32} /token statuses: {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--attackers", type=int, default=64)
+    parser.add_argument("--interval", type=float, default=0.01)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.attackers, args.interval, args.requests))
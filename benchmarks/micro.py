@@ -0,0 +1,202 @@
+"""
+Microbenchmarks of auth and domain primitives.
+
+Every primitive is timed in isolation after a warmup, in several rounds
+of many calls, and compared with its threshold. Thresholds are about
+twice the best time on the reference machine, so a 2x slowdown after
+a dependency bump fails, scale them with --threshold-scale on slower
+machines. bcrypt thresholds are given for 4 rounds and doubled
+for every extra round.
+
+Run:
+    python -m benchmarks.micro [--bcrypt-rounds 4] [--threshold-scale 1]
+    pytest --run-benchmarks tests/test_benchmarks.py
+"""
+
+import argparse
+import os
+import secrets
+import statistics
+import sys
+import time
+import timeit
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable
+
+from jose import jwt
+from passlib.context import CryptContext
+
+BCRYPT_BASE_ROUNDS = 4
+
+# seconds per call
+THRESHOLDS: dict[str, float] = {
+    "jwt.decode": 100e-6,
+    "create_access_token": 60e-6,
+    "pwd_context.verify": 3e-3,
+    "UserInDB(**user_dict)": 6e-6,
+    "User.to_dict": 1.5e-6,
+    "User.get_salary": 4.5e-6,
+    "Principal.to_user_in_db": 9e-6,
+}
+
+USER_DICT = {
+    "username": "alice",
+    "email": "alice@example.com",
+    "salary": 10,
+    "next_promotion_date": date(year=2025, month=12, day=12),
+    "disabled": False,
+    "hashed_password": "",
+}
+
+
+@dataclass
+class Timing:
+    """
+    Seconds per call of a primitive, over rounds of calls.
+    """
+
+    name: str
+    number: int
+    rounds: list[float]
+
+    @property
+    def best(self) -> float:
+        return min(self.rounds)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.rounds)
+
+    @property
+    def stdev(self) -> float:
+        if len(self.rounds) < 2:
+            return 0.0
+        return statistics.stdev(self.rounds)
+
+
+def measure(
+    name: str,
+    func: Callable[[], object],
+    rounds: int = 5,
+    min_round_time: float = 0.05,
+    warmup: float = 0.02,
+) -> Timing:
+    """
+    Time a primitive after warming it up.
+
+    Number of calls per round is picked so a round takes
+    at least min_round_time.
+
+    Args:
+        name (str): Name of primitive
+        func (Callable[[], object]): Primitive called without arguments
+        rounds (int): Number of timed rounds
+        min_round_time (float): Minimum duration of round in seconds
+        warmup (float): Duration of untimed calls in seconds
+
+    Returns:
+        Timing: Seconds per call in every round
+    """
+    timer = timeit.Timer(func)
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        func()
+    number, _ = timer.autorange()
+    one_round = timer.timeit(number)
+    if one_round < min_round_time:
+        number = max(number, int(number * min_round_time / one_round))
+    return Timing(
+        name=name,
+        number=number,
+        rounds=[timer.timeit(number) / number for _ in range(rounds)],
+    )
+
+
+def get_threshold(
+    name: str, bcrypt_rounds: int, threshold_scale: float = 1.0
+) -> float:
+    threshold = THRESHOLDS[name] * threshold_scale
+    if name == "pwd_context.verify":
+        threshold *= 2 ** (bcrypt_rounds - BCRYPT_BASE_ROUNDS)
+    return threshold
+
+
+def get_primitives(bcrypt_rounds: int) -> dict[str, Callable[[], object]]:
+    """
+    Get primitives to time, bound to their inputs.
+
+    Args:
+        bcrypt_rounds (int): bcrypt cost of the password hash
+
+    Returns:
+        dict[str, Callable[[], object]]: Primitives by name
+    """
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+    os.environ.setdefault("ALGORITHM", "HS256")
+    import shift_fastapi_service.auth.auth as auth
+    from shift_fastapi_service.config import get_settings
+    from shift_fastapi_service.domain import Principal, User, UserInDB
+
+    pwd_context = CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=bcrypt_rounds
+    )
+    plain_password = "alice12345"
+    hashed_password = pwd_context.hash(plain_password)
+    settings = get_settings()
+    token = auth.create_access_token(
+        data={"sub": "alice"}, expires_delta=timedelta(minutes=15)
+    )
+    user_dict = USER_DICT | {"hashed_password": hashed_password}
+    user = User(**user_dict)
+    principal = Principal.from_dict(user_dict)
+    return {
+        "jwt.decode": lambda: jwt.decode(
+            token=token,
+            key=settings.secret_key.get_secret_value(),
+            algorithms=[settings.algorithm],
+        ),
+        "create_access_token": lambda: auth.create_access_token(
+            data={"sub": "alice"}, expires_delta=timedelta(minutes=15)
+        ),
+        "pwd_context.verify": lambda: pwd_context.verify(
+            plain_password, hashed_password
+        ),
+        "UserInDB(**user_dict)": lambda: UserInDB(**user_dict),
+        "User.to_dict": user.to_dict,
+        "User.get_salary": user.get_salary,
+        "Principal.to_user_in_db": principal.to_user_in_db,
+    }
+
+
+def print_timing(timing: Timing, threshold: float) -> None:
+    status = "ok" if timing.best <= threshold else "SLOW"
+    print(
+        f"{timing.name:<26} best={timing.best * 1e6:10.2f}us "
+        f"median={timing.median * 1e6:10.2f}us "
+        f"stdev={timing.stdev * 1e6:8.2f}us "
+        f"threshold={threshold * 1e6:10.2f}us "
+        f"n={timing.number:<7} {status}"
+    )
+
+
+def main(bcrypt_rounds: int, threshold_scale: float) -> int:
+    slow = 0
+    for name, func in get_primitives(bcrypt_rounds).items():
+        timing = measure(name, func)
+        threshold = get_threshold(name, bcrypt_rounds, threshold_scale)
+        print_timing(timing, threshold)
+        slow += timing.best > threshold
+    return 1 if slow else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--bcrypt-rounds", type=int, default=BCRYPT_BASE_ROUNDS
+    )
+    parser.add_argument("--threshold-scale", type=float, default=1.0)
+    args = parser.parse_args()
+    sys.exit(main(args.bcrypt_rounds, args.threshold_scale))
@@ -0,0 +1,93 @@
+"""
+Cost of a /salary/me read through the ORM and through projected columns.
+
+The ORM path loads a User entity into a session, converts it to a dict,
+validates UserInDB and builds UserSalary. The projected path selects
+the columns of Principal as a Core row. Both build the response body.
+Memory allocated during a request is measured with tracemalloc,
+on the sync Repository so that driver threads don't add noise.
+
+Run:
+    python -m benchmarks.projected_reads [--requests 5000]
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import create_engine
+
+from benchmarks.utils import print_summary, summarize
+from shift_fastapi_service.domain import Principal, UserInDB
+from shift_fastapi_service.repository import Repository
+
+TEST_USER = {
+    "username": "alice",
+    "email": "alice@example.com",
+    "salary": 10,
+    "next_promotion_date": date(year=2025, month=12, day=12),
+    "disabled": False,
+    "hashed_password": "$2b$12$" + "x" * 53,
+}
+
+
+def read_through_orm(db: Repository) -> str:
+    user = UserInDB(**db.get_user_by_username(TEST_USER["username"]))
+    return json.dumps(user.get_salary().model_dump(mode="json"))
+
+
+def read_projected(db: Repository) -> str:
+    row = db.get_user_columns(TEST_USER["username"], Principal.__slots__)
+    principal = Principal(*row)
+    return json.dumps(
+        {"username": principal.username, "salary": principal.salary}
+    )
+
+
+def measure(
+    read: Callable[[Repository], str], db: Repository, requests: int
+) -> tuple[list[float], float]:
+    for _ in range(100):
+        read(db)
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        read(db)
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(requests // 10):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        read(db)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - current)
+    tracemalloc.stop()
+    return latencies, statistics.fmean(peaks)
+
+
+def main(requests: int) -> None:
+    db_path = Path(tempfile.mkdtemp(prefix="projected_reads_")) / "bench.db"
+    db = Repository(create_engine(f"sqlite+pysqlite:///{db_path}"))
+    db.generate_schema()
+    db.create_user(TEST_USER)
+    for name, read in (
+        ("orm entity", read_through_orm),
+        ("projected columns", read_projected),
+    ):
+        latencies, peak = measure(read, db, requests)
+        print_summary(name, summarize(latencies))
+        print(f"{'':<32} peak allocated/request={peak / 1024:.1f}KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    main(args.requests)
@@ -0,0 +1,76 @@
+"""
+Cost of renewing an access token by password and by refresh token.
+
+Every client renews its token in a loop, by logging in again with
+the password or by exchanging its current refresh token.
+
+Run:
+    python -m benchmarks.refresh_tokens [--clients 8] [--renewals 50]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.utils import (
+    TEST_PASSWORD,
+    TEST_USERNAME,
+    load_app,
+    open_client,
+    prepare_client,
+    print_summary,
+    summarize,
+)
+
+CREDENTIALS = {"username": TEST_USERNAME, "password": TEST_PASSWORD}
+
+
+async def renew(
+    client: httpx.AsyncClient, clients: int, renewals: int, by_refresh: bool
+) -> tuple[list[float], float]:
+    latencies: list[float] = []
+
+    async def worker() -> None:
+        response = await client.post("/token", data=CREDENTIALS)
+        response.raise_for_status()
+        refresh_token = response.json()["refresh_token"]
+        for _ in range(renewals):
+            start = time.perf_counter()
+            if by_refresh:
+                response = await client.post(
+                    "/token/refresh", data={"refresh_token": refresh_token}
+                )
+            else:
+                response = await client.post("/token", data=CREDENTIALS)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            refresh_token = response.json()["refresh_token"]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return latencies, len(latencies) / (time.perf_counter() - start)
+
+
+async def main(clients: int, renewals: int) -> None:
+    app = load_app(
+        Path(tempfile.mkdtemp(prefix="refresh_tokens_")),
+        {"LOGIN_THROTTLE_ENABLED": "false"},
+    )
+    async with open_client(app) as client:
+        await prepare_client(client)
+        for name, by_refresh in (("password", False), ("refresh token", True)):
+            latencies, rps = await renew(client, clients, renewals, by_refresh)
+            print_summary(name, summarize(latencies))
+            print(f"{'':<32} renewals/s={rps:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--renewals", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.renewals))
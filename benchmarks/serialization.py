@@ -0,0 +1,110 @@
+"""
+Serialization cost of responses before and after FastJSONResponse.
+
+"default" is what FastAPI does for a view returning a model: validate
+it against response_model, dump it to JSON-compatible python
+and render with the stdlib json encoder. "fast" renders the model or
+dict the view has built with pydantic-core or orjson.
+
+Run:
+    python -m benchmarks.serialization [--number 20000]
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import date
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from shift_fastapi_service.domain import (
+    Page,
+    Token,
+    User,
+    UserNextPromotionDate,
+    UserSalary,
+)
+from shift_fastapi_service.responses import FastJSONResponse
+
+USER = {
+    "username": "alice",
+    "email": "alice@example.com",
+    "salary": 10,
+    "next_promotion_date": date(year=2025, month=12, day=12),
+    "disabled": False,
+}
+
+
+def get_payloads() -> dict[str, tuple[type, Any, Any]]:
+    """
+    Get payloads as response model, model and what views return now.
+
+    Returns:
+        dict[str, tuple[type, Any, Any]]: Payloads by name
+    """
+    page = [User(**USER | {"username": f"user{i}"}) for i in range(100)]
+    return {
+        "UserSalary": (
+            UserSalary,
+            UserSalary(username="alice", salary=10),
+            {"username": "alice", "salary": 10},
+        ),
+        "UserNextPromotionDate": (
+            UserNextPromotionDate,
+            UserNextPromotionDate(
+                username="alice",
+                next_promotion_date=USER["next_promotion_date"],
+            ),
+            {
+                "username": "alice",
+                "next_promotion_date": USER["next_promotion_date"],
+            },
+        ),
+        "User": (User, User(**USER), dict(USER)),
+        "Token": (
+            Token,
+            Token(access_token="x" * 150, token_type="bearer"),
+            Token(access_token="x" * 150, token_type="bearer"),
+        ),
+        "Page[User] of 100": (
+            Page[User],
+            Page[User](items=page, next_cursor="100"),
+            Page[User].model_construct(items=page, next_cursor="100"),
+        ),
+    }
+
+
+async def time_default(response_model: type, model: Any, number: int) -> float:
+    field = create_response_field(name="response", type_=response_model)
+    start = time.perf_counter()
+    for _ in range(number):
+        content = await serialize_response(field=field, response_content=model)
+        JSONResponse(content)
+    return (time.perf_counter() - start) / number
+
+
+def time_fast(content: Any, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        FastJSONResponse(content)
+    return (time.perf_counter() - start) / number
+
+
+def main(number: int) -> None:
+    for name, (response_model, model, content) in get_payloads().items():
+        default = asyncio.run(time_default(response_model, model, number))
+        fast = time_fast(content, number)
+        print(
+            f"{name:<24} default={default * 1e6:8.2f}us "
+            f"fast={fast * 1e6:8.2f}us speedup={default / fast:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.number)
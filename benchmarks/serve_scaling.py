@@ -0,0 +1,127 @@
+"""
+Throughput of serve.py by number of workers.
+
+For every worker count a server is started on a fresh database and
+driven by --clients load_test processes at once, so that the client
+side isn't the bottleneck. Throughput is the sum of their req/s.
+Scaling can only be near-linear up to the number of cores left
+after the clients.
+
+Run:
+    python -m benchmarks.serve_scaling [--workers 1 2 4] [--clients 2]
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"server didn't listen on {port}")
+
+
+def run_clients(
+    port: int, clients: int, scenario: str, requests: int, workdir: Path
+) -> float:
+    processes = []
+    for i in range(clients):
+        output = workdir / f"client{i}.json"
+        args = [
+            sys.executable,
+            "-m",
+            "benchmarks.load_test",
+            "--url",
+            f"http://127.0.0.1:{port}",
+            "--scenarios",
+            scenario,
+            "--requests",
+            str(requests),
+            "--users",
+            "16",
+            "--output",
+            str(output),
+        ]
+        processes.append(
+            (
+                output,
+                subprocess.Popen(args, cwd=ROOT, stdout=subprocess.DEVNULL),
+            )
+        )
+    rps = 0.0
+    for output, process in processes:
+        process.wait()
+        rps += json.loads(output.read_text())["scenarios"][scenario]["rps"]
+    return rps
+
+
+def measure(
+    workers: int, clients: int, scenario: str, requests: int, port: int
+) -> float:
+    workdir = Path(tempfile.mkdtemp(prefix="serve_scaling_"))
+    environ = os.environ | {
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or os.urandom(32).hex(),
+        "DATABASE_URL": f"sqlite+pysqlite:///{workdir / 'bench.db'}",
+        "BCRYPT_CALIBRATION_FILE": str(workdir / "bcrypt.json"),
+        "BCRYPT_ROUNDS": "4",
+        "CREATE_SCHEMA_ON_STARTUP": "true",
+        "LOGIN_THROTTLE_ENABLED": "false",
+        "SERVER_HOST": "127.0.0.1",
+        "SERVER_PORT": str(port),
+        "SERVER_WORKERS": str(workers),
+        "PYTHONPATH": str(ROOT),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "shift_fastapi_service.serve"],
+        cwd=workdir,
+        env=environ,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        return run_clients(port, clients, scenario, requests, workdir)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args: argparse.Namespace) -> None:
+    base = None
+    for workers in args.workers:
+        rps = measure(
+            workers, args.clients, args.scenario, args.requests, args.port
+        )
+        base = base or rps
+        print(
+            f"workers={workers:<3} rps={rps:8.1f} "
+            f"speedup={rps / base:4.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, os.cpu_count() or 1}),
+    )
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--scenario", default="user_me")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8765)
+    main(parser.parse_args())
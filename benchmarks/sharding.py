@@ -0,0 +1,99 @@
+"""
+Write throughput against the number of shards.
+
+Users are created one per transaction by concurrent tasks, so every
+write takes the write lock of its SQLite shard. Shards are files of one
+temp directory, with the pragmas of the service.
+
+Run:
+    python -m benchmarks.sharding [--shards 1 2 4] [--users 4000]
+        [--concurrency 32] [--synchronous FULL]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from shift_fastapi_service.config import Settings
+from shift_fastapi_service.database import create_async_engine_for_url
+from shift_fastapi_service.repository import ShardedAsyncRepository
+
+
+def make_user(i: int) -> dict:
+    return {
+        "username": f"user{i}",
+        "email": f"user{i}@example.com",
+        "salary": i,
+        "next_promotion_date": date(2030, 1, 1),
+        "disabled": False,
+        "hashed_password": "hash",
+    }
+
+
+async def measure(
+    shards: int, users: int, concurrency: int, settings: Settings
+) -> float:
+    workdir = Path(tempfile.mkdtemp())
+    db = ShardedAsyncRepository(
+        {
+            f"s{i}": create_async_engine_for_url(
+                settings, f"sqlite+pysqlite:///{workdir / f's{i}.db'}"
+            )
+            for i in range(shards)
+        },
+        engine=create_async_engine_for_url(
+            settings, f"sqlite+pysqlite:///{workdir / 'main.db'}"
+        ),
+    )
+    queue = list(range(users))
+
+    async def writer() -> None:
+        while queue:
+            await db.create_user(make_user(queue.pop()))
+
+    try:
+        await db.generate_schema()
+        start = time.perf_counter()
+        await asyncio.gather(*(writer() for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+    finally:
+        engines = [shard.engine for shard in db.shards.values()]
+        for engine in (db.engine, *engines):
+            await engine.dispose()
+    return users / seconds
+
+
+async def main(
+    shard_counts: list[int], users: int, concurrency: int, synchronous: str
+) -> None:
+    # Pool sized so that concurrency isn't capped by one shard's pool,
+    # writers queue on the lock of a shard longer than in the service
+    settings = Settings(
+        sqlite_synchronous=synchronous,
+        sqlite_busy_timeout=60_000,
+        database_pool_size=concurrency,
+        database_max_overflow=0,
+    )
+    baseline = None
+    for shards in shard_counts:
+        rate = await measure(shards, users, concurrency, settings)
+        baseline = baseline or rate
+        print(
+            f"shards={shards:<3} users={users} concurrency={concurrency} "
+            f"writes_per_second={rate:8.1f} speedup={rate / baseline:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--synchronous", default="FULL")
+    args = parser.parse_args()
+    asyncio.run(
+        main(args.shards, args.users, args.concurrency, args.synchronous)
+    )
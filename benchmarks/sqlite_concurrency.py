@@ -0,0 +1,107 @@
+"""
+Reader latency while a writer holds write transactions, per journal mode.
+
+Run:
+    python -m benchmarks.sqlite_concurrency [--users 20000] [--seconds 3]
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from benchmarks.utils import print_summary, summarize
+from shift_fastapi_service.config import Settings
+from shift_fastapi_service.database import create_database_engine
+from shift_fastapi_service.models import User
+from shift_fastapi_service.repository import Repository
+
+JOURNAL_MODES = ("DELETE", "WAL")
+WRITE_HOLD_SECONDS = 0.02
+
+
+def seed(db: Repository, users: int) -> None:
+    db.generate_schema()
+    with Session(db.engine) as session:
+        session.add_all(
+            User(
+                username=f"user{i}",
+                email=f"user{i}@example.com",
+                salary=i,
+                next_promotion_date=date(year=2030, month=1, day=1),
+                disabled=False,
+                hashed_password="not a hash",
+            )
+            for i in range(users)
+        )
+        session.commit()
+
+
+def write_loop(db: Repository, stop: threading.Event) -> int:
+    transactions = 0
+    while not stop.is_set():
+        with Session(db.engine) as session:
+            session.execute(update(User).values(salary=User.salary + 1))
+            time.sleep(WRITE_HOLD_SECONDS)
+            session.commit()
+        transactions += 1
+    return transactions
+
+
+def read_loop(
+    db: Repository, users: int, stop: threading.Event, latencies: list[float]
+) -> None:
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        db.get_user_by_username(f"user{i % users}")
+        latencies.append(time.perf_counter() - start)
+        i += 1
+
+
+def run(journal_mode: str, users: int, readers: int, seconds: float) -> None:
+    db_path = Path(tempfile.mkdtemp()) / "bench.db"
+    settings = Settings(
+        database_url=f"sqlite+pysqlite:///{db_path}",
+        sqlite_journal_mode=journal_mode,
+        database_pool_size=readers + 1,
+    )
+    db = Repository(create_database_engine(settings))
+    seed(db, users)
+    stop = threading.Event()
+    latencies: list[list[float]] = [[] for _ in range(readers)]
+    threads = [
+        threading.Thread(target=read_loop, args=(db, users, stop, result))
+        for result in latencies
+    ]
+    writer_result: list[int] = []
+    threads.append(
+        threading.Thread(
+            target=lambda: writer_result.append(write_loop(db, stop))
+        )
+    )
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    db.engine.dispose()
+    reads = [latency for result in latencies for latency in result]
+    print_summary(f"reads, journal_mode={journal_mode}", summarize(reads))
+    print(f"{'':<32} {writer_result[0]} write transactions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+    for journal_mode in JOURNAL_MODES:
+        run(journal_mode, args.users, args.readers, args.seconds)
@@ -0,0 +1,118 @@
+"""
+Startup time and first-request latency with and without warm-up.
+
+Every run is a fresh interpreter on the same database, so imports
+and lazily built objects are cold. A run reports the import time of
+shift_fastapi_service.main, the lifespan startup time and latencies
+of the first /token and /user/me requests and of a second /user/me.
+
+Run:
+    python -m benchmarks.startup [--runs 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.utils import TEST_PASSWORD, TEST_USERNAME
+
+MODES: dict[str, dict[str, str]] = {
+    "lazy": {"STARTUP_WARM_UP": "false"},
+    "warm-up": {"STARTUP_WARM_UP": "true"},
+}
+
+
+async def measure(setup: bool) -> dict[str, float]:
+    start = time.perf_counter()
+    from shift_fastapi_service.main import app
+
+    timings = {"import": time.perf_counter() - start}
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["startup"] = time.perf_counter() - start
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            if setup:
+                await client.get("/load_data")
+                return timings
+            start = time.perf_counter()
+            response = await client.post(
+                "/token",
+                data={"username": TEST_USERNAME, "password": TEST_PASSWORD},
+            )
+            timings["first /token"] = time.perf_counter() - start
+            response.raise_for_status()
+            headers = {
+                "Authorization": f"Bearer {response.json()['access_token']}"
+            }
+            for name in ("first /user/me", "second /user/me"):
+                start = time.perf_counter()
+                response = await client.get("/user/me", headers=headers)
+                timings[name] = time.perf_counter() - start
+                response.raise_for_status()
+    return timings
+
+
+def run_child(
+    workdir: Path, environ: dict[str, str], setup: bool = False
+) -> dict[str, float]:
+    args = [sys.executable, "-m", "benchmarks.startup", "--child"]
+    if setup:
+        args.append("--setup")
+    output = subprocess.run(
+        args,
+        cwd=Path(__file__).parent.parent,
+        env=os.environ
+        | environ
+        | {
+            "DATABASE_URL": f"sqlite+pysqlite:///{workdir / 'bench.db'}",
+            "BCRYPT_CALIBRATION_FILE": str(workdir / "bcrypt.json"),
+            "CREATE_SCHEMA_ON_STARTUP": "true",
+            "LOGIN_THROTTLE_ENABLED": "false",
+        },
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main(runs: int) -> None:
+    workdir = Path(tempfile.mkdtemp(prefix="startup_"))
+    os.environ.setdefault("SECRET_KEY", os.urandom(32).hex())
+    os.environ.setdefault("BCRYPT_TARGET_SECONDS", "0.05")
+    run_child(workdir, {}, setup=True)
+    for name, environ in MODES.items():
+        results = [run_child(workdir, environ) for _ in range(runs)]
+        medians = {
+            key: statistics.median(result[key] for result in results)
+            for key in results[0]
+        }
+        print(
+            f"{name:<10} "
+            + " ".join(f"{k}={v * 1000:.1f}ms" for k, v in medians.items())
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true")
+    parser.add_argument("--setup", action="store_true")
+    args = parser.parse_args()
+    if args.child:
+        os.chdir(Path(os.environ["DATABASE_URL"].split("///")[1]).parent)
+        print(json.dumps(asyncio.run(measure(args.setup))))
+    else:
+        main(args.runs)
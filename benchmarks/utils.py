@@ -0,0 +1,108 @@
+import os
+import secrets
+import statistics
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator
+
+import httpx
+from fastapi import FastAPI
+
+TEST_USERNAME = "alice"
+TEST_PASSWORD = "alice12345"
+
+
+def percentile(values: list[float], rank: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * rank))]
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    """
+    Summarize latencies measured in seconds.
+
+    Args:
+        latencies (list[float]): Latencies in seconds
+
+    Returns:
+        dict[str, float]: Count and mean/p50/p95/p99 in milliseconds
+    """
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def print_summary(name: str, summary: dict[str, float]) -> None:
+    print(
+        f"{name:<32} n={summary['count']:<6} "
+        f"mean={summary['mean_ms']:8.3f}ms "
+        f"p50={summary['p50_ms']:8.3f}ms "
+        f"p95={summary['p95_ms']:8.3f}ms "
+        f"p99={summary['p99_ms']:8.3f}ms"
+    )
+
+
+def load_app(workdir: Path, environ: dict[str, str] | None = None) -> FastAPI:
+    """
+    Import the service app with a fresh database in workdir.
+
+    Must be called before anything from shift_fastapi_service is imported.
+
+    Args:
+        workdir (Path): Directory for the database and logs
+        environ (dict[str, str] | None): Settings to override
+
+    Returns:
+        FastAPI: Service app
+    """
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ["DATABASE_URL"] = f"sqlite+pysqlite:///{workdir / 'bench.db'}"
+    os.environ.update(environ or {})
+    from shift_fastapi_service.main import app
+
+    return app
+
+
+@asynccontextmanager
+async def open_client(app: FastAPI) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Run app lifespan and open an in-process client of app.
+
+    Args:
+        app (FastAPI): Service app
+
+    Yields:
+        httpx.AsyncClient: Client sending requests over ASGI transport
+    """
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            yield client
+
+
+async def prepare_client(client: httpx.AsyncClient) -> dict[str, str]:
+    """
+    Create schema and test user, log the test user in.
+
+    Args:
+        client (httpx.AsyncClient): Client of the service app
+
+    Returns:
+        dict[str, str]: Authorization header of the test user
+    """
+    await client.get("/create_schema")
+    await client.get("/load_data")
+    response = await client.post(
+        "/token", data={"username": TEST_USERNAME, "password": TEST_PASSWORD}
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
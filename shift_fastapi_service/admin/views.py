@@ -0,0 +1,229 @@
+import logging
+from datetime import date
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import TypeAdapter, ValidationError
+
+from shift_fastapi_service.auth.auth import get_current_admin_user
+from shift_fastapi_service.domain import (
+    BatchUpdateReport,
+    Page,
+    User,
+    UserFilter,
+    UserNextPromotionDate,
+    UserSalary,
+    UserUpdate,
+)
+from shift_fastapi_service.repository import (
+    USER_FIELDS,
+    get_page_order,
+    get_repository,
+)
+from shift_fastapi_service.responses import FastJSONResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+AdminUser = Annotated[User, Depends(get_current_admin_user)]
+PageSize = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)]
+
+# Types of columns pages can be ordered by
+CURSOR_TYPES: dict[str, TypeAdapter[Any]] = {
+    "id": TypeAdapter(int),
+    "salary": TypeAdapter(int),
+    "next_promotion_date": TypeAdapter(date),
+}
+
+
+def encode_cursor(row: dict, order: tuple[str, ...]) -> str:
+    # e.g. "42" by id, "50000,42" by salary, "2030-01-01,42" by date
+    return ",".join(str(row[name]) for name in order)
+
+
+def decode_cursor(cursor: str, order: tuple[str, ...]) -> tuple:
+    """
+    Parse a cursor made by encode_cursor with the same order.
+
+    Args:
+        cursor (str): next_cursor of previous page
+        order (tuple[str, ...]): Columns of get_page_order
+
+    Raises:
+        HTTPException: Raises if the cursor doesn't match order,
+            e.g. the filter changed between pages
+
+    Returns:
+        tuple: Values of order columns
+    """
+    values = cursor.split(",")
+    try:
+        if len(values) != len(order):
+            raise ValueError(f"expected {len(order)} values")
+        return tuple(
+            CURSOR_TYPES[name].validate_python(value)
+            for name, value in zip(order, values)
+        )
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"invalid cursor {cursor}",
+        ) from e
+
+
+async def get_page(
+    fields: tuple[str, ...],
+    user_filter: UserFilter,
+    after: str | None,
+    limit: int,
+) -> tuple[list[dict], str | None]:
+    """
+    Get a page of users and the cursor of the next page.
+
+    Pages with a salary or promotion date range are ordered
+    by that column and id, other pages by id, the cursor holds
+    the values of the order columns of the last user.
+
+    Args:
+        fields (tuple[str, ...]): Names of fields from USER_FIELDS
+        user_filter (UserFilter): Salary and promotion date ranges
+        after (str | None): next_cursor of previous page
+        limit (int): Maximum number of users in page
+
+    Returns:
+        tuple[list[dict], str | None]: Users and cursor of next page,
+            None on the last page
+    """
+    order = get_page_order(user_filter)
+    keyset = None if after is None else decode_cursor(after, order)
+    db = get_repository()
+    rows = await db.list_users(fields, user_filter, keyset, limit)
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1], order)
+    return rows, next_cursor
+
+
+@router.get("/admin/users", response_model=Page[User])
+async def list_users(
+    admin: AdminUser,
+    user_filter: Annotated[UserFilter, Depends()],
+    after: str | None = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
+) -> Response:
+    """
+    Admin view to list users page by page.
+
+    Args:
+        admin (AdminUser): Credentials of admin user
+        user_filter (UserFilter): Salary and promotion date ranges
+        after (str | None): next_cursor of previous page
+        limit (PageSize): Maximum number of users in page
+
+    Returns:
+        Response: Page[User] with users and cursor of next page
+    """
+    rows, next_cursor = await get_page(USER_FIELDS, user_filter, after, limit)
+    # rows come from the database, validation is not needed
+    return FastJSONResponse(
+        Page[User].model_construct(
+            items=[User.model_construct(**row) for row in rows],
+            next_cursor=next_cursor,
+        )
+    )
+
+
+@router.get("/admin/salaries", response_model=Page[UserSalary])
+async def list_salaries(
+    admin: AdminUser,
+    user_filter: Annotated[UserFilter, Depends()],
+    after: str | None = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
+) -> Response:
+    """
+    Admin view to list salaries of users page by page.
+
+    Args:
+        admin (AdminUser): Credentials of admin user
+        user_filter (UserFilter): Salary and promotion date ranges
+        after (str | None): next_cursor of previous page
+        limit (PageSize): Maximum number of users in page
+
+    Returns:
+        Response: Page[UserSalary] with salaries and cursor of next page
+    """
+    rows, next_cursor = await get_page(
+        ("username", "salary"), user_filter, after, limit
+    )
+    return FastJSONResponse(
+        Page[UserSalary].model_construct(
+            items=[UserSalary.model_construct(**row) for row in rows],
+            next_cursor=next_cursor,
+        )
+    )
+
+
+@router.get("/admin/promotions", response_model=Page[UserNextPromotionDate])
+async def list_next_promotion_dates(
+    admin: AdminUser,
+    user_filter: Annotated[UserFilter, Depends()],
+    after: str | None = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
+) -> Response:
+    """
+    Admin view to list next promotion dates of users page by page.
+
+    Args:
+        admin (AdminUser): Credentials of admin user
+        user_filter (UserFilter): Salary and promotion date ranges
+        after (str | None): next_cursor of previous page
+        limit (PageSize): Maximum number of users in page
+
+    Returns:
+        Response: Page[UserNextPromotionDate] with next promotion dates
+            and cursor of next page
+    """
+    rows, next_cursor = await get_page(
+        ("username", "next_promotion_date"), user_filter, after, limit
+    )
+    return FastJSONResponse(
+        Page[UserNextPromotionDate].model_construct(
+            items=[
+                UserNextPromotionDate.model_construct(**row) for row in rows
+            ],
+            next_cursor=next_cursor,
+        )
+    )
+
+
+@router.post("/admin/users/batch_update", response_model=BatchUpdateReport)
+async def batch_update_users(
+    admin: AdminUser, updates: list[UserUpdate]
+) -> Response:
+    """
+    Admin view to update salaries and next promotion dates of many users.
+
+    All changes are applied in one transaction. A field left null
+    keeps its value.
+
+    Args:
+        admin (AdminUser): Credentials of admin user
+        updates (list[UserUpdate]): Changes of users
+
+    Returns:
+        Response: BatchUpdateReport with number of updated users
+            and result per change
+    """
+    db = get_repository()
+    results = await db.update_users(updates)
+    logger.info(f"admin {admin.username} updated {len(results)} users")
+    return FastJSONResponse(
+        BatchUpdateReport(
+            updated=sum(result.updated for result in results),
+            results=results,
+        )
+    )
@@ -1,3 +1,127 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 
-app = FastAPI()
+import shift_fastapi_service.admin.views as admin
+import shift_fastapi_service.auth.views as auth
+import shift_fastapi_service.views as views
+from shift_fastapi_service.auth.auth import get_key_set
+from shift_fastapi_service.auth.hashing import (
+    ensure_calibration,
+    get_pwd_context,
+    shutdown_hashing_pool,
+    warm_up_hashing_pool,
+)
+from shift_fastapi_service.config import Settings, get_settings, set_settings
+from shift_fastapi_service.database import (
+    ReadYourWritesMiddleware,
+    dispose_engines,
+    get_engine_router,
+    log_database_settings,
+    warm_up_connections,
+)
+from shift_fastapi_service.exceptions import HashingPoolBusyException
+from shift_fastapi_service.logs import init_logging, stop_logging
+from shift_fastapi_service.metrics import (
+    MetricsDirectory,
+    MetricsMiddleware,
+    get_metrics_directory,
+)
+from shift_fastapi_service.repository import get_repository
+from shift_fastapi_service.responses import FastJSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+async def start_up(settings: Settings) -> None:
+    """
+    Build what requests use, so that the first ones don't pay for it.
+
+    The engines, password policy and JWT keys are always built, which
+    also fails startup on invalid configuration. Replicas that don't
+    answer are marked down. With STARTUP_WARM_UP pooled connections
+    are opened, hashing pool workers are started and a token is signed.
+
+    Args:
+        settings (Settings): Service settings
+    """
+    router = get_engine_router()
+    engine = router.primary
+    if settings.create_schema_on_startup:
+        await get_repository().generate_schema()
+    await log_database_settings(engine)
+    await router.check_replicas()
+    await asyncio.to_thread(ensure_calibration)
+    get_pwd_context()
+    key_set = get_key_set()
+    if settings.startup_warm_up:
+        await warm_up_connections(engine)
+        for index in router.get_healthy_replicas():
+            await warm_up_connections(router.replicas[index])
+        await warm_up_hashing_pool()
+        key_set.decode(key_set.encode({"sub": ""}))
+
+
+async def write_metrics(directory: MetricsDirectory, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        directory.write()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    settings = get_settings()
+    init_logging(settings=settings)
+    start = time.perf_counter()
+    metrics_directory = get_metrics_directory()
+    metrics_writer = None
+    try:
+        await start_up(settings)
+        logger.info(f"started in {time.perf_counter() - start:.3f}s")
+        if metrics_directory is not None:
+            metrics_writer = asyncio.create_task(
+                write_metrics(
+                    metrics_directory, settings.metrics_flush_seconds
+                )
+            )
+        yield
+    finally:
+        if metrics_writer is not None:
+            metrics_writer.cancel()
+        if metrics_directory is not None:
+            # Final values, the supervisor retires them after exit
+            metrics_directory.write()
+        shutdown_hashing_pool()
+        await dispose_engines()
+        stop_logging()
+
+
+def create_app(settings: Settings | None = None) -> FastAPI:
+    """
+    Build the service app.
+
+    Nothing is connected or loaded until the app starts, see start_up.
+
+    Args:
+        settings (Settings | None): Settings to use instead of
+            environment variables
+
+    Returns:
+        FastAPI: Service app
+    """
+    if settings is not None:
+        set_settings(settings)
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+    app.add_middleware(ReadYourWritesMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.add_exception_handler(404, views.not_found_handler)
+    app.add_exception_handler(
+        HashingPoolBusyException, views.hashing_pool_busy_handler
+    )
+    for router in (views.router, auth.router, admin.router):
+        app.include_router(router)
+    return app
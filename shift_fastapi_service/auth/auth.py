@@ -1,55 +1,133 @@
+import hashlib
 import logging
-import os
+import secrets
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Literal
+from functools import cache
+from typing import Annotated, Any, Literal
 
-from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from jose import ExpiredSignatureError, JWTError
 
-from shift_fastapi_service.domain import TokenData, User, UserInDB
+from shift_fastapi_service.auth.hashing import (
+    get_hashing_pool,
+    get_password_hash,
+    password_needs_update,
+    verify_password,
+)
+from shift_fastapi_service.auth.keys import KeySet, load_key_set
+from shift_fastapi_service.cache import (
+    get_principal_cache,
+    get_token_cache,
+    get_version_loader,
+)
+from shift_fastapi_service.config import get_settings
+from shift_fastapi_service.domain import Principal, TokenData, User, UserInDB
 from shift_fastapi_service.exceptions import (
-    AuthConfigException,
     DataNotFoundException,
+    RefreshTokenReusedException,
+)
+from shift_fastapi_service.metrics import (
+    auth_jwt_failures_total,
+    auth_password_rehashes_total,
+    auth_password_verify_seconds,
+    auth_refresh_tokens_reused_total,
+    auth_stale_claims_total,
+    auth_tokens_issued_total,
+    auth_user_lookup_misses_total,
+)
+from shift_fastapi_service.repository import (
+    AsyncRepository,
+    get_repository,
 )
-from shift_fastapi_service.repository import Repository
 
-load_dotenv()
 logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-SECRET_KEY: str | None = os.environ.get("SECRET_KEY")
-ALGORITHM: str | None = os.environ.get("ALGORITHM")
 
-if not SECRET_KEY:
-    logger.error("secret key was not provided")
-    raise AuthConfigException("secret key was not provided")
+@cache
+def get_key_set() -> KeySet:
+    settings = get_settings()
+    secret_key = settings.secret_key
+    return load_key_set(
+        secret_key=secret_key.get_secret_value() if secret_key else None,
+        algorithm=settings.algorithm,
+        keys_dir=settings.jwt_keys_dir,
+        signing_kid=settings.jwt_signing_kid,
+    )
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    start = time.perf_counter()
+    try:
+        return await get_hashing_pool().run(
+            verify_password, plain_password, hashed_password
+        )
+    finally:
+        auth_password_verify_seconds.observe(time.perf_counter() - start)
 
-if not ALGORITHM:
-    logger.error("algorithm was not provided")
-    raise AuthConfigException("algorithm was not provided")
 
+async def get_password_hash_async(password) -> str:
+    return await get_hashing_pool().run(get_password_hash, password)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+async def get_user(db: AsyncRepository, username: str) -> UserInDB:
+    try:
+        user_dict: dict = await db.get_user_by_username(username)
+    except DataNotFoundException as e:
+        auth_user_lookup_misses_total.inc()
+        logger.info(
+            f"user with username {username} was not found",
+            exc_info=True,
+        )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        ) from e
+    return UserInDB(**user_dict)
+
 
+async def load_principal(db: AsyncRepository, username: str) -> Principal:
+    # Principal slots are column names of User in constructor order
+    row = await db.get_user_columns(username, Principal.__slots__)
+    return Principal(*row)
 
-def verify_password(plain_password, hashed_password) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
 
+async def get_principal(db: AsyncRepository, username: str) -> Principal:
+    """
+    Get user from the principal cache, load it from db on a miss.
 
-def get_password_hash(password) -> str:
-    return pwd_context.hash(password)
+    With PRINCIPAL_CACHE_CHECK_VERSION a cached user is compared with
+    the version of the row, so writes by other server workers, which
+    don't invalidate this cache, are seen. A stale user is reloaded.
 
+    Args:
+        db (AsyncRepository): Repository to load user from
+        username (str): Username
 
-def get_user(db: Repository, username: str) -> UserInDB:
+    Raises:
+        HTTPException: HTTP Exception with status HTTP_404_NOT_FOUND
+
+    Returns:
+        Principal: Cached user
+    """
+    principal_cache = get_principal_cache()
     try:
-        user_dict: dict = db.get_user_by_username(username)
+        if get_settings().principal_cache_check_version:
+            cached = principal_cache.get(username)
+            if cached is not None:
+                version = await get_version_loader().get_or_load(
+                    username, lambda: load_version(db, username)
+                )
+                if version == cached.version:
+                    return cached
+                principal_cache.invalidate(username)
+        return await principal_cache.get_or_load(
+            username, lambda: load_principal(db, username)
+        )
     except DataNotFoundException as e:
+        auth_user_lookup_misses_total.inc()
         logger.info(
             f"user with username {username} was not found",
             exc_info=True,
@@ -57,20 +135,110 @@ def get_user(db: Repository, username: str) -> UserInDB:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         ) from e
-    return UserInDB(**user_dict)
 
 
-def authenticate_user(
-    db: Repository, username: str, password: str
+async def authenticate_user(
+    db: AsyncRepository, username: str, password: str
 ) -> UserInDB | Literal[False]:
-    user: UserInDB = get_user(db, username)
+    user: UserInDB = await get_user(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
+    if password_needs_update(user.hashed_password):
+        await rehash_password(db, username, password)
     return user
 
 
+async def rehash_password(
+    db: AsyncRepository, username: str, password: str
+) -> None:
+    """
+    Store a hash of the current bcrypt cost for a verified password.
+
+    Failures are logged, the login goes on with the old hash.
+
+    Args:
+        db (AsyncRepository): Repository to store hash in
+        username (str): Username
+        password (str): Verified plain password
+    """
+    try:
+        hashed_password = await get_password_hash_async(password)
+        await db.update_password_hash(username, hashed_password)
+    except Exception:
+        logger.warning(f"can't rehash password of {username}", exc_info=True)
+        return
+    auth_password_rehashes_total.inc()
+    logger.info(f"password of {username} rehashed")
+
+
+async def get_user_claims(db: AsyncRepository, username: str) -> dict:
+    """
+    Get user fields to embed into an access token.
+
+    Fields and version are read in one statement, so the version
+    matches the values.
+
+    Args:
+        db (AsyncRepository): Repository to read user from
+        username (str): Username
+
+    Returns:
+        dict: Claims without "sub"
+    """
+    row = await db.get_user_columns(username, Principal.__slots__)
+    return Principal(*row).to_claims()
+
+
+async def load_version(db: AsyncRepository, username: str) -> int:
+    (version,) = await db.get_user_columns(username, ("version",))
+    return version
+
+
+async def get_claims_principal(
+    db: AsyncRepository, claims: dict, strict: bool
+) -> Principal:
+    """
+    Get user from claims of an access token.
+
+    In strict mode the version in the claims is compared with the
+    version of the row, stale claims are replaced by the row.
+    Concurrent requests of a user share one version lookup.
+
+    Args:
+        db (AsyncRepository): Repository to check version in
+        claims (dict): Verified claims with user fields
+        strict (bool): Whether to check the version
+
+    Raises:
+        HTTPException: HTTP Exception with status HTTP_404_NOT_FOUND
+
+    Returns:
+        Principal: User from claims, or from database if claims are stale
+    """
+    principal = Principal.from_claims(claims)
+    if not strict:
+        return principal
+    username = principal.username
+    try:
+        version = await get_version_loader().get_or_load(
+            username, lambda: load_version(db, username)
+        )
+    except DataNotFoundException as e:
+        auth_user_lookup_misses_total.inc()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        ) from e
+    if version == principal.version:
+        return principal
+    auth_stale_claims_total.inc()
+    cached = get_principal_cache().get(username)
+    if cached is not None and cached.version != version:
+        get_principal_cache().invalidate(username)
+    return await get_principal(db, username)
+
+
 def create_access_token(
     data: dict, expires_delta: timedelta | None = None
 ) -> str:
@@ -80,37 +248,155 @@ def create_access_token(
     else:
         expire = datetime.now(tz=timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, key=SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = get_key_set().encode(to_encode)
+    auth_tokens_issued_total.inc()
     return encoded_jwt
 
 
-async def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)]
-) -> UserInDB:
+def hash_refresh_token(token: str) -> str:
+    # Tokens are random, a fast digest is enough to not store them as is
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_refresh_token_times() -> tuple[datetime, datetime]:
+    # SQLite stores naive datetimes, these are in UTC
+    now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    expires_at = now + timedelta(seconds=get_settings().refresh_token_ttl)
+    return now, expires_at
+
+
+async def create_refresh_token(db: AsyncRepository, username: str) -> str:
+    """
+    Issue an opaque refresh token starting a new family.
+
+    Args:
+        db (AsyncRepository): Repository to store token in
+        username (str): Username of the owner
+
+    Returns:
+        str: Refresh token
+    """
+    token = secrets.token_urlsafe(32)
+    now, expires_at = get_refresh_token_times()
+    await db.create_refresh_token(
+        token_hash=hash_refresh_token(token),
+        family_id=secrets.token_hex(16),
+        username=username,
+        expires_at=expires_at,
+        now=now,
+    )
+    return token
+
+
+async def rotate_refresh_token(
+    db: AsyncRepository, token: str
+) -> tuple[str, str]:
+    """
+    Exchange a refresh token for a new one of the same family.
+
+    Args:
+        db (AsyncRepository): Repository tokens are stored in
+        token (str): Refresh token
+
+    Raises:
+        HTTPException: HTTP Exception with status HTTP_401_UNAUTHORIZED
+
+    Returns:
+        tuple[str, str]: Username of the owner and new refresh token
+    """
+    new_token = secrets.token_urlsafe(32)
+    now, expires_at = get_refresh_token_times()
+    try:
+        username = await db.rotate_refresh_token(
+            token_hash=hash_refresh_token(token),
+            new_token_hash=hash_refresh_token(new_token),
+            expires_at=expires_at,
+            now=now,
+        )
+    except (DataNotFoundException, RefreshTokenReusedException) as e:
+        if isinstance(e, RefreshTokenReusedException):
+            auth_refresh_tokens_reused_total.inc()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        ) from e
+    return username, new_token
+
+
+def decode_access_token(token: str) -> dict[str, Any]:
+    """
+    Verify token and get its claims.
+
+    Verified claims are cached by token digest until the token expires,
+    so the signature of a token is checked once per cache entry.
+
+    Args:
+        token (str): Encoded JWT
+
+    Raises:
+        JWTError: Raises if token is invalid or expired
+
+    Returns:
+        dict[str, Any]: Token claims
+    """
+    if not get_settings().token_cache_enabled:
+        return get_key_set().decode(token)
+    token_cache = get_token_cache()
+    token_digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(token_digest)
+    if payload is not None:
+        if payload["exp"] <= time.time():
+            token_cache.invalidate(token_digest)
+            raise ExpiredSignatureError("Signature has expired.")
+        return payload
+    payload = get_key_set().decode(token)
+    expire = payload.get("exp")
+    if isinstance(expire, (int, float)):
+        token_cache.set(
+            token_digest,
+            payload,
+            expires_at=token_cache.clock() + expire - time.time(),
+        )
+    return payload
+
+
+async def get_current_principal(
+    token: Annotated[str, Depends(oauth2_scheme)],
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload: dict[str, str] = jwt.decode(
-            token=token, key=SECRET_KEY, algorithms=[ALGORITHM]
-        )
+        payload: dict[str, Any] = decode_access_token(token)
         username: str | None = payload.get("sub")
         if username is None:
+            auth_jwt_failures_total.inc("no_subject")
             raise credentials_exception
         token_data = TokenData(username=username)
-    except JWTError:
+    except ExpiredSignatureError:
+        auth_jwt_failures_total.inc("expired")
         raise credentials_exception
-    user: UserInDB | None = None
-    if token_data.username:
-        db = Repository()
-        user = get_user(db=db, username=token_data.username)
-    else:
+    except JWTError:
+        auth_jwt_failures_total.inc("invalid")
         raise credentials_exception
-    if user is None:
+    if not token_data.username:
         raise credentials_exception
-    return user
+    db = get_repository()
+    claims_mode = get_settings().token_claims_mode
+    if claims_mode != "off" and "ver" in payload:
+        return await get_claims_principal(
+            db, payload, strict=claims_mode == "strict"
+        )
+    return await get_principal(db=db, username=token_data.username)
+
+
+async def get_current_user(
+    principal: Annotated[Principal, Depends(get_current_principal)],
+) -> UserInDB:
+    return principal.to_user_in_db()
 
 
 async def get_current_active_user(
@@ -119,3 +405,22 @@ async def get_current_active_user(
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def get_current_active_principal(
+    principal: Annotated[Principal, Depends(get_current_principal)],
+) -> Principal:
+    if principal.disabled:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
+
+async def get_current_admin_user(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+) -> User:
+    if current_user.username not in get_settings().get_admin_usernames():
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return current_user
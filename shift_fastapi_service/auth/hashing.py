@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from datetime import datetime, timezone
+from functools import cache
+from pathlib import Path
+from typing import Any, Callable, Literal, TypeVar
+
+from passlib.context import CryptContext
+
+from shift_fastapi_service.config import get_settings
+from shift_fastapi_service.exceptions import HashingPoolBusyException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# passlib default
+DEFAULT_BCRYPT_ROUNDS = 12
+MIN_BCRYPT_ROUNDS = 4
+MAX_BCRYPT_ROUNDS = 16
+# Calibration never goes below this cost, however slow the host is
+MIN_CALIBRATED_BCRYPT_ROUNDS = 10
+CALIBRATION_PASSWORD = "calibration password"
+
+
+def create_pwd_context(rounds: int) -> CryptContext:
+    # Weaker hashes need update, stronger ones are kept as they are.
+    # bcrypt__rounds would set the max as well, default_rounds doesn't
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+
+def time_bcrypt(rounds: int, repeat: int = 3) -> float:
+    """
+    Measure verification time of a bcrypt hash of rounds.
+
+    Args:
+        rounds (int): bcrypt cost
+        repeat (int): Number of measurements, the fastest is taken
+
+    Returns:
+        float: Seconds per verification
+    """
+    context = create_pwd_context(rounds)
+    hashed_password = context.hash(CALIBRATION_PASSWORD)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        context.verify(CALIBRATION_PASSWORD, hashed_password)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def calibrate_bcrypt_rounds(
+    target_seconds: float, min_rounds: int = MIN_CALIBRATED_BCRYPT_ROUNDS
+) -> tuple[int, float]:
+    """
+    Find the highest bcrypt cost verified within target_seconds.
+
+    Every extra round doubles the time, so costs are measured upwards
+    from min_rounds until one is over the target, that costs about
+    2 * target_seconds.
+
+    Args:
+        target_seconds (float): Target verification time
+        min_rounds (int): Lowest cost to return, a security floor
+
+    Returns:
+        tuple[int, float]: bcrypt cost and its verification time,
+            min_rounds if even that is over the target
+    """
+    rounds = min_rounds
+    seconds = time_bcrypt(rounds)
+    if seconds > target_seconds:
+        logger.error(
+            f"bcrypt with {rounds} rounds takes {seconds * 1000:.1f}ms, "
+            f"over the target of {target_seconds * 1000:.1f}ms, "
+            f"not going below {rounds} rounds"
+        )
+    while rounds < MAX_BCRYPT_ROUNDS:
+        next_seconds = time_bcrypt(rounds + 1)
+        if next_seconds > target_seconds:
+            break
+        rounds, seconds = rounds + 1, next_seconds
+    return rounds, seconds
+
+
+def save_calibration(path: Path, rounds: int, seconds: float) -> None:
+    calibration = {
+        "rounds": rounds,
+        "verify_seconds": seconds,
+        "calibrated_at": datetime.now(tz=timezone.utc).isoformat(),
+    }
+    path.write_text(json.dumps(calibration, indent=2))
+    logger.info(
+        f"bcrypt calibrated to {rounds} rounds, "
+        f"{seconds * 1000:.1f}ms per verification, saved to {path}"
+    )
+
+
+def load_calibrated_rounds(path: Path) -> int | None:
+    """
+    Read bcrypt cost saved by save_calibration.
+
+    Args:
+        path (Path): Calibration file
+
+    Returns:
+        int | None: bcrypt cost, None if file is missing or invalid
+    """
+    try:
+        rounds = json.loads(path.read_text())["rounds"]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.error(f"bcrypt calibration {path} is not valid", exc_info=True)
+        return None
+    if not isinstance(rounds, int) or not (
+        MIN_CALIBRATED_BCRYPT_ROUNDS <= rounds <= MAX_BCRYPT_ROUNDS
+    ):
+        logger.error(f"bcrypt calibration {path} has invalid rounds {rounds}")
+        return None
+    return rounds
+
+
+def get_bcrypt_rounds() -> int:
+    """
+    Get bcrypt cost of the password policy.
+
+    BCRYPT_ROUNDS wins over the calibration file, passlib default
+    is used if neither is set.
+
+    Returns:
+        int: bcrypt cost
+    """
+    settings = get_settings()
+    if settings.bcrypt_rounds is not None:
+        if settings.bcrypt_rounds < MIN_CALIBRATED_BCRYPT_ROUNDS:
+            logger.warning(
+                f"BCRYPT_ROUNDS {settings.bcrypt_rounds} is below "
+                f"{MIN_CALIBRATED_BCRYPT_ROUNDS}, use it for tests only"
+            )
+        return settings.bcrypt_rounds
+    rounds = load_calibrated_rounds(Path(settings.bcrypt_calibration_file))
+    return DEFAULT_BCRYPT_ROUNDS if rounds is None else rounds
+
+
+def ensure_calibration() -> None:
+    """
+    Calibrate bcrypt if enabled by settings and not done before.
+
+    Takes about twice BCRYPT_TARGET_SECONDS.
+    """
+    settings = get_settings()
+    path = Path(settings.bcrypt_calibration_file)
+    if (
+        not settings.bcrypt_calibrate_on_startup
+        or settings.bcrypt_rounds is not None
+        or load_calibrated_rounds(path) is not None
+    ):
+        return
+    rounds, seconds = calibrate_bcrypt_rounds(settings.bcrypt_target_seconds)
+    save_calibration(path, rounds, seconds)
+    get_pwd_context.cache_clear()
+
+
+@cache
+def get_pwd_context() -> CryptContext:
+    rounds = get_bcrypt_rounds()
+    logger.info(f"passwords are hashed with {rounds} bcrypt rounds")
+    return create_pwd_context(rounds)
+
+
+def verify_password(plain_password, hashed_password) -> bool:
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def get_password_hash(password) -> str:
+    return get_pwd_context().hash(password)
+
+
+def password_needs_update(hashed_password: str) -> bool:
+    return get_pwd_context().needs_update(hashed_password)
+
+
+class HashingPool:
+    """
+    Bounded worker pool for password hashing.
+
+    bcrypt releases the GIL, so a thread pool is enough to keep hashing
+    off the event loop, a process pool can be used instead.
+    At most workers + queue_size calls are accepted at once,
+    further calls fail fast with HashingPoolBusyException. A call holds
+    its slot until the job is done, even if the caller was cancelled.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        executor: Literal["thread", "process"] = "thread",
+    ) -> None:
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.pending = 0
+        # Slots are released by the executor, from its threads
+        self.lock = threading.Lock()
+        self.executor: Executor
+        if executor == "process":
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="hashing"
+            )
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Run func in the pool and wait for the result.
+
+        Raises:
+            HashingPoolBusyException: Raises if the pool queue is full
+
+        Returns:
+            T: Result of func
+        """
+        with self.lock:
+            if self.pending >= self.capacity:
+                logger.warning(f"hashing pool is full, {self.pending} pending")
+                raise HashingPoolBusyException
+            self.pending += 1
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(self.release)
+        return await asyncio.wrap_future(future)
+
+    def release(self, future: Future | None = None) -> None:
+        with self.lock:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+@cache
+def get_hashing_pool() -> HashingPool:
+    settings = get_settings()
+    return HashingPool(
+        workers=settings.password_hash_workers,
+        queue_size=settings.password_hash_queue_size,
+        executor=settings.password_hash_executor,
+    )
+
+
+def warm_up_worker() -> None:
+    # Loads the password policy and bcrypt backend of a pool worker
+    get_pwd_context()
+    create_pwd_context(MIN_BCRYPT_ROUNDS).hash(CALIBRATION_PASSWORD)
+
+
+async def warm_up_hashing_pool() -> None:
+    pool = get_hashing_pool()
+    await asyncio.gather(
+        *(pool.run(warm_up_worker) for _ in range(pool.workers))
+    )
+
+
+def shutdown_hashing_pool() -> None:
+    if get_hashing_pool.cache_info().currsize:
+        get_hashing_pool().shutdown()
+        get_hashing_pool.cache_clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calibrate bcrypt cost to a target verification time."
+    )
+    parser.add_argument(
+        "--target-seconds",
+        type=float,
+        default=get_settings().bcrypt_target_seconds,
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path(get_settings().bcrypt_calibration_file),
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    save_calibration(
+        args.output, *calibrate_bcrypt_rounds(args.target_seconds)
+    )
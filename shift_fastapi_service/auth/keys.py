@@ -0,0 +1,196 @@
+import logging
+from pathlib import Path
+from typing import Any
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+
+from shift_fastapi_service.exceptions import AuthConfigException
+
+logger = logging.getLogger(__name__)
+
+EC_ALGORITHMS: dict[str, str] = {
+    "secp256r1": "ES256",
+    "secp384r1": "ES384",
+    "secp521r1": "ES512",
+}
+
+
+class KeySet:
+    """
+    Keys that sign and verify access tokens.
+
+    Asymmetric keys are identified by kid, which is put into the header
+    of tokens they sign. Tokens without kid are verified with the secret
+    key. Keys are constructed once, so signing and verification don't
+    parse PEM or key material per token.
+    """
+
+    def __init__(
+        self,
+        signing_kid: str | None,
+        signing_key: tuple[str, Key],
+        keys: dict[str | None, tuple[str, Key]],
+        public_keys: dict[str, tuple[str, Key]],
+    ) -> None:
+        self.signing_kid = signing_kid
+        self.signing_algorithm, self.signing_key = signing_key
+        self.keys = keys
+        self.public_keys = public_keys
+
+    def encode(self, claims: dict[str, Any]) -> str:
+        headers = None
+        if self.signing_kid is not None:
+            headers = {"kid": self.signing_kid}
+        return jwt.encode(
+            claims,
+            key=self.signing_key,
+            algorithm=self.signing_algorithm,
+            headers=headers,
+        )
+
+    def decode(self, token: str) -> dict[str, Any]:
+        """
+        Verify token with the key of its kid and get its claims.
+
+        Args:
+            token (str): Encoded JWT
+
+        Raises:
+            JWTError: Raises if token is invalid, expired or signed
+                with an unknown key
+
+        Returns:
+            dict[str, Any]: Token claims
+        """
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid not in self.keys:
+            raise JWTError(f"Unknown key id {kid}")
+        algorithm, key = self.keys[kid]
+        return jwt.decode(token=token, key=key, algorithms=[algorithm])
+
+    def get_jwks(self) -> dict[str, list[dict[str, Any]]]:
+        """
+        Get public keys as JWK Set, RFC 7517.
+
+        Returns:
+            dict[str, list[dict[str, Any]]]: JWK Set
+        """
+        return {
+            "keys": [
+                key.to_dict() | {"kid": kid, "alg": algorithm, "use": "sig"}
+                for kid, (algorithm, key) in self.public_keys.items()
+            ]
+        }
+
+
+def get_key_algorithm(public_key: Any, path: Path) -> str:
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        algorithm = EC_ALGORITHMS.get(public_key.curve.name)
+        if algorithm is not None:
+            return algorithm
+        message = f"curve {public_key.curve.name} of {path} is not supported"
+    elif isinstance(public_key, rsa.RSAPublicKey):
+        return "RS256"
+    elif isinstance(public_key, ed25519.Ed25519PublicKey):
+        message = f"EdDSA key {path} is not supported by python-jose"
+    else:
+        message = f"key {path} is not supported"
+    logger.error(message)
+    raise AuthConfigException(message)
+
+
+def load_key(path: Path) -> tuple[str, Key, Key | None]:
+    """
+    Load a PEM key, private or public.
+
+    Args:
+        path (Path): PEM file
+
+    Raises:
+        AuthConfigException: Raises if key can't be read or its type
+            isn't supported
+
+    Returns:
+        tuple[str, Key, Key | None]: Algorithm, public key
+            and private key if the file has one
+    """
+    pem = path.read_bytes()
+    try:
+        if b"PRIVATE KEY" in pem:
+            private_key = serialization.load_pem_private_key(pem, None)
+            public_key = private_key.public_key()
+        else:
+            private_key = None
+            public_key = serialization.load_pem_public_key(pem)
+    except (TypeError, ValueError) as e:
+        logger.error(f"can't load key {path}", exc_info=True)
+        raise AuthConfigException(f"can't load key {path}") from e
+    algorithm = get_key_algorithm(public_key, path)
+    public_pem = public_key.public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return (
+        algorithm,
+        jwk.construct(public_pem, algorithm),
+        None if private_key is None else jwk.construct(pem, algorithm),
+    )
+
+
+def load_key_set(
+    secret_key: str | None,
+    algorithm: str | None,
+    keys_dir: str | None,
+    signing_kid: str | None,
+) -> KeySet:
+    """
+    Build key set from the secret key and PEM files of keys_dir.
+
+    Every <kid>.pem file of keys_dir is a verification key published
+    in JWKS. signing_kid selects the private key that signs tokens,
+    without it tokens are signed with the secret key.
+    Rotation: add the new key, switch signing_kid to it once JWKS
+    caches have picked it up, remove the old key once its tokens expire.
+
+    Args:
+        secret_key (str | None): Key of HS algorithms
+        algorithm (str | None): Algorithm of the secret key
+        keys_dir (str | None): Directory of PEM files
+        signing_kid (str | None): kid of the signing key
+
+    Raises:
+        AuthConfigException: Raises if there's no signing key
+
+    Returns:
+        KeySet: Key set
+    """
+    keys: dict[str | None, tuple[str, Key]] = {}
+    public_keys: dict[str, tuple[str, Key]] = {}
+    if secret_key and algorithm:
+        keys[None] = (algorithm, jwk.construct(secret_key, algorithm))
+    private_keys: dict[str | None, tuple[str, Key]] = {}
+    if None in keys:
+        private_keys[None] = keys[None]
+    for path in sorted(Path(keys_dir).glob("*.pem")) if keys_dir else ():
+        kid = path.stem
+        key_algorithm, public_key, private_key = load_key(path)
+        keys[kid] = public_keys[kid] = (key_algorithm, public_key)
+        if private_key is not None:
+            private_keys[kid] = (key_algorithm, private_key)
+    signing_kid = signing_kid or None
+    if signing_kid not in private_keys:
+        message = (
+            f"no private key with kid {signing_kid} in {keys_dir}"
+            if signing_kid
+            else "neither secret key nor signing key was provided"
+        )
+        logger.error(message)
+        raise AuthConfigException(message)
+    logger.info(
+        f"tokens are signed with key {signing_kid or 'SECRET_KEY'}, "
+        f"verified with {len(keys)} keys"
+    )
+    return KeySet(signing_kid, private_keys[signing_kid], keys, public_keys)
@@ -0,0 +1,224 @@
+import time
+from collections import OrderedDict
+from functools import cache
+from typing import Callable, Hashable
+
+from starlette.requests import Request
+
+from shift_fastapi_service.config import get_settings
+from shift_fastapi_service.metrics import auth_logins_throttled_total
+from shift_fastapi_service.repository import AsyncRepository, get_repository
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets by key, refilled at rate tokens per second up to burst.
+
+    A bucket is a (tokens, updated_at) tuple. Buckets are kept in
+    least recently used order, idle buckets that have refilled
+    are dropped since they are the same as missing ones, and the least
+    recently used bucket is dropped above max_keys.
+    Used from the event loop thread only, so there's no lock.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_keys: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.idle_time = burst / rate
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: Hashable) -> float:
+        """
+        Take a token from the bucket of key.
+
+        Args:
+            key (Hashable): Bucket key, e.g. client address
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until
+                the bucket has a token
+        """
+        now = self.clock()
+        self._evict_idle(now)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = float(self.burst)
+        else:
+            tokens, updated_at = bucket
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def _evict_idle(self, now: float) -> None:
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < self.idle_time:
+                return
+            del self._buckets[key]
+
+
+class DatabaseTokenBucketLimiter:
+    """
+    Token buckets of TokenBucketLimiter kept in the database.
+
+    Buckets are shared by server workers, so a client gets the same
+    limit from any number of them. Times are wall clock times, which
+    workers agree on. Idle buckets are deleted every idle_time seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        get_db: Callable[[], AsyncRepository] = get_repository,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.get_db = get_db
+        self.clock = clock
+        self.idle_time = burst / rate
+        self._deleted_at = clock()
+
+    async def acquire(self, key: str) -> float:
+        """
+        Take a token from the bucket of key.
+
+        Args:
+            key (str): Bucket key, e.g. client address
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until
+                the bucket has a token
+        """
+        db = self.get_db()
+        now = self.clock()
+        if now - self._deleted_at >= self.idle_time:
+            self._deleted_at = now
+            await db.delete_idle_login_buckets(self.name, now - self.idle_time)
+        return await db.take_login_token(
+            self.name, key, self.rate, self.burst, now
+        )
+
+
+Limiter = TokenBucketLimiter | DatabaseTokenBucketLimiter
+
+
+async def acquire(limiter: Limiter, key: str) -> float:
+    if isinstance(limiter, TokenBucketLimiter):
+        return limiter.acquire(key)
+    return await limiter.acquire(key)
+
+
+class LoginThrottle:
+    """
+    Limits of login attempts by client address and by username.
+    """
+
+    def __init__(self, by_client: Limiter, by_username: Limiter) -> None:
+        self.by_client = by_client
+        self.by_username = by_username
+
+    async def check(self, client: str, username: str) -> float:
+        """
+        Count a login attempt.
+
+        Args:
+            client (str): Client address
+            username (str): Username of the attempt
+
+        Returns:
+            float: 0 if the attempt is allowed, otherwise seconds
+                until it's allowed
+        """
+        retry_after = await acquire(self.by_client, client)
+        if retry_after:
+            auth_logins_throttled_total.inc("client")
+            return retry_after
+        retry_after = await acquire(self.by_username, username)
+        if retry_after:
+            auth_logins_throttled_total.inc("username")
+        return retry_after
+
+
+def get_client_address(request: Request, trusted_proxy_hops: int) -> str:
+    """
+    Get address of the client that sent request.
+
+    Every proxy appends the address it got the request from
+    to X-Forwarded-For, so behind trusted_proxy_hops proxies the client
+    is that many addresses from the end. Addresses before it are sent
+    by the client and can't be trusted.
+
+    Args:
+        request (Request): HTTP Request
+        trusted_proxy_hops (int): Number of proxies in front of
+            the service, 0 to use the peer address
+
+    Returns:
+        str: Client address
+    """
+    peer = request.client.host if request.client else ""
+    if not trusted_proxy_hops:
+        return peer
+    forwarded = [
+        address.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for address in header.split(",")
+        if address.strip()
+    ]
+    if not forwarded:
+        return peer
+    return forwarded[-min(trusted_proxy_hops, len(forwarded))]
+
+
+@cache
+def get_login_throttle() -> LoginThrottle:
+    settings = get_settings()
+    if settings.login_throttle_store == "database":
+        return LoginThrottle(
+            by_client=DatabaseTokenBucketLimiter(
+                "client",
+                rate=settings.login_client_rate,
+                burst=settings.login_client_burst,
+            ),
+            by_username=DatabaseTokenBucketLimiter(
+                "username",
+                rate=settings.login_username_rate,
+                burst=settings.login_username_burst,
+            ),
+        )
+    return LoginThrottle(
+        by_client=TokenBucketLimiter(
+            rate=settings.login_client_rate,
+            burst=settings.login_client_burst,
+            max_keys=settings.login_throttle_max_keys,
+        ),
+        by_username=TokenBucketLimiter(
+            rate=settings.login_username_rate,
+            burst=settings.login_username_burst,
+            max_keys=settings.login_throttle_max_keys,
+        ),
+    )
@@ -1,71 +1,190 @@
 import logging
-import os
+import math
 from datetime import timedelta
 from typing import Annotated
 
-from dotenv import load_dotenv
-from fastapi import Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Form,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from fastapi.security import OAuth2PasswordRequestForm
 
-from shift_fastapi_service.app import app
 from shift_fastapi_service.auth.auth import (
     authenticate_user,
     create_access_token,
+    create_refresh_token,
+    get_key_set,
+    get_principal,
+    get_user_claims,
+    rotate_refresh_token,
+)
+from shift_fastapi_service.auth.throttling import (
+    get_client_address,
+    get_login_throttle,
 )
+from shift_fastapi_service.config import get_settings
 from shift_fastapi_service.domain import Token
-from shift_fastapi_service.repository import Repository
+from shift_fastapi_service.repository import (
+    AsyncRepository,
+    get_repository,
+)
+from shift_fastapi_service.responses import FastJSONResponse
 
-load_dotenv()
 logger = logging.getLogger(__name__)
 
-env_var = os.environ
+router = APIRouter()
 
-DEFAULT_ACCESS_TOKEN_EXPIRE_TIME = 15.0
-ACCESS_TOKEN_EXPIRE_TIME: str | None = env_var.get(
-    "ACCESS_TOKEN_EXPIRE_MINUTES"
-)
-
-try:
-    ACCESS_TOKEN_EXPIRE_MINUTES = float(ACCESS_TOKEN_EXPIRE_TIME)
-except TypeError:
-    logger.error(
-        f"ACCESS_TOKEN_EXPIRE_MINUTES {ACCESS_TOKEN_EXPIRE_TIME} was not provided, set to {DEFAULT_ACCESS_TOKEN_EXPIRE_TIME}"
-    )
-    ACCESS_TOKEN_EXPIRE_MINUTES: float = DEFAULT_ACCESS_TOKEN_EXPIRE_TIME
-except ValueError:
-    logger.error(
-        f"ACCESS_TOKEN_EXPIRE_MINUTES {ACCESS_TOKEN_EXPIRE_TIME} is not an integer, set to {DEFAULT_ACCESS_TOKEN_EXPIRE_TIME}"
-    )
-    ACCESS_TOKEN_EXPIRE_MINUTES = DEFAULT_ACCESS_TOKEN_EXPIRE_TIME
 
-
-@app.post("/token")
+@router.post("/token", response_model=Token)
 async def login_for_access_token(
+    request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-) -> Token:
+) -> Response:
     """
     View for logging user in and acquiring OAuth2 token.
 
+    With TOKEN_CLAIMS_MODE other than "off" the token carries
+    the user fields and row version, and expires in TOKEN_CLAIMS_TTL.
+
+    Attempts are throttled by client address and by username before
+    the user is looked up and the password is hashed.
+
+    The response also carries a refresh token starting a new family,
+    see refresh_access_token.
+
     Args:
+        request (Request): HTTP Request
         form_data (Annotated[OAuth2PasswordRequestForm, Depends):
             Username and Password in form-data format
 
     Raises:
         HTTPException: HTTP Exception with status HTTP_401_UNAUTHORIZED
+        HTTPException: HTTP Exception with status
+            HTTP_429_TOO_MANY_REQUESTS
 
     Returns:
-        Token: User token as json object marshaled from Token class
+        Response: User token as json object marshaled from Token class
     """
-    db = Repository()
-    user = authenticate_user(db, form_data.username, form_data.password)
+    settings = get_settings()
+    if settings.login_throttle_enabled:
+        client = get_client_address(request, settings.login_trusted_proxy_hops)
+        retry_after = await get_login_throttle().check(
+            client, form_data.username
+        )
+        if retry_after:
+            logger.info(
+                f"login of {form_data.username} from {client} throttled"
+            )
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+    db = get_repository()
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    refresh_token = await create_refresh_token(db, user.username)
+    return FastJSONResponse(
+        await issue_token(db, user.username, refresh_token)
+    )
+
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh_access_token(
+    refresh_token: Annotated[str, Form()],
+) -> Response:
+    """
+    View for exchanging a refresh token for a new access token.
+
+    The refresh token is rotated: the response carries a new one and
+    the presented token can't be used again. Presenting a used token
+    revokes every token issued since the login it came from.
+    No password is hashed.
+
+    Args:
+        refresh_token (Annotated[str, Form): Refresh token
+            in form-data format
+
+    Raises:
+        HTTPException: HTTP Exception with status HTTP_401_UNAUTHORIZED
+
+    Returns:
+        Response: User token as json object marshaled from Token class
+    """
+    db = get_repository()
+    username, new_refresh_token = await rotate_refresh_token(db, refresh_token)
+    try:
+        principal = await get_principal(db, username)
+    except HTTPException:
+        principal = None
+    if principal is None or principal.disabled:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return FastJSONResponse(await issue_token(db, username, new_refresh_token))
+
+
+async def issue_token(
+    db: AsyncRepository, username: str, refresh_token: str
+) -> Token:
+    """
+    Create an access token of user and pack it with a refresh token.
+
+    Args:
+        db (AsyncRepository): Repository to read claims from
+        username (str): Username
+        refresh_token (str): Refresh token
+
+    Returns:
+        Token: Access and refresh token
+    """
+    settings = get_settings()
+    access_token_expires = timedelta(
+        minutes=settings.access_token_expire_minutes
+    )
+    data = {"sub": username}
+    if settings.token_claims_mode != "off":
+        data.update(await get_user_claims(db, username))
+        access_token_expires = min(
+            access_token_expires,
+            timedelta(seconds=settings.token_claims_ttl),
+        )
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=data, expires_delta=access_token_expires
+    )
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=refresh_token,
+    )
+
+
+@router.get("/.well-known/jwks.json")
+async def get_jwks() -> Response:
+    """
+    View for public keys of access tokens as JWK Set.
+
+    Lets other services verify tokens without calling the service,
+    keys are cached by clients for JWKS_MAX_AGE seconds.
+
+    Returns:
+        Response: JWK Set as json object
+    """
+    return FastJSONResponse(
+        get_key_set().get_jwks(),
+        headers={
+            "Cache-Control": f"public, max-age={get_settings().jwks_max_age}"
+        },
     )
-    return Token(access_token=access_token, token_type="bearer")
@@ -0,0 +1,271 @@
+"""
+Bulk import of users from NDJSON or CSV.
+
+Run:
+    python -m shift_fastapi_service.bulk_import users.ndjson
+    python -m shift_fastapi_service.bulk_import users.csv --format csv
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Literal
+
+from pydantic import ValidationError
+
+from shift_fastapi_service.auth.hashing import HashingPool, get_password_hash
+from shift_fastapi_service.config import get_settings
+from shift_fastapi_service.domain import (
+    ImportReport,
+    ImportRowError,
+    UserImport,
+)
+from shift_fastapi_service.repository import (
+    AsyncRepository,
+    get_repository,
+)
+
+logger = logging.getLogger(__name__)
+
+ImportFormat = Literal["ndjson", "csv"]
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """
+    Split a stream of bytes into lines without reading it whole.
+
+    Args:
+        chunks (AsyncIterable[bytes]): Stream of UTF-8 encoded text
+
+    Yields:
+        str: Lines without line endings
+    """
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip(b"\r").decode()
+    if tail:
+        yield tail.rstrip(b"\r").decode()
+
+
+async def iter_records(
+    chunks: AsyncIterable[bytes], file_format: ImportFormat
+) -> AsyncIterator[tuple[int, dict | str]]:
+    """
+    Parse records from a stream of NDJSON or CSV.
+
+    CSV must have a header row, quoted values can't contain line breaks.
+
+    Args:
+        chunks (AsyncIterable[bytes]): Stream of UTF-8 encoded text
+        file_format (ImportFormat): "ndjson" or "csv"
+
+    Yields:
+        tuple[int, dict | str]: Row number and record,
+            or error message for rows that can't be parsed
+    """
+    header: list[str] | None = None
+    row = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        if file_format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = values
+                continue
+            row += 1
+            if len(values) != len(header):
+                yield row, f"expected {len(header)} values"
+                continue
+            yield row, dict(zip(header, values))
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row, f"invalid json: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row, "expected json object"
+            continue
+        yield row, record
+
+
+async def hash_passwords(
+    users: list[UserImport], hashing_pool: HashingPool
+) -> list[str]:
+    """
+    Hash passwords of users in parallel.
+
+    At most hashing_pool.workers passwords are submitted at once,
+    so the pool queue is left to other requests.
+
+    Args:
+        users (list[UserImport]): Users to hash passwords of
+        hashing_pool (HashingPool): Pool to hash passwords in
+
+    Returns:
+        list[str]: Hashed passwords in the order of users
+    """
+    semaphore = asyncio.Semaphore(hashing_pool.workers)
+
+    async def hash_password(user: UserImport) -> str:
+        if user.hashed_password is not None:
+            return user.hashed_password
+        async with semaphore:
+            return await hashing_pool.run(get_password_hash, user.password)
+
+    return await asyncio.gather(*(hash_password(user) for user in users))
+
+
+async def import_batch(
+    batch: list[tuple[int, UserImport]],
+    db: AsyncRepository,
+    hashing_pool: HashingPool,
+    report: ImportReport,
+) -> None:
+    users = [user for _, user in batch]
+    hashed_passwords = await hash_passwords(users, hashing_pool)
+    user_dicts = []
+    for user, hashed_password in zip(users, hashed_passwords):
+        user_dict = user.to_dict()
+        user_dict["hashed_password"] = hashed_password
+        user_dicts.append(user_dict)
+    created = await db.create_users(user_dicts)
+    for (row, user), ok in zip(batch, created):
+        if ok:
+            report.created += 1
+            continue
+        report.errors.append(
+            ImportRowError(
+                row=row,
+                username=user.username,
+                detail="username or email already exists",
+            )
+        )
+
+
+async def import_users(
+    chunks: AsyncIterable[bytes],
+    file_format: ImportFormat,
+    db: AsyncRepository,
+    hashing_pool: HashingPool,
+    batch_size: int,
+    allow_hashed_password: bool = False,
+) -> ImportReport:
+    """
+    Import users from a stream of NDJSON or CSV.
+
+    Rows are validated one by one and inserted in batches of batch_size,
+    one transaction per batch. Invalid rows and rows with existing
+    username or email are reported and don't stop the import.
+
+    Args:
+        chunks (AsyncIterable[bytes]): Stream of UTF-8 encoded text
+        file_format (ImportFormat): "ndjson" or "csv"
+        db (AsyncRepository): Repository to create users in
+        hashing_pool (HashingPool): Pool to hash passwords in
+        batch_size (int): Number of users inserted in one transaction
+        allow_hashed_password (bool): Accept hashed_password instead
+            of password, only for trusted input like local files
+
+    Returns:
+        ImportReport: Numbers of rows and created users, row errors
+            and throughput
+    """
+    start = time.perf_counter()
+    report = ImportReport()
+    batch: list[tuple[int, UserImport]] = []
+    async for row, record in iter_records(chunks, file_format):
+        report.rows += 1
+        if isinstance(record, str):
+            report.errors.append(ImportRowError(row=row, detail=record))
+            continue
+        try:
+            user = UserImport(**record)
+        except ValidationError as e:
+            detail = "; ".join(error["msg"] for error in e.errors())
+            report.errors.append(
+                ImportRowError(
+                    row=row, username=record.get("username"), detail=detail
+                )
+            )
+            continue
+        if user.hashed_password is not None and not allow_hashed_password:
+            report.errors.append(
+                ImportRowError(
+                    row=row,
+                    username=user.username,
+                    detail="hashed_password is not accepted, give password",
+                )
+            )
+            continue
+        batch.append((row, user))
+        if len(batch) >= batch_size:
+            await import_batch(batch, db, hashing_pool, report)
+            batch = []
+    if batch:
+        await import_batch(batch, db, hashing_pool, report)
+    report.seconds = time.perf_counter() - start
+    if report.seconds > 0:
+        report.rows_per_second = report.rows / report.seconds
+    logger.info(
+        f"imported {report.created} of {report.rows} users "
+        f"in {report.seconds:.2f}s, {report.rows_per_second:.0f} rows/s"
+    )
+    return report
+
+
+async def read_file(path: Path) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, READ_CHUNK_SIZE):
+            yield chunk
+
+
+async def main(
+    path: Path, file_format: ImportFormat, batch_size: int, workers: int
+) -> ImportReport:
+    hashing_pool = HashingPool(
+        workers=workers, queue_size=workers, executor="process"
+    )
+    db = get_repository()
+    try:
+        return await import_users(
+            read_file(path),
+            file_format,
+            db,
+            hashing_pool,
+            batch_size,
+            allow_hashed_password=True,
+        )
+    finally:
+        hashing_pool.shutdown()
+        await db.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import users in bulk.")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=["ndjson", "csv"])
+    parser.add_argument(
+        "--batch-size", type=int, default=get_settings().bulk_import_batch_size
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    file_format = args.format or (
+        "csv" if args.path.suffix == ".csv" else "ndjson"
+    )
+    report = asyncio.run(
+        main(args.path, file_format, args.batch_size, args.workers)
+    )
+    print(report.model_dump_json(indent=2))
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from functools import cache
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from shift_fastapi_service.config import get_settings
+from shift_fastapi_service.domain import Principal
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "evictions", "expirations", "loads")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.loads = 0
+
+    def to_dict(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Bounded in-process cache with TTL and LRU eviction.
+
+    Safe to use from several threads. get_or_load coalesces concurrent
+    misses for the same key into a single load.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: dict[K, asyncio.Future[V]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key: K, value: V, expires_at: float | None = None) -> None:
+        """
+        Store value for key.
+
+        Args:
+            key (K): Cache key
+            value (V): Value to store
+            expires_at (float | None): Expiration time on the cache clock,
+                the entry never lives longer than ttl
+        """
+        if self.max_size <= 0:
+            return
+        ttl_expires_at = self.clock() + self.ttl
+        if expires_at is None or expires_at > ttl_expires_at:
+            expires_at = ttl_expires_at
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        self._loading.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        self._loading.clear()
+
+    async def get_or_load(
+        self, key: K, loader: Callable[[], Awaitable[V]]
+    ) -> V:
+        """
+        Get value for key, load it on a miss.
+
+        Concurrent misses for the same key wait for the first load.
+        A value loaded while the key was invalidated isn't stored.
+
+        Args:
+            key (K): Cache key
+            loader (Callable[[], Awaitable[V]]): Loads value for key
+
+        Returns:
+            V: Cached or loaded value
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        loading = self._loading.get(key)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[key] = loading
+        try:
+            value = await loader()
+        except BaseException as e:
+            if self._loading.get(key) is loading:
+                del self._loading[key]
+            if isinstance(e, Exception):
+                loading.set_exception(e)
+                # mark the exception as retrieved if nobody is waiting
+                loading.exception()
+            else:
+                loading.cancel()
+            raise
+        self.stats.loads += 1
+        if self._loading.get(key) is loading:
+            del self._loading[key]
+            self.set(key, value)
+        loading.set_result(value)
+        return value
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            **self.stats.to_dict(),
+        }
+
+
+@cache
+def get_principal_cache() -> TTLCache[str, Principal]:
+    settings = get_settings()
+    return TTLCache(
+        max_size=settings.principal_cache_size,
+        ttl=settings.principal_cache_ttl,
+    )
+
+
+@cache
+def get_version_loader() -> TTLCache[str, int]:
+    # stores nothing, only coalesces concurrent lookups of row versions
+    return TTLCache(max_size=0, ttl=0.0)
+
+
+@cache
+def get_token_cache() -> TTLCache[bytes, dict[str, Any]]:
+    settings = get_settings()
+    return TTLCache(
+        max_size=settings.token_cache_size, ttl=settings.token_cache_ttl
+    )
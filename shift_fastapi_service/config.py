@@ -0,0 +1,181 @@
+import logging
+import os
+from functools import cache
+from typing import Literal, Mapping
+
+from dotenv import load_dotenv
+from pydantic import (
+    BaseModel,
+    Field,
+    SecretStr,
+    TypeAdapter,
+    ValidationError,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_URL = "sqlite+pysqlite:///sqlite3.db"
+
+
+class Settings(BaseModel):
+    """
+    Service settings.
+
+    Every field can be overridden by an environment variable
+    with the same name in upper case, e.g. DATABASE_URL.
+    """
+
+    secret_key: SecretStr | None = None
+    algorithm: str = "HS256"
+    access_token_expire_minutes: float = 15.0
+    database_url: str = DEFAULT_DATABASE_URL
+    async_database_url: str | None = None
+    database_echo: bool = False
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30.0
+    database_pool_pre_ping: bool = True
+    database_replica_urls: str = ""
+    database_replica_policy: Literal["round_robin", "least_busy"] = (
+        "round_robin"
+    )
+    database_read_your_writes_seconds: float = 5.0
+    database_replica_retry_seconds: float = 10.0
+    database_shards: str = ""
+    database_shard_vnodes: int = 64
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size: int = -64_000
+    sqlite_busy_timeout: int = 5_000
+    create_schema_on_startup: bool = False
+    startup_warm_up: bool = True
+    password_hash_workers: int = 2
+    password_hash_queue_size: int = 64
+    password_hash_executor: Literal["thread", "process"] = "thread"
+    bcrypt_rounds: int | None = None
+    bcrypt_target_seconds: float = 0.25
+    bcrypt_calibration_file: str = "bcrypt_calibration.json"
+    bcrypt_calibrate_on_startup: bool = True
+    principal_cache_size: int = 10_000
+    principal_cache_ttl: float = 60.0
+    principal_cache_check_version: bool | None = None
+    token_cache_enabled: bool = True
+    token_cache_size: int = 10_000
+    token_cache_ttl: float = 900.0
+    token_claims_mode: Literal["off", "claims", "strict"] = "off"
+    token_claims_ttl: float = 60.0
+    jwt_keys_dir: str | None = None
+    jwt_signing_kid: str | None = None
+    jwks_max_age: int = 300
+    refresh_token_ttl: float = 30 * 24 * 3600.0
+    login_throttle_enabled: bool = True
+    login_throttle_store: Literal["memory", "database"] = "memory"
+    login_client_rate: float = Field(1.0, gt=0)
+    login_client_burst: int = Field(20, ge=1)
+    login_username_rate: float = Field(0.1, gt=0)
+    login_username_burst: int = Field(5, ge=1)
+    login_throttle_max_keys: int = 100_000
+    login_trusted_proxy_hops: int = Field(0, ge=0)
+    bulk_import_batch_size: int = 1000
+    admin_usernames: str = ""
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int = 0
+    server_backlog: int = 2048
+    server_max_requests: int = 10_000
+    server_max_requests_jitter: int = 1_000
+    server_graceful_timeout: int = 30
+    server_loop: Literal["auto", "asyncio", "uvloop"] = "auto"
+    server_http: Literal["auto", "h11", "httptools"] = "auto"
+    server_access_log: bool = False
+    metrics_dir: str = ""
+    metrics_flush_seconds: float = Field(1.0, gt=0)
+    log_file_name: str = "main.log"
+    log_level: str = "INFO"
+    log_levels: str = ""
+    log_format: Literal["text", "json"] = "text"
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotation_when: str | None = None
+
+    def get_database_replica_urls(self) -> list[str]:
+        return [
+            url.strip()
+            for url in self.database_replica_urls.split(",")
+            if url.strip()
+        ]
+
+    def get_database_shards(self) -> dict[str, str]:
+        shards = {}
+        for shard in self.database_shards.split(","):
+            name, _, url = shard.partition("=")
+            if name.strip():
+                shards[name.strip()] = url.strip()
+        return shards
+
+    def get_admin_usernames(self) -> set[str]:
+        return {
+            username.strip()
+            for username in self.admin_usernames.split(",")
+            if username.strip()
+        }
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] | None = None) -> "Settings":
+        """
+        Build settings from environment variables.
+
+        Invalid values, including values out of the field's bounds,
+        are logged and replaced with the field default.
+
+        Args:
+            environ (Mapping[str, str] | None): Variables to read,
+                os.environ by default
+
+        Returns:
+            Settings: Settings object
+        """
+        if environ is None:
+            environ = os.environ
+        values = {}
+        for name, field in cls.model_fields.items():
+            raw_value = environ.get(name.upper())
+            if raw_value is None:
+                continue
+            try:
+                values[name] = TypeAdapter(
+                    field.rebuild_annotation()
+                ).validate_python(raw_value)
+            except ValidationError:
+                logger.error(
+                    f"{name.upper()} {raw_value} is not valid, "
+                    f"set to {field.default}"
+                )
+        return cls(**values)
+
+
+settings_override: Settings | None = None
+
+
+@cache
+def get_settings() -> Settings:
+    if settings_override is not None:
+        return settings_override
+    load_dotenv()
+    return Settings.from_env()
+
+
+def set_settings(settings: Settings | None) -> None:
+    """
+    Make get_settings return settings instead of reading environment.
+
+    Objects built from settings by cached getters, e.g. engines, keep
+    the settings they were built with.
+
+    Args:
+        settings (Settings | None): Settings, None to read environment
+    """
+    global settings_override
+    settings_override = settings
+    get_settings.cache_clear()
@@ -0,0 +1,516 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import cache
+from typing import Any, AsyncIterator, Callable, Hashable, Iterable, Literal
+
+from sqlalchemy import (
+    Connection,
+    Engine,
+    create_engine,
+    event,
+    make_url,
+    text,
+)
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from shift_fastapi_service.config import Settings, get_settings
+from shift_fastapi_service.metrics import (
+    database_reads_total,
+    database_replica_failures_total,
+)
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS: dict[str, str] = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+SQLITE_PRAGMAS: tuple[str, ...] = (
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "busy_timeout",
+)
+
+
+def to_async_url(database_url: str) -> str:
+    """
+    Get async driver URL for a database URL.
+
+    URLs that already name an async driver are returned unchanged.
+
+    Args:
+        database_url (str): Database URL, e.g. sqlite+pysqlite:///sqlite3.db
+
+    Returns:
+        str: Database URL with async driver,
+            e.g. sqlite+aiosqlite:///sqlite3.db
+    """
+    url = make_url(database_url)
+    async_driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if async_driver is None or url.get_driver_name() in ASYNC_DRIVERS.values():
+        return database_url
+    return url.set(
+        drivername=f"{url.get_backend_name()}+{async_driver}"
+    ).render_as_string(hide_password=False)
+
+
+def is_sqlite_memory(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def get_engine_options(url: URL, settings: Settings) -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "echo": settings.database_echo,
+        "pool_pre_ping": settings.database_pool_pre_ping,
+    }
+    if not is_sqlite_memory(url):
+        options |= {
+            "pool_size": settings.database_pool_size,
+            "max_overflow": settings.database_max_overflow,
+            "pool_timeout": settings.database_pool_timeout,
+        }
+    return options
+
+
+def get_sqlite_pragmas(settings: Settings) -> dict[str, str | int]:
+    return {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "mmap_size": settings.sqlite_mmap_size,
+        "cache_size": settings.sqlite_cache_size,
+        "busy_timeout": settings.sqlite_busy_timeout,
+    }
+
+
+def set_sqlite_pragmas(engine: Engine, settings: Settings) -> None:
+    """
+    Apply SQLite pragmas to every new connection of engine.
+
+    Args:
+        engine (Engine): SQLite engine, sync_engine for async engines
+        settings (Settings): Settings with pragma values
+    """
+    pragmas = get_sqlite_pragmas(settings)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def create_database_engine(settings: Settings) -> Engine:
+    url = make_url(settings.database_url)
+    engine = create_engine(url, **get_engine_options(url, settings))
+    if url.get_backend_name() == "sqlite":
+        set_sqlite_pragmas(engine, settings)
+    return engine
+
+
+def create_async_database_engine(settings: Settings) -> AsyncEngine:
+    url = make_url(
+        settings.async_database_url or to_async_url(settings.database_url)
+    )
+    options = get_engine_options(url, settings)
+    if url.get_backend_name() == "sqlite" and not is_sqlite_memory(url):
+        # aiosqlite defaults to NullPool, a new connection per checkout
+        options["poolclass"] = AsyncAdaptedQueuePool
+    engine = create_async_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        set_sqlite_pragmas(engine.sync_engine, settings)
+    return engine
+
+
+def get_engine_report(connection: Connection) -> dict[str, Any]:
+    """
+    Get settings the engine of a connection actually works with.
+
+    Args:
+        connection (Connection): Connection of the engine to report
+
+    Returns:
+        dict[str, Any]: URL, pool status and SQLite pragmas
+    """
+    engine = connection.engine
+    report: dict[str, Any] = {
+        "url": engine.url.render_as_string(hide_password=True),
+        "pool": engine.pool.status(),
+        "echo": engine.echo,
+    }
+    if engine.url.get_backend_name() == "sqlite":
+        for name in SQLITE_PRAGMAS:
+            report[name] = connection.execute(text(f"PRAGMA {name}")).scalar()
+    return report
+
+
+async def log_database_settings(engine: AsyncEngine | None = None) -> None:
+    engine = engine or get_async_engine()
+    async with engine.connect() as connection:
+        report = await connection.run_sync(get_engine_report)
+    logger.info(f"database settings: {report}")
+
+
+async def warm_up_connections(engine: AsyncEngine) -> None:
+    """
+    Fill the pool of engine with connections that ran a query.
+
+    Connections are held concurrently, so each is a new one.
+
+    Args:
+        engine (AsyncEngine): Engine to warm up
+    """
+    pool = engine.pool
+    count = pool.size() if isinstance(pool, QueuePool) else 1
+
+    async def connect() -> None:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(connect() for _ in range(count)))
+
+
+READ_YOUR_WRITES_COOKIE = "last_write"
+
+
+class ClientWrites:
+    """
+    Time of the last write of the client of a request.
+
+    The time is wall clock time, which server workers agree on,
+    carried between requests by ReadYourWritesMiddleware.
+    """
+
+    __slots__ = ("written_at", "wrote")
+
+    def __init__(self, written_at: float | None = None) -> None:
+        self.written_at = written_at
+        self.wrote = False
+
+
+client_writes: ContextVar[ClientWrites | None] = ContextVar(
+    "client_writes", default=None
+)
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware carrying the time of a client's writes in a cookie.
+
+    Any server worker, not only the one that served the write, then
+    reads from the primary for the client, see EngineRouter.
+    The cookie expires with the read your writes window.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        writes = ClientWrites(
+            parse_written_at(
+                HTTPConnection(scope).cookies.get(READ_YOUR_WRITES_COOKIE)
+            )
+        )
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and writes.wrote:
+                max_age = math.ceil(
+                    get_settings().database_read_your_writes_seconds
+                )
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}={writes.written_at:.6f}; "
+                    f"Max-Age={max_age}; Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        token = client_writes.set(writes)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            client_writes.reset(token)
+
+
+def parse_written_at(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        written_at = float(value)
+    except ValueError:
+        return None
+    return written_at if math.isfinite(written_at) else None
+
+
+class EngineRouter:
+    """
+    Routes reads to replicas and everything else to the primary.
+
+    Replicas are picked round robin or by the fewest reads in flight,
+    ties going round robin. Keys, e.g. usernames, written within
+    read_your_writes_seconds are read from the primary, so a client
+    sees its own writes despite replication lag. Keys are pinned in
+    this process, the client of a request that wrote is pinned by the
+    time of its write in client_writes, which ReadYourWritesMiddleware
+    carries to whichever worker serves its next requests. A replica
+    that fails to connect is skipped for retry_seconds and its reads go
+    to the primary. Pins and health are used from the event loop
+    thread only, so there's no lock.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: Iterable[AsyncEngine] = (),
+        policy: Literal["round_robin", "least_busy"] = "round_robin",
+        read_your_writes_seconds: float = 5.0,
+        retry_seconds: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self._next = 0
+        self._in_flight = [0] * len(self.replicas)
+        self._down_until = [0.0] * len(self.replicas)
+        self._pinned: OrderedDict[Hashable, float] = OrderedDict()
+
+    def pin(self, keys: Iterable[Hashable]) -> None:
+        """
+        Read keys from the primary for read_your_writes_seconds.
+
+        Args:
+            keys (Iterable[Hashable]): Written keys, e.g. usernames
+        """
+        if not self.replicas or self.read_your_writes_seconds <= 0:
+            return
+        pinned_until = self.clock() + self.read_your_writes_seconds
+        for key in keys:
+            self._pinned.pop(key, None)
+            self._pinned[key] = pinned_until
+        writes = client_writes.get()
+        if writes is not None:
+            writes.written_at = self.wall_clock()
+            writes.wrote = True
+
+    def is_client_pinned(self) -> bool:
+        writes = client_writes.get()
+        if writes is None or writes.written_at is None:
+            return False
+        # Clocks of other hosts may be a bit ahead, a time far
+        # in the future is forged and ignored
+        elapsed = self.wall_clock() - writes.written_at
+        return abs(elapsed) < self.read_your_writes_seconds
+
+    def is_pinned(self, key: Hashable) -> bool:
+        now = self.clock()
+        # Pins share one window, so they are in the order they expire
+        while self._pinned:
+            oldest, pinned_until = next(iter(self._pinned.items()))
+            if pinned_until > now:
+                break
+            del self._pinned[oldest]
+        return key in self._pinned
+
+    def get_healthy_replicas(self) -> list[int]:
+        now = self.clock()
+        return [
+            index
+            for index, down_until in enumerate(self._down_until)
+            if down_until <= now
+        ]
+
+    def choose_replica(self) -> int | None:
+        healthy = self.get_healthy_replicas()
+        if not healthy:
+            return None
+        start = self._next % len(healthy)
+        self._next += 1
+        candidates = healthy[start:] + healthy[:start]
+        if self.policy == "least_busy":
+            return min(candidates, key=self._in_flight.__getitem__)
+        return candidates[0]
+
+    def mark_down(self, index: int) -> None:
+        logger.warning(
+            f"replica {self.replicas[index].url!r} is unavailable, "
+            f"reading from primary for {self.retry_seconds}s",
+            exc_info=True,
+        )
+        self._down_until[index] = self.clock() + self.retry_seconds
+        database_replica_failures_total.inc()
+
+    @asynccontextmanager
+    async def connect_reader(
+        self, key: Hashable | None = None
+    ) -> AsyncIterator[AsyncConnection]:
+        """
+        Connect to the engine that should serve a read.
+
+        Reads of the client of a request that wrote within
+        read_your_writes_seconds go to the primary.
+
+        Args:
+            key (Hashable | None): Key the read is about, e.g. username,
+                reads of pinned keys go to the primary
+
+        Yields:
+            AsyncConnection: Connection to a replica or the primary
+        """
+        index = None
+        if not self.is_client_pinned() and (
+            key is None or not self.is_pinned(key)
+        ):
+            index = self.choose_replica()
+        connection = None
+        if index is not None:
+            try:
+                connection = await self.replicas[index].connect()
+            except (DBAPIError, OSError):
+                self.mark_down(index)
+        if connection is None or index is None:
+            database_reads_total.inc("primary")
+            async with self.primary.connect() as connection:
+                yield connection
+            return
+        database_reads_total.inc("replica")
+        self._in_flight[index] += 1
+        try:
+            yield connection
+        finally:
+            self._in_flight[index] -= 1
+            await connection.close()
+
+    async def check_replicas(self) -> None:
+        """
+        Run a query on every replica, marking down those that fail.
+        """
+        for index, replica in enumerate(self.replicas):
+            try:
+                async with replica.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+            except (DBAPIError, OSError):
+                self.mark_down(index)
+            else:
+                self._down_until[index] = 0.0
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.dispose()
+
+
+def create_async_engine_for_url(settings: Settings, url: str) -> AsyncEngine:
+    return create_async_database_engine(
+        settings.model_copy(
+            update={"database_url": url, "async_database_url": None}
+        )
+    )
+
+
+def create_engine_router(
+    settings: Settings, primary: AsyncEngine
+) -> EngineRouter:
+    replicas = [
+        create_async_engine_for_url(settings, url)
+        for url in settings.get_database_replica_urls()
+    ]
+    return EngineRouter(
+        primary,
+        replicas,
+        policy=settings.database_replica_policy,
+        read_your_writes_seconds=settings.database_read_your_writes_seconds,
+        retry_seconds=settings.database_replica_retry_seconds,
+    )
+
+
+@cache
+def get_engine() -> Engine:
+    return create_database_engine(get_settings())
+
+
+@cache
+def get_async_engine() -> AsyncEngine:
+    return create_async_database_engine(get_settings())
+
+
+@cache
+def get_engine_router() -> EngineRouter:
+    return create_engine_router(get_settings(), get_async_engine())
+
+
+@cache
+def get_shard_routers() -> dict[str, EngineRouter]:
+    """
+    Get routers of shard databases by shard name, in the configured order.
+
+    Shards have no replicas. Empty unless DATABASE_SHARDS is set.
+
+    Returns:
+        dict[str, EngineRouter]: Routers by shard name
+    """
+    settings = get_settings()
+    return {
+        name: EngineRouter(create_async_engine_for_url(settings, url))
+        for name, url in settings.get_database_shards().items()
+    }
+
+
+async def dispose_engines() -> None:
+    """
+    Close pooled connections of engines created so far.
+
+    Engines are dropped, the next get_engine call builds a new one
+    from current settings. So is the repository that holds them.
+    """
+    # repository imports this module, it's loaded by the time engines
+    # are disposed
+    from shift_fastapi_service.repository import get_repository
+
+    get_repository.cache_clear()
+    if get_engine_router.cache_info().currsize:
+        await get_engine_router().dispose()
+        get_engine_router.cache_clear()
+    if get_shard_routers.cache_info().currsize:
+        for router in get_shard_routers().values():
+            await router.primary.dispose()
+        get_shard_routers.cache_clear()
+    if get_async_engine.cache_info().currsize:
+        await get_async_engine().dispose()
+        get_async_engine.cache_clear()
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
+        get_engine.cache_clear()
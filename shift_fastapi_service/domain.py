@@ -1,11 +1,15 @@
 from datetime import date
+from typing import Generic, TypeVar
 
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
+
+T = TypeVar("T")
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 
 class TokenData(BaseModel):
@@ -54,3 +58,167 @@ class UserInDB(User):
 
 class UserNotInDB(User):
     password: str
+
+
+class UserFilter(BaseModel):
+    salary_min: int | None = None
+    salary_max: int | None = None
+    promotion_from: date | None = None
+    promotion_to: date | None = None
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T]
+    next_cursor: str | None = None
+
+
+class UserImport(User):
+    password: str | None = None
+    hashed_password: str | None = None
+
+    @model_validator(mode="after")
+    def check_password(self) -> "UserImport":
+        if self.password is None and self.hashed_password is None:
+            raise ValueError("password or hashed_password is required")
+        return self
+
+
+class ImportRowError(BaseModel):
+    row: int
+    username: str | None = None
+    detail: str
+
+
+class ImportReport(BaseModel):
+    rows: int = 0
+    created: int = 0
+    errors: list[ImportRowError] = []
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+
+
+class ShardMove(BaseModel):
+    source: str
+    target: str
+    users: int
+
+
+class ReshardConflict(BaseModel):
+    username: str
+    source: str
+    target: str
+    detail: str
+
+
+class ReshardReport(BaseModel):
+    moved: int = 0
+    moves: list[ShardMove] = []
+    conflicts: list[ReshardConflict] = []
+
+
+class UserUpdate(BaseModel):
+    username: str
+    salary: int | None = None
+    next_promotion_date: date | None = None
+
+
+class UserUpdateResult(BaseModel):
+    username: str
+    updated: bool
+    detail: str | None = None
+
+
+class BatchUpdateReport(BaseModel):
+    updated: int
+    results: list[UserUpdateResult]
+
+
+class Principal:
+    """
+    Compact representation of an authenticated user for caching.
+    """
+
+    __slots__ = (
+        "username",
+        "email",
+        "salary",
+        "next_promotion_date",
+        "disabled",
+        "hashed_password",
+        "version",
+    )
+
+    def __init__(
+        self,
+        username: str,
+        email: str | None,
+        salary: int,
+        next_promotion_date: date,
+        disabled: bool,
+        hashed_password: str | None,
+        version: int = 1,
+    ) -> None:
+        self.username = username
+        self.email = email
+        self.salary = salary
+        self.next_promotion_date = next_promotion_date
+        self.disabled = disabled
+        self.hashed_password = hashed_password
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, user: dict) -> "Principal":
+        return cls(
+            username=user["username"],
+            email=user["email"],
+            salary=user["salary"],
+            next_promotion_date=user["next_promotion_date"],
+            disabled=user["disabled"],
+            hashed_password=user["hashed_password"],
+            version=user.get("version", 1),
+        )
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "Principal":
+        """
+        Get user from verified claims of an access token.
+
+        Tokens don't carry the password hash, so it's None.
+
+        Args:
+            claims (dict): Claims with "sub", "ver" and user fields
+
+        Returns:
+            Principal: User as of token issuance
+        """
+        return cls(
+            username=claims["sub"],
+            email=claims["email"],
+            salary=claims["salary"],
+            next_promotion_date=date.fromisoformat(
+                claims["next_promotion_date"]
+            ),
+            disabled=claims["disabled"],
+            hashed_password=None,
+            version=claims["ver"],
+        )
+
+    def to_claims(self) -> dict:
+        return {
+            "email": self.email,
+            "salary": self.salary,
+            "next_promotion_date": self.next_promotion_date.isoformat(),
+            "disabled": self.disabled,
+            "ver": self.version,
+        }
+
+    def to_user_in_db(self) -> UserInDB:
+        # values come from the database, validation is not needed
+        return UserInDB.model_construct(
+            username=self.username,
+            email=self.email,
+            salary=self.salary,
+            next_promotion_date=self.next_promotion_date,
+            disabled=self.disabled,
+            hashed_password=self.hashed_password,
+        )
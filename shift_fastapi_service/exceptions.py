@@ -10,9 +10,17 @@ class NotUniqueException(DatabaseException):
     pass
 
 
+class RefreshTokenReusedException(DatabaseException):
+    pass
+
+
 class LoggingConfigException(Exception):
     pass
 
 
 class AuthConfigException(Exception):
     pass
+
+
+class HashingPoolBusyException(Exception):
+    pass
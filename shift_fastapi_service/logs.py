@@ -1,14 +1,79 @@
+import atexit
+import copy
+import json
 import logging
 import os
+from datetime import datetime, timezone
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
 from pathlib import Path
+from queue import SimpleQueue
 
+from shift_fastapi_service.config import Settings, get_settings
 from shift_fastapi_service.exceptions import LoggingConfigException
 
 LOG_DIR_NAME = "logs"
 MAIN_LOG_NAME = "main.log"
+TEXT_LOG_FORMAT = "%(asctime)s %(levelname)s:%(name)s:%(message)s"
 
+listener: QueueListener | None = None
+queue_handler: QueueHandler | None = None
 
-def init_logging(log_root: Path = Path(".")) -> None:
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as compact JSON lines.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(
+                record.created, tz=timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    Only the message is rendered on the calling thread, exception
+    tracebacks are formatted by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def init_logging(
+    log_root: Path = Path("."), settings: Settings | None = None
+) -> None:
+    """
+    Set up logging into a rotating file.
+
+    Log records are put into a queue on the calling thread and written
+    by a background thread, so logging doesn't wait for file I/O.
+
+    Args:
+        log_root (Path): Directory to create logs directory in
+        settings (Settings | None): Logging settings, from env by default
+    """
+    global listener, queue_handler
+    if settings is None:
+        settings = get_settings()
     log_dir_path = log_root / LOG_DIR_NAME
     if log_dir_path.exists() and not log_dir_path.is_dir():
         print(
@@ -19,8 +84,84 @@ def init_logging(log_root: Path = Path(".")) -> None:
         )
     elif not log_dir_path.exists():
         create_log_directory(log_dir_path)
-    main_log_path = log_dir_path / MAIN_LOG_NAME
-    logging.basicConfig(filename=main_log_path, level=logging.INFO)
+    main_log_path = log_dir_path / settings.log_file_name
+    stop_logging()
+
+    file_handler = create_file_handler(main_log_path, settings)
+    if settings.log_format == "json":
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_LOG_FORMAT))
+    queue: SimpleQueue[logging.LogRecord] = SimpleQueue()
+    queue_handler = DeferredQueueHandler(queue)
+    listener = QueueListener(queue, file_handler, respect_handler_level=True)
+    listener.start()
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(settings.log_level.upper())
+    root_logger.addHandler(queue_handler)
+    for name, level in get_logger_levels(settings.log_levels).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def stop_logging() -> None:
+    """
+    Write queued records and remove handlers set up by init_logging.
+    """
+    global listener, queue_handler
+    if queue_handler is not None:
+        logging.getLogger().removeHandler(queue_handler)
+        queue_handler = None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+
+
+# Registered once, init_logging may run many times in a process
+atexit.register(stop_logging)
+
+
+def create_file_handler(path: Path, settings: Settings) -> logging.Handler:
+    if settings.log_rotation_when:
+        return TimedRotatingFileHandler(
+            path,
+            when=settings.log_rotation_when,
+            backupCount=settings.log_backup_count,
+            delay=True,
+        )
+    return RotatingFileHandler(
+        path,
+        maxBytes=settings.log_max_bytes,
+        backupCount=settings.log_backup_count,
+        delay=True,
+    )
+
+
+def get_logger_levels(log_levels: str) -> dict[str, str]:
+    """
+    Parse per-logger levels.
+
+    Args:
+        log_levels (str): Comma separated pairs,
+            e.g. "sqlalchemy.engine=WARNING,shift_fastapi_service=DEBUG"
+
+    Raises:
+        LoggingConfigException: Raises if a pair is malformed
+
+    Returns:
+        dict[str, str]: Level by logger name
+    """
+    levels = {}
+    for pair in log_levels.split(","):
+        if not pair.strip():
+            continue
+        name, separator, level = pair.partition("=")
+        if not separator or not name.strip() or not level.strip():
+            raise LoggingConfigException(f"invalid logger level {pair}")
+        levels[name.strip()] = level.strip().upper()
+    return levels
 
 
 def create_log_directory(path: Path) -> None:
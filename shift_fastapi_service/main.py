@@ -1,6 +1,3 @@
-import shift_fastapi_service.auth.views as auth
-import shift_fastapi_service.views as views
-from shift_fastapi_service.app import app
-from shift_fastapi_service.logs import init_logging
+from shift_fastapi_service.app import create_app
 
-init_logging()
+app = create_app()
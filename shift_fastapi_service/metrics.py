@@ -0,0 +1,531 @@
+"""
+In-process metrics exposed in Prometheus text format.
+
+Metrics are recorded from the event loop thread, so counters and
+histograms are updated without locks. Server workers share their
+metrics through a directory, see MetricsDirectory.
+"""
+
+import json
+import os
+import time
+from bisect import bisect_left
+from functools import cache
+from pathlib import Path
+from typing import Any, Iterator, Mapping
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from shift_fastapi_service.config import get_settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+Labels = tuple[str, ...]
+
+
+def format_labels(label_names: Labels, labels: Labels) -> str:
+    if not label_names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label_value(value)}"'
+        for name, value in zip(label_names, labels)
+    )
+    return "{" + pairs + "}"
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+
+    type_name = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Labels = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        yield from self.render_samples()
+
+    def render_samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def clone(self) -> "Metric":
+        # Same metric without values
+        return type(self)(self.name, self.documentation, self.label_names)
+
+    def dump(self) -> list[Any]:
+        raise NotImplementedError
+
+    def merge(self, samples: list[Any]) -> None:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Monotonic counter with a value for every set of labels.
+    """
+
+    type_name = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Labels = ()
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0.0)
+
+    def dump(self) -> list[Any]:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, samples: list[Any]) -> None:
+        for labels, value in samples:
+            self.inc(*labels, amount=value)
+
+    def render_samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield (
+                f"{self.name}{format_labels(self.label_names, labels)} "
+                f"{format_value(value)}"
+            )
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, e.g. number of requests in flight.
+    """
+
+    type_name = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+
+class HistogramSeries:
+    """
+    Bucket counts of one set of labels.
+
+    Counts are kept per bucket and made cumulative on render,
+    so an observation increments a single preallocated slot.
+    Code on hot paths keeps the series of its labels, see
+    Histogram.labels, and observes it directly.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(Metric):
+    """
+    Histogram with fixed upper bounds of buckets.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Labels = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.series: dict[Labels, HistogramSeries] = {}
+
+    def get_series(self, labels: Labels) -> HistogramSeries:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = HistogramSeries(self.buckets)
+        return series
+
+    def labels(self, *labels: str) -> HistogramSeries:
+        return self.get_series(labels)
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.get_series(labels).observe(value)
+
+    def get(self, *labels: str) -> HistogramSeries | None:
+        return self.series.get(labels)
+
+    def clone(self) -> "Histogram":
+        return Histogram(
+            self.name, self.documentation, self.label_names, self.buckets
+        )
+
+    def dump(self) -> list[Any]:
+        return [
+            [list(labels), series.counts, series.sum, series.count]
+            for labels, series in self.series.items()
+        ]
+
+    def merge(self, samples: list[Any]) -> None:
+        for labels, counts, total, count in samples:
+            series = self.get_series(tuple(labels))
+            series.counts = [a + b for a, b in zip(series.counts, counts)]
+            series.sum += total
+            series.count += count
+
+    def render_samples(self) -> Iterator[str]:
+        bucket_label_names = self.label_names + ("le",)
+        for labels, series in self.series.items():
+            cumulative = 0
+            bounds = self.buckets + (float("inf"),)
+            for bound, count in zip(bounds, series.counts):
+                cumulative += count
+                bucket_labels = format_labels(
+                    bucket_label_names, labels + (format_value(bound),)
+                )
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            series_labels = format_labels(self.label_names, labels)
+            yield f"{self.name}_sum{series_labels} {format_value(series.sum)}"
+            yield f"{self.name}_count{series_labels} {series.count}"
+
+
+class Registry:
+    """
+    Collection of metrics rendered together.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: Labels = ()
+    ) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Labels = ()
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Labels = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(
+            Histogram(name, documentation, label_names, buckets)
+        )
+
+    def render(self) -> str:
+        """
+        Render all metrics in Prometheus text format.
+
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clone(self) -> "Registry":
+        # Same metrics without values
+        registry = Registry()
+        for metric in self.metrics.values():
+            registry.register(metric.clone())
+        return registry
+
+    def dump(self) -> dict[str, list[Any]]:
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def merge(
+        self, dump: Mapping[str, list[Any]], gauges: bool = True
+    ) -> None:
+        """
+        Add values of a dump of a registry with the same metrics.
+
+        Args:
+            dump (Mapping[str, list[Any]]): Result of dump
+            gauges (bool): Whether to add values of gauges
+        """
+        for name, samples in dump.items():
+            metric = self.metrics.get(name)
+            if metric is None or (not gauges and isinstance(metric, Gauge)):
+                continue
+            metric.merge(samples)
+
+
+class MetricsDirectory:
+    """
+    Metrics of server workers summed through a directory.
+
+    Every worker writes a dump of its registry to <pid>.json, metrics
+    rendered by any worker are the sum of the files. The supervisor
+    adds counters and histograms of an exited worker to retired.json,
+    together with its pid, and then deletes its file, so totals don't
+    drop when workers are replaced; gauges of exited workers are dropped.
+    Files are replaced atomically. A reader lists files before reading
+    retired.json, so a file it lists is either in retired.json or was
+    deleted after it, and then it reads again.
+    """
+
+    RETIRED = "retired"
+
+    def __init__(self, path: str | Path, registry: Registry) -> None:
+        self.path = Path(path)
+        self.registry = registry
+
+    def get_file(self, name: str | int) -> Path:
+        return self.path / f"{name}.json"
+
+    def read(self, name: str | int) -> dict[str, Any]:
+        return json.loads(self.get_file(name).read_text())
+
+    def write_file(self, name: str | int, data: dict[str, Any]) -> None:
+        file = self.get_file(name)
+        temporary = file.with_suffix(".tmp")
+        temporary.write_text(json.dumps(data))
+        os.replace(temporary, file)
+
+    def write(self) -> None:
+        self.write_file(os.getpid(), self.registry.dump())
+
+    def clear(self) -> None:
+        # Files of a previous run
+        self.path.mkdir(parents=True, exist_ok=True)
+        for file in self.path.glob("*.json"):
+            file.unlink()
+
+    def retire(self, pid: int) -> None:
+        """
+        Move metrics of an exited worker into retired.json.
+
+        Called by the supervisor only, so retired.json has one writer.
+
+        Args:
+            pid (int): Process id of the worker
+        """
+        try:
+            dump = self.read(pid)
+        except FileNotFoundError:
+            return
+        retired = self.registry.clone()
+        try:
+            retired.merge(self.read(self.RETIRED)["metrics"])
+        except FileNotFoundError:
+            pass
+        retired.merge(dump, gauges=False)
+        self.write_file(
+            self.RETIRED, {"pids": [pid], "metrics": retired.dump()}
+        )
+        self.get_file(pid).unlink()
+
+    def collect(self, attempts: int = 10) -> Registry:
+        """
+        Sum metrics of all workers.
+
+        Args:
+            attempts (int): Reads to try while workers are retired
+
+        Returns:
+            Registry: Registry with the sums
+        """
+        for _ in range(attempts - 1):
+            try:
+                return self.read_all()
+            except FileNotFoundError:
+                continue
+        return self.read_all()
+
+    def read_all(self) -> Registry:
+        names = [file.stem for file in self.path.glob("*.json")]
+        registry = self.registry.clone()
+        retired_pids = []
+        if self.RETIRED in names:
+            retired = self.read(self.RETIRED)
+            retired_pids = [str(pid) for pid in retired["pids"]]
+            registry.merge(retired["metrics"])
+        for name in names:
+            if name != self.RETIRED and name not in retired_pids:
+                registry.merge(self.read(name))
+        return registry
+
+
+registry = Registry()
+
+http_requests_total = registry.counter(
+    "http_requests_total",
+    "Number of HTTP requests.",
+    ("method", "route", "status"),
+)
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "Number of HTTP requests being served."
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests.",
+    ("method", "route"),
+)
+auth_tokens_issued_total = registry.counter(
+    "auth_tokens_issued_total", "Number of issued access tokens."
+)
+auth_logins_throttled_total = registry.counter(
+    "auth_logins_throttled_total",
+    "Number of login attempts rejected by the throttle.",
+    ("key",),
+)
+auth_password_verify_seconds = registry.histogram(
+    "auth_password_verify_seconds",
+    "Time to verify a password, including waiting for the hashing pool.",
+).labels()
+auth_jwt_failures_total = registry.counter(
+    "auth_jwt_failures_total",
+    "Number of rejected access tokens.",
+    ("reason",),
+)
+auth_password_rehashes_total = registry.counter(
+    "auth_password_rehashes_total",
+    "Number of password hashes upgraded to the current bcrypt cost.",
+)
+auth_refresh_tokens_reused_total = registry.counter(
+    "auth_refresh_tokens_reused_total",
+    "Number of reused refresh tokens, each revokes its family.",
+)
+auth_stale_claims_total = registry.counter(
+    "auth_stale_claims_total",
+    "Number of tokens whose claims were older than the user row.",
+)
+database_reads_total = registry.counter(
+    "database_reads_total",
+    "Number of repository reads by the engine that served them.",
+    ("target",),
+)
+database_replica_failures_total = registry.counter(
+    "database_replica_failures_total",
+    "Number of failed replica connections, each falls back to primary.",
+)
+auth_user_lookup_misses_total = registry.counter(
+    "auth_user_lookup_misses_total",
+    "Number of authentication lookups of users that don't exist.",
+)
+
+
+@cache
+def get_metrics_directory() -> MetricsDirectory | None:
+    metrics_dir = get_settings().metrics_dir
+    if not metrics_dir:
+        return None
+    return MetricsDirectory(metrics_dir, registry)
+
+
+def render_metrics() -> str:
+    """
+    Render metrics of this process, or of all workers with METRICS_DIR.
+
+    Returns:
+        str: Exposition text
+    """
+    directory = get_metrics_directory()
+    if directory is None:
+        return registry.render()
+    directory.write()
+    return directory.collect().render()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording count, status and latency of requests.
+
+    Requests are labeled with the path template of the matched route,
+    which the router puts into the scope, so path parameters don't
+    create new series.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        # Latency series by route and method, bound on first request
+        self.durations: dict[str, dict[str, HistogramSeries]] = {}
+
+    def get_duration(self, method: str, path: str) -> HistogramSeries:
+        methods = self.durations.get(path)
+        if methods is None:
+            methods = self.durations[path] = {}
+        series = methods.get(method)
+        if series is None:
+            series = methods[method] = http_request_duration_seconds.labels(
+                method, path
+            )
+        return series
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            path = getattr(route, "path_format", UNMATCHED_ROUTE)
+            method = scope["method"]
+            self.get_duration(method, path).observe(duration)
+            http_requests_total.inc(method, path, str(status_code))
@@ -0,0 +1,223 @@
+"""
+Versioned migrations of the database schema.
+
+Versions applied to a database are recorded in schema_migration,
+migrate applies the pending ones in order. Migrations can be repeated
+after a failure: the sqlite3 driver runs DDL outside of transactions,
+so a failed migration may be half applied. Databases created before
+migrations have no versions recorded, every migration is written
+to work on them as well as on empty databases.
+
+Run to migrate DATABASE_URL and shards of DATABASE_SHARDS:
+    python -m shift_fastapi_service.migrations
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    insert,
+    inspect,
+    select,
+)
+from sqlalchemy.schema import CreateTable
+
+from shift_fastapi_service.config import get_settings
+from shift_fastapi_service.database import create_database_engine
+from shift_fastapi_service.exceptions import DatabaseException
+from shift_fastapi_service.models import (
+    Base,
+    IdSequence,
+    LoginBucket,
+    User,
+)
+
+logger = logging.getLogger(__name__)
+
+schema_migration = Table(
+    "schema_migration",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def create_tables(connection: Connection) -> None:
+    # Tables that already exist, with their indexes, are left as they are
+    Base.metadata.create_all(connection)
+
+
+def add_missing_columns(connection: Connection) -> None:
+    """
+    Add columns of models that existing tables don't have yet.
+
+    Args:
+        connection (Connection): Connection in a transaction
+
+    Raises:
+        DatabaseException: Raises if a missing column has no server default
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {
+            column["name"] for column in inspector.get_columns(table.name)
+        }
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if column.server_default is None:
+                raise DatabaseException(
+                    f"column {table.name}.{column.name} has no server default"
+                )
+            column_type = column.type.compile(connection.dialect)
+            not_null = "" if column.nullable else " NOT NULL"
+            logger.info(f"adding column {table.name}.{column.name}")
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                f"{column_type}{not_null} "
+                f"DEFAULT {column.server_default.arg}"
+            )
+
+
+def rebuild_sqlite_table(connection: Connection, table: Table) -> None:
+    """
+    Recreate a SQLite table from its model, keeping its rows.
+
+    SQLite can't drop constraints, so the table is copied into a new
+    one created from the model, which then replaces it. Indexes of the
+    old table are dropped with it.
+
+    Args:
+        connection (Connection): Connection in a transaction
+        table (Table): Table of a model, with all columns in the database
+    """
+    new_table = table.to_metadata(MetaData(), name=f"{table.name}_new")
+    # Left by a failed rebuild
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {new_table.name}")
+    connection.execute(CreateTable(new_table))
+    columns = ", ".join(column.name for column in table.columns)
+    connection.exec_driver_sql(
+        f"INSERT INTO {new_table.name} ({columns}) "
+        f"SELECT {columns} FROM {table.name}"
+    )
+    connection.exec_driver_sql(f"DROP TABLE {table.name}")
+    connection.exec_driver_sql(
+        f"ALTER TABLE {new_table.name} RENAME TO {table.name}"
+    )
+
+
+def create_user_indexes(connection: Connection) -> None:
+    """
+    Replace unique constraints of user_account with the indexes of User.
+
+    Args:
+        connection (Connection): Connection in a transaction
+    """
+    table = User.__table__
+    if connection.dialect.name == "sqlite":
+        # The inspector misses UNIQUE of column definitions, SQLite
+        # lists indexes of both kinds of constraints with origin "u"
+        origins = {
+            index["origin"]
+            for index in connection.exec_driver_sql(
+                f"PRAGMA index_list({table.name})"
+            ).mappings()
+        }
+        if "u" in origins:
+            logger.info(f"rebuilding {table.name} without unique constraints")
+            rebuild_sqlite_table(connection, table)
+    else:
+        constraints = inspect(connection).get_unique_constraints(table.name)
+        preparer = connection.dialect.identifier_preparer
+        for constraint in constraints:
+            logger.info(f"dropping constraint {constraint['name']}")
+            connection.exec_driver_sql(
+                f"ALTER TABLE {preparer.quote(table.name)} "
+                f"DROP CONSTRAINT {preparer.quote(constraint['name'])}"
+            )
+    # Indexes of other dialects are skipped by their ddl_if
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def create_login_buckets(connection: Connection) -> None:
+    # Databases created since the model exists have it from create_tables
+    LoginBucket.__table__.create(connection, checkfirst=True)
+
+
+def create_id_sequences(connection: Connection) -> None:
+    IdSequence.__table__.create(connection, checkfirst=True)
+
+
+MIGRATIONS: tuple[tuple[int, str, Callable[[Connection], None]], ...] = (
+    (1, "create tables", create_tables),
+    (2, "add columns missing in old tables", add_missing_columns),
+    (3, "covering and unique indexes of user_account", create_user_indexes),
+    (4, "login_bucket table", create_login_buckets),
+    (5, "id_sequence table", create_id_sequences),
+)
+
+
+def get_applied_versions(connection: Connection) -> set[int]:
+    schema_migration.create(connection, checkfirst=True)
+    return set(connection.scalars(select(schema_migration.c.version)))
+
+
+def migrate(connection: Connection) -> list[int]:
+    """
+    Apply migrations that weren't applied to the database yet.
+
+    Args:
+        connection (Connection): Connection in a transaction
+
+    Returns:
+        list[int]: Applied versions
+    """
+    applied = get_applied_versions(connection)
+    versions = []
+    for version, description, apply in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"applying migration {version}: {description}")
+        apply(connection)
+        connection.execute(
+            insert(schema_migration),
+            {
+                "version": version,
+                "description": description,
+                "applied_at": datetime.now(timezone.utc),
+            },
+        )
+        versions.append(version)
+    return versions
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    settings = get_settings()
+    urls = [settings.database_url, *settings.get_database_shards().values()]
+    for url in urls:
+        engine = create_database_engine(
+            settings.model_copy(update={"database_url": url})
+        )
+        try:
+            with engine.begin() as connection:
+                versions = migrate(connection)
+        finally:
+            engine.dispose()
+        print(f"{engine.url!r}: applied {versions or 'nothing'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
-from datetime import date
+from datetime import date, datetime
 
-from sqlalchemy import Boolean, Date, Integer, String
+from sqlalchemy import (
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    String,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -8,16 +17,61 @@ class Base(DeclarativeBase):
     pass
 
 
+# Columns of User besides username read by authentication lookups,
+# the fields of Principal
+AUTH_COLUMNS: tuple[str, ...] = (
+    "version",
+    "disabled",
+    "hashed_password",
+    "email",
+    "salary",
+    "next_promotion_date",
+)
+
+
 class User(Base):
+    """
+    User account.
+
+    Lookups by username read AUTH_COLUMNS from a covering index: on
+    PostgreSQL the unique index of username includes them, on SQLite
+    a separate index has them. The unique index of username is partial
+    on SQLite, since its planner takes a unique index covering the
+    whole WHERE clause without considering other indexes.
+    """
+
     __tablename__ = "user_account"
+    __table_args__ = (
+        Index(
+            "ix_user_account_username",
+            "username",
+            unique=True,
+            sqlite_where=text("username IS NOT NULL"),
+            postgresql_include=list(AUTH_COLUMNS),
+        ),
+        Index(
+            "ix_user_account_username_auth", "username", *AUTH_COLUMNS
+        ).ddl_if(dialect="sqlite"),
+        Index("ix_user_account_email", "email", unique=True),
+        Index("ix_user_account_salary_id", "salary", "id"),
+        Index(
+            "ix_user_account_next_promotion_date_id",
+            "next_promotion_date",
+            "id",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    username: Mapped[str] = mapped_column(String(50), unique=True)
-    email: Mapped[str] = mapped_column(String(50), unique=True)
+    username: Mapped[str] = mapped_column(String(50))
+    email: Mapped[str] = mapped_column(String(50))
     salary: Mapped[int] = mapped_column(Integer())
     next_promotion_date: Mapped[date] = mapped_column(Date())
     disabled: Mapped[bool] = mapped_column(Boolean, default=False)
     hashed_password: Mapped[str] = mapped_column(String)
+    # incremented by every write of the row
+    version: Mapped[int] = mapped_column(
+        Integer(), default=1, server_default="1"
+    )
 
     def __repr__(self) -> str:
         return f"User(name={self.username!r}, id={self.email!r}, )"
@@ -31,3 +85,54 @@ class User(Base):
             "disabled": self.disabled,
             "hashed_password": self.hashed_password,
         }
+
+
+class RefreshToken(Base):
+    """
+    Refresh token, stored as SHA-256 digest of the opaque token.
+
+    Tokens issued by rotation share the family of the token issued
+    at login. used_at is set when a token is rotated.
+    """
+
+    __tablename__ = "refresh_token"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    token_hash: Mapped[str] = mapped_column(String(64), unique=True)
+    family_id: Mapped[str] = mapped_column(String(32), index=True)
+    username: Mapped[str] = mapped_column(String(50), index=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime())
+    used_at: Mapped[datetime | None] = mapped_column(DateTime())
+    revoked: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+class LoginBucket(Base):
+    """
+    Token bucket of the login throttle shared by server workers.
+
+    name is the limiter, "client" or "username", key is the client
+    address or username. Times are in seconds since the epoch,
+    retry_after is the answer to the last attempt.
+    """
+
+    __tablename__ = "login_bucket"
+    __table_args__ = (
+        Index("ix_login_bucket_name_updated_at", "name", "updated_at"),
+    )
+
+    name: Mapped[str] = mapped_column(String(16), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float())
+    updated_at: Mapped[float] = mapped_column(Float())
+    retry_after: Mapped[float] = mapped_column(Float(), default=0.0)
+
+
+class IdSequence(Base):
+    """
+    Last allocated id of a sequence, e.g. of users of all shards.
+    """
+
+    __tablename__ = "id_sequence"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    last_id: Mapped[int] = mapped_column(Integer())
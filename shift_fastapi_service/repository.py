@@ -1,49 +1,458 @@
+import asyncio
+import heapq
 import logging
-from datetime import date
+from datetime import date, datetime
+from functools import cache
+from typing import Mapping, Sequence
 
-from passlib.context import CryptContext
-from sqlalchemy import create_engine, select
+from sqlalchemy import (
+    Connection,
+    Date,
+    Engine,
+    Float,
+    Row,
+    Select,
+    bindparam,
+    case,
+    delete,
+    func,
+    Delete,
+    Update,
+    insert,
+    or_,
+    select,
+    tuple_,
+    update,
+)
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import InstrumentedAttribute, Session
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlalchemy.sql.functions import FunctionElement
 
+from shift_fastapi_service.auth.hashing import get_password_hash
+from shift_fastapi_service.cache import get_principal_cache
+from shift_fastapi_service.database import (
+    EngineRouter,
+    get_engine,
+    get_engine_router,
+    get_shard_routers,
+)
+from shift_fastapi_service.domain import (
+    UserFilter,
+    UserUpdate,
+    UserUpdateResult,
+)
 from shift_fastapi_service.exceptions import (
     DatabaseException,
     DataNotFoundException,
     NotUniqueException,
+    RefreshTokenReusedException,
 )
-from shift_fastapi_service.models import Base, User
-
-engine = create_engine("sqlite+pysqlite:///sqlite3.db", echo=True)
+from shift_fastapi_service.config import get_settings
+from shift_fastapi_service.migrations import migrate
+from shift_fastapi_service.models import (
+    IdSequence,
+    LoginBucket,
+    RefreshToken,
+    User,
+)
+from shift_fastapi_service.sharding import get_hash_ring
 
 logger = logging.getLogger(__name__)
 
+# SQLite allows 32766 bound parameters in a statement
+SELECT_CHUNK_SIZE = 10_000
+
+# Sequence of ids of users of all shards in the main database
+USER_ID_SEQUENCE = "user_account"
+
+USER_FIELDS: tuple[str, ...] = (
+    "username",
+    "email",
+    "salary",
+    "next_promotion_date",
+    "disabled",
+)
+
+
+def get_fake_users() -> list[User]:
+    alice = User(
+        username="alice",
+        email="alice@example.com",
+        salary=10,
+        next_promotion_date=date(year=2025, month=12, day=12),
+        disabled=False,
+        hashed_password=get_password_hash("alice12345"),
+    )
+    return [alice]
+
+
+def user_from_dict(user: dict) -> User:
+    return User(
+        id=user.get("id"),
+        username=user.get("username"),
+        email=user.get("email"),
+        salary=user.get("salary"),
+        next_promotion_date=user.get("next_promotion_date"),
+        disabled=user.get("disabled"),
+        hashed_password=user.get("hashed_password"),
+    )
+
+
+def create_schema(connection: Connection) -> None:
+    migrate(connection)
+
+
+def invalidate_principals(usernames: list[str]) -> None:
+    principal_cache = get_principal_cache()
+    for username in usernames:
+        principal_cache.invalidate(username)
+
+
+@cache
+def get_user_columns_stmt(fields: tuple[str, ...]) -> Select:
+    """
+    Get statement selecting fields of the user with bound username.
+
+    Statements are built once per fields and reused, so SQLAlchemy
+    finds their compiled form in the compiled cache of the engine.
+
+    Args:
+        fields (tuple[str, ...]): Names of columns of User
+
+    Returns:
+        Select: Statement with "username" bound parameter
+    """
+    columns = [getattr(User, field) for field in fields]
+    return select(*columns).where(User.username == bindparam("username"))
+
+
+@cache
+def get_user_by_id_stmt() -> Select:
+    return select(User).where(User.id == bindparam("user_id"))
+
+
+@cache
+def get_user_by_username_stmt() -> Select:
+    return select(User).where(User.username == bindparam("username"))
+
+
+class unindexed(FunctionElement):
+    """
+    Column the SQLite planner must not search by an index.
+
+    Rendered as "+column" on SQLite, which is the same value but can't
+    use an index, and as the bare column elsewhere.
+    """
+
+    inherit_cache = True
+
+    def __init__(self, column: InstrumentedAttribute) -> None:
+        super().__init__(column)
+        self.type = column.type
+
+
+@compiles(unindexed)
+def compile_unindexed(element: unindexed, compiler: SQLCompiler, **kw) -> str:
+    return compiler.process(element.clauses, **kw)
+
+
+@compiles(unindexed, "sqlite")
+def compile_unindexed_sqlite(
+    element: unindexed, compiler: SQLCompiler, **kw
+) -> str:
+    return f"+{compiler.process(element.clauses, **kw)}"
+
+
+def get_page_order(user_filter: UserFilter) -> tuple[str, ...]:
+    """
+    Get names of columns pages of users are ordered by.
+
+    A range filter is served by its (column, id) index, so pages follow
+    that index and are never sorted, whatever the size of the range.
+
+    Args:
+        user_filter (UserFilter): Salary and promotion date ranges
+
+    Returns:
+        tuple[str, ...]: Column names, the last one is "id"
+    """
+    if user_filter.salary_min is not None or (
+        user_filter.salary_max is not None
+    ):
+        return ("salary", "id")
+    if user_filter.promotion_from is not None or (
+        user_filter.promotion_to is not None
+    ):
+        return ("next_promotion_date", "id")
+    return ("id",)
+
+
+def list_users_stmt(
+    fields: Sequence[str],
+    user_filter: UserFilter,
+    after: tuple | None,
+    limit: int,
+) -> Select:
+    order_names = get_page_order(user_filter)
+    order = [getattr(User, name) for name in order_names]
+    names = dict.fromkeys(("id", *order_names, *fields))
+    stmt = (
+        select(*(getattr(User, name) for name in names))
+        .order_by(*order)
+        .limit(limit)
+    )
+    if len(order) == 1:
+        # The first page too is a search of the primary key from id 0,
+        # so every page has the same plan
+        stmt = stmt.where(User.id > (after[0] if after else 0))
+    elif after is not None:
+        stmt = stmt.where(tuple_(*order) > tuple_(*after))
+    if user_filter.salary_min is not None:
+        stmt = stmt.where(User.salary >= user_filter.salary_min)
+    if user_filter.salary_max is not None:
+        stmt = stmt.where(User.salary <= user_filter.salary_max)
+    # Pages ordered by salary are filtered by promotion date row by row,
+    # SQLite would rather search its index and sort the whole range
+    promotion_date = User.next_promotion_date
+    if order_names[0] != "next_promotion_date":
+        promotion_date = unindexed(promotion_date)
+    if user_filter.promotion_from is not None:
+        stmt = stmt.where(promotion_date >= user_filter.promotion_from)
+    if user_filter.promotion_to is not None:
+        stmt = stmt.where(promotion_date <= user_filter.promotion_to)
+    return stmt
+
+
+def existing_usernames_stmt(usernames: list[str]) -> Select:
+    return select(User.username).where(User.username.in_(usernames))
+
+
+def conflicting_users_stmt(usernames: list[str], emails: list[str]) -> Select:
+    return select(User.username, User.email).where(
+        or_(User.username.in_(usernames), User.email.in_(emails))
+    )
+
+
+@cache
+def update_users_stmt() -> Update:
+    """
+    Get executemany statement updating users with "b_" bound parameters.
+
+    Returns:
+        Update: Statement with "b_username", "b_salary"
+            and "b_next_promotion_date" bound parameters
+    """
+    table = User.__table__
+    return (
+        update(table)
+        .where(table.c.username == bindparam("b_username"))
+        .values(
+            salary=func.coalesce(bindparam("b_salary"), table.c.salary),
+            next_promotion_date=func.coalesce(
+                bindparam("b_next_promotion_date", type_=Date()),
+                table.c.next_promotion_date,
+            ),
+            version=table.c.version + 1,
+        )
+    )
+
+
+@cache
+def update_password_hash_stmt() -> Update:
+    table = User.__table__
+    return (
+        update(table)
+        .where(table.c.username == bindparam("b_username"))
+        .values(hashed_password=bindparam("b_hashed_password"))
+    )
+
+
+@cache
+def delete_expired_refresh_tokens_stmt() -> Delete:
+    return delete(RefreshToken).where(
+        RefreshToken.username == bindparam("username"),
+        RefreshToken.expires_at <= bindparam("now"),
+    )
+
+
+@cache
+def get_refresh_token_stmt() -> Select:
+    table = RefreshToken.__table__
+    return select(
+        table.c.family_id,
+        table.c.username,
+        table.c.expires_at,
+        table.c.revoked,
+    ).where(table.c.token_hash == bindparam("token_hash"))
+
+
+@cache
+def use_refresh_token_stmt() -> Update:
+    table = RefreshToken.__table__
+    return (
+        update(table)
+        .where(
+            table.c.token_hash == bindparam("b_token_hash"),
+            table.c.used_at.is_(None),
+        )
+        .values(used_at=bindparam("b_now"))
+    )
+
+
+@cache
+def revoke_refresh_token_family_stmt() -> Update:
+    table = RefreshToken.__table__
+    return (
+        update(table)
+        .where(table.c.family_id == bindparam("b_family_id"))
+        .values(revoked=True)
+    )
+
+
+@cache
+def take_login_token_stmt() -> Update:
+    """
+    Build UPDATE taking a token from a login bucket.
+
+    The bucket is refilled for the time since its last update and
+    a token is taken if it has one, in a single statement, so
+    concurrent attempts don't read the same tokens.
+
+    Returns:
+        Update: Statement returning seconds until the bucket
+            has a token, 0 if a token was taken
+    """
+    table = LoginBucket.__table__
+    now = bindparam("b_now", type_=Float)
+    rate = bindparam("b_rate", type_=Float)
+    burst = bindparam("b_burst", type_=Float)
+    elapsed = case(
+        (now > table.c.updated_at, now - table.c.updated_at), else_=0.0
+    )
+    refilled = table.c.tokens + elapsed * rate
+    tokens = case((refilled > burst, burst), else_=refilled)
+    return (
+        update(table)
+        .where(
+            table.c.name == bindparam("b_name"),
+            table.c.key == bindparam("b_key"),
+        )
+        .values(
+            tokens=case((tokens >= 1, tokens - 1), else_=tokens),
+            updated_at=now,
+            retry_after=case((tokens >= 1, 0.0), else_=(1 - tokens) / rate),
+        )
+        .returning(table.c.retry_after)
+    )
+
+
+@cache
+def allocate_ids_stmt() -> Update:
+    table = IdSequence.__table__
+    return (
+        update(table)
+        .where(table.c.name == bindparam("b_name"))
+        .values(last_id=table.c.last_id + bindparam("b_count"))
+        .returning(table.c.last_id)
+    )
+
+
+@cache
+def delete_idle_login_buckets_stmt() -> Delete:
+    return delete(LoginBucket).where(
+        LoginBucket.name == bindparam("name"),
+        LoginBucket.updated_at <= bindparam("before"),
+    )
+
+
+def update_users(
+    session: Session, updates: list[UserUpdate]
+) -> list[UserUpdateResult]:
+    """
+    Update salaries and next promotion dates of users in session.
+
+    Every update is applied by one executemany UPDATE statement,
+    fields left None keep their value and versions of updated users
+    are incremented. The caller commits the session.
+
+    Args:
+        session (Session): Session to update users in
+        updates (list[UserUpdate]): Changes of users
+
+    Returns:
+        list[UserUpdateResult]: Results in the order of updates
+    """
+    usernames = [user_update.username for user_update in updates]
+    existing: set[str] = set()
+    for start in range(0, len(usernames), SELECT_CHUNK_SIZE):
+        stmt = existing_usernames_stmt(
+            usernames[start : start + SELECT_CHUNK_SIZE]
+        )
+        existing.update(session.scalars(stmt))
+    results: list[UserUpdateResult] = []
+    params: list[dict] = []
+    seen: set[str] = set()
+    for user_update in updates:
+        username = user_update.username
+        if username not in existing:
+            detail = "user not found"
+        elif username in seen:
+            detail = "duplicate username in batch"
+        else:
+            detail = None
+            seen.add(username)
+            params.append(
+                {
+                    "b_username": username,
+                    "b_salary": user_update.salary,
+                    "b_next_promotion_date": user_update.next_promotion_date,
+                }
+            )
+        results.append(
+            UserUpdateResult(
+                username=username, updated=detail is None, detail=detail
+            )
+        )
+    if params:
+        session.execute(update_users_stmt(), params)
+    return results
+
 
 class Repository:
+    """
+    Repository of users.
+
+    Every method that changes a user must invalidate the user
+    in the principal cache after commit.
+    """
+
+    def __init__(self, engine: Engine | None = None) -> None:
+        self.engine: Engine = engine or get_engine()
 
     def generate_schema(self) -> None:
         try:
-            Base.metadata.create_all(engine)
+            with self.engine.begin() as connection:
+                create_schema(connection)
         except Exception as e:
             logger.critical("Can't create database schema", exc_info=True)
             raise DatabaseException from e
 
     def create_fake_data(self) -> None:
-        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-        with Session(engine) as session:
-            alice = User(
-                username="alice",
-                email="alice@example.com",
-                salary=10,
-                next_promotion_date=date(year=2025, month=12, day=12),
-                disabled=False,
-                hashed_password=pwd_context.hash("alice12345"),
-            )
-            session.add_all([alice])
+        with Session(self.engine) as session:
+            users = get_fake_users()
+            usernames = [user.username for user in users]
+            emails = [user.email for user in users]
+            session.add_all(users)
             try:
                 session.commit()
+                invalidate_principals(usernames)
             except IntegrityError:
                 logger.info(
-                    f"user {alice.username} or user with email {alice.email} already exists"
+                    f"users {usernames} or users with emails {emails} "
+                    "already exist"
                 )
                 raise NotUniqueException
             except Exception as e:
@@ -53,43 +462,727 @@ class Repository:
                 raise DatabaseException from e
 
     def get_user_by_id(self, user_id: int) -> dict:
-        with Session(engine) as session:
-            stmt = select(User).where(User.id == user_id)
-            user = session.scalars(stmt).first()
+        with Session(self.engine) as session:
+            user = session.scalars(
+                get_user_by_id_stmt(), {"user_id": user_id}
+            ).first()
             if user is None:
                 logger.info(f"not found user with id: {user_id}")
                 raise DataNotFoundException
             return user.to_dict()
 
     def get_user_by_username(self, username: str) -> dict:
-        with Session(engine) as session:
-            stmt = select(User).where(User.username == username)
-            user: User | None = session.scalars(stmt).first()
+        with Session(self.engine) as session:
+            user: User | None = session.scalars(
+                get_user_by_username_stmt(), {"username": username}
+            ).first()
             if user is None:
                 logger.info(f"not found user with username: {username}")
                 raise DataNotFoundException
             return user.to_dict()
 
+    def get_user_columns(self, username: str, fields: tuple[str, ...]) -> Row:
+        """
+        Get only the given columns of a user as a Core row.
+
+        Args:
+            username (str): Username
+            fields (tuple[str, ...]): Names of columns of User
+
+        Raises:
+            DataNotFoundException: Raises if user doesn't exist
+
+        Returns:
+            Row: Values of fields in the order of fields
+        """
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                get_user_columns_stmt(fields), {"username": username}
+            ).first()
+        if row is None:
+            logger.info(f"not found user with username: {username}")
+            raise DataNotFoundException
+        return row
+
     def create_user(self, user: dict) -> None:
-        with Session(engine) as session:
-            user_in_db = User(
-                username=user.get("username"),
-                email=user.get("email"),
-                salary=user.get("salary"),
-                next_promotion_date=user.get("next_promotion_date"),
-                disabled=user.get("disabled"),
-                hashed_password=user.get("hashed_password"),
-            )
+        with Session(self.engine) as session:
+            user_in_db = user_from_dict(user)
+            username, email = user_in_db.username, user_in_db.email
             try:
                 session.add(user_in_db)
                 session.flush()
                 session.commit()
+                invalidate_principals([username])
+            except IntegrityError:
+                logger.info(
+                    f"user {username} or user with email {email} "
+                    "already exists"
+                )
+                raise NotUniqueException
+
+    def update_users(
+        self, updates: list[UserUpdate]
+    ) -> list[UserUpdateResult]:
+        """
+        Update salaries and next promotion dates in one transaction.
+
+        Args:
+            updates (list[UserUpdate]): Changes of users
+
+        Returns:
+            list[UserUpdateResult]: Results in the order of updates
+        """
+        with Session(self.engine) as session:
+            results = update_users(session, updates)
+            session.commit()
+        invalidate_principals(
+            [result.username for result in results if result.updated]
+        )
+        return results
+
+
+class AsyncRepository:
+    """
+    Repository for use from async code.
+
+    Has the same methods and exceptions as Repository, but doesn't block
+    the event loop while waiting for the database.
+    Reads of users go through the router, which may send them
+    to a replica, everything else goes to the primary engine.
+    Every method that changes users must call written with them after
+    commit, which also pins them to the primary.
+    """
+
+    def __init__(
+        self, engine: AsyncEngine | EngineRouter | None = None
+    ) -> None:
+        if engine is None:
+            engine = get_engine_router()
+        elif isinstance(engine, AsyncEngine):
+            engine = EngineRouter(engine)
+        self.router: EngineRouter = engine
+        self.engine: AsyncEngine = engine.primary
+
+    def written(self, usernames: list[str]) -> None:
+        invalidate_principals(usernames)
+        self.router.pin(usernames)
+
+    async def generate_schema(self) -> None:
+        try:
+            async with self.engine.begin() as connection:
+                await connection.run_sync(create_schema)
+        except Exception as e:
+            logger.critical("Can't create database schema", exc_info=True)
+            raise DatabaseException from e
+
+    async def create_fake_data(self) -> None:
+        async with AsyncSession(self.engine) as session:
+            users = get_fake_users()
+            usernames = [user.username for user in users]
+            emails = [user.email for user in users]
+            session.add_all(users)
+            try:
+                await session.commit()
+                self.written(usernames)
+            except IntegrityError:
+                logger.info(
+                    f"users {usernames} or users with emails {emails} "
+                    "already exist"
+                )
+                raise NotUniqueException
+            except Exception as e:
+                logger.critical(
+                    "can't commit changes into database", exc_info=True
+                )
+                raise DatabaseException from e
+
+    async def get_user_by_id(self, user_id: int) -> dict:
+        async with (
+            self.router.connect_reader() as connection,
+            AsyncSession(connection) as session,
+        ):
+            result = await session.scalars(
+                get_user_by_id_stmt(), {"user_id": user_id}
+            )
+            user = result.first()
+            if user is None:
+                logger.info(f"not found user with id: {user_id}")
+                raise DataNotFoundException
+            return user.to_dict()
+
+    async def get_user_by_username(self, username: str) -> dict:
+        async with (
+            self.router.connect_reader(username) as connection,
+            AsyncSession(connection) as session,
+        ):
+            result = await session.scalars(
+                get_user_by_username_stmt(), {"username": username}
+            )
+            user: User | None = result.first()
+            if user is None:
+                logger.info(f"not found user with username: {username}")
+                raise DataNotFoundException
+            return user.to_dict()
+
+    async def get_user_columns(
+        self, username: str, fields: tuple[str, ...]
+    ) -> Row:
+        """
+        Get only the given columns of a user as a Core row.
+
+        Args:
+            username (str): Username
+            fields (tuple[str, ...]): Names of columns of User
+
+        Raises:
+            DataNotFoundException: Raises if user doesn't exist
+
+        Returns:
+            Row: Values of fields in the order of fields
+        """
+        async with self.router.connect_reader(username) as connection:
+            result = await connection.execute(
+                get_user_columns_stmt(fields), {"username": username}
+            )
+            row = result.first()
+        if row is None:
+            logger.info(f"not found user with username: {username}")
+            raise DataNotFoundException
+        return row
+
+    async def create_user(self, user: dict) -> None:
+        async with AsyncSession(self.engine) as session:
+            user_in_db = user_from_dict(user)
+            username, email = user_in_db.username, user_in_db.email
+            try:
+                session.add(user_in_db)
+                await session.flush()
+                await session.commit()
+                self.written([username])
             except IntegrityError:
                 logger.info(
-                    f"user {user_in_db.username} or user with email {user_in_db.email} already exists"
+                    f"user {username} or user with email {email} "
+                    "already exists"
                 )
                 raise NotUniqueException
 
+    async def list_users(
+        self,
+        fields: Sequence[str],
+        user_filter: UserFilter,
+        after: tuple | None = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """
+        Get a page of users ordered by get_page_order.
+
+        Pages are selected by keyset, not by offset, so the page after
+        any user is found with an index search.
+        Pages may be read from a replica, so they can lag behind
+        recent writes.
+
+        Args:
+            fields (Sequence[str]): Names of fields from USER_FIELDS
+            user_filter (UserFilter): Salary and promotion date ranges
+            after (tuple | None): Values of get_page_order columns
+                of the last user of previous page
+            limit (int): Maximum number of users in page
+
+        Returns:
+            list[dict]: Users with fields and get_page_order columns
+        """
+        stmt = list_users_stmt(fields, user_filter, after, limit)
+        async with self.router.connect_reader() as connection:
+            result = await connection.execute(stmt)
+            return [dict(row) for row in result.mappings()]
+
+    async def create_users(self, users: list[dict]) -> list[bool]:
+        """
+        Create users with batched inserts in one transaction.
+
+        Users whose username or email already exists, in the database
+        or earlier in users, are skipped instead of failing the batch.
+
+        Args:
+            users (list[dict]): Users with the same fields as in create_user
+
+        Returns:
+            list[bool]: True for created users and False for conflicts,
+                in the order of users
+        """
+        usernames = [user["username"] for user in users]
+        emails = [user["email"] for user in users if user["email"]]
+        async with AsyncSession(self.engine) as session:
+            taken_usernames: set[str] = set()
+            taken_emails: set[str] = set()
+            for start in range(0, len(users), SELECT_CHUNK_SIZE):
+                stmt = conflicting_users_stmt(
+                    usernames[start : start + SELECT_CHUNK_SIZE],
+                    emails[start : start + SELECT_CHUNK_SIZE],
+                )
+                for row in await session.execute(stmt):
+                    taken_usernames.add(row.username)
+                    taken_emails.add(row.email)
+            created: list[bool] = []
+            rows: list[dict] = []
+            for user in users:
+                email = user["email"]
+                if user["username"] in taken_usernames or (
+                    email and email in taken_emails
+                ):
+                    created.append(False)
+                    continue
+                taken_usernames.add(user["username"])
+                taken_emails.add(email)
+                created.append(True)
+                rows.append(user)
+            if not rows:
+                return created
+            try:
+                await session.execute(insert(User), rows)
+                await session.commit()
+            except IntegrityError:
+                logger.info(
+                    "batch insert conflicts with a concurrent write, "
+                    "inserting users one by one"
+                )
+                await session.rollback()
+                return await self.create_users_one_by_one(users)
+        self.written([row["username"] for row in rows])
+        return created
+
+    async def create_users_one_by_one(self, users: list[dict]) -> list[bool]:
+        created: list[bool] = []
+        async with AsyncSession(self.engine) as session:
+            for user in users:
+                try:
+                    await session.execute(insert(User), [user])
+                    await session.commit()
+                    created.append(True)
+                except IntegrityError:
+                    await session.rollback()
+                    created.append(False)
+        self.written(
+            [user["username"] for user, ok in zip(users, created) if ok]
+        )
+        return created
+
+    async def update_users(
+        self, updates: list[UserUpdate]
+    ) -> list[UserUpdateResult]:
+        """
+        Update salaries and next promotion dates in one transaction.
+
+        Args:
+            updates (list[UserUpdate]): Changes of users
+
+        Returns:
+            list[UserUpdateResult]: Results in the order of updates
+        """
+        async with AsyncSession(self.engine) as session:
+            results = await session.run_sync(update_users, updates)
+            await session.commit()
+        self.written([result.username for result in results if result.updated])
+        return results
+
+    async def update_password_hash(
+        self, username: str, hashed_password: str
+    ) -> None:
+        """
+        Replace password hash of a user, e.g. after a change of bcrypt cost.
+
+        Version isn't incremented, the hash isn't part of user data.
+
+        Args:
+            username (str): Username
+            hashed_password (str): New hash of the same password
+        """
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                update_password_hash_stmt(),
+                {"b_username": username, "b_hashed_password": hashed_password},
+            )
+        self.written([username])
+
+    async def create_refresh_token(
+        self,
+        token_hash: str,
+        family_id: str,
+        username: str,
+        expires_at: datetime,
+        now: datetime,
+    ) -> None:
+        """
+        Store a refresh token, dropping expired tokens of the user.
+
+        Args:
+            token_hash (str): SHA-256 digest of the token
+            family_id (str): Family of the token
+            username (str): Username of the owner
+            expires_at (datetime): Expiry time in UTC
+            now (datetime): Current time in UTC
+        """
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                delete_expired_refresh_tokens_stmt(),
+                {"username": username, "now": now},
+            )
+            await connection.execute(
+                insert(RefreshToken),
+                {
+                    "token_hash": token_hash,
+                    "family_id": family_id,
+                    "username": username,
+                    "expires_at": expires_at,
+                },
+            )
+
+    async def rotate_refresh_token(
+        self,
+        token_hash: str,
+        new_token_hash: str,
+        expires_at: datetime,
+        now: datetime,
+    ) -> str:
+        """
+        Mark a refresh token used and store its successor.
+
+        The token is marked used by a conditional UPDATE, so of
+        concurrent rotations of one token only one succeeds. Using a token
+        twice revokes every token of its family.
+
+        Args:
+            token_hash (str): SHA-256 digest of the presented token
+            new_token_hash (str): SHA-256 digest of the successor
+            expires_at (datetime): Expiry time of the successor in UTC
+            now (datetime): Current time in UTC
+
+        Raises:
+            DataNotFoundException: Raises if token doesn't exist,
+                is expired or revoked
+            RefreshTokenReusedException: Raises if token was used
+
+        Returns:
+            str: Username of the owner
+        """
+        table = RefreshToken.__table__
+        async with self.engine.begin() as connection:
+            result = await connection.execute(
+                get_refresh_token_stmt(), {"token_hash": token_hash}
+            )
+            row = result.first()
+            if row is None or row.revoked or row.expires_at <= now:
+                logger.info("refresh token not found, expired or revoked")
+                raise DataNotFoundException
+            result = await connection.execute(
+                use_refresh_token_stmt(),
+                {"b_token_hash": token_hash, "b_now": now},
+            )
+            reused = result.rowcount != 1
+            if not reused:
+                await connection.execute(
+                    insert(table),
+                    {
+                        "token_hash": new_token_hash,
+                        "family_id": row.family_id,
+                        "username": row.username,
+                        "expires_at": expires_at,
+                    },
+                )
+        if reused:
+            logger.warning(
+                f"refresh token of {row.username} reused, "
+                f"revoking family {row.family_id}"
+            )
+            await self.revoke_refresh_token_family(row.family_id)
+            raise RefreshTokenReusedException
+        return row.username
+
+    async def revoke_refresh_token_family(self, family_id: str) -> None:
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                revoke_refresh_token_family_stmt(), {"b_family_id": family_id}
+            )
+
+    async def take_login_token(
+        self, name: str, key: str, rate: float, burst: int, now: float
+    ) -> float:
+        """
+        Take a token from a login bucket, creating a full one if missing.
+
+        Args:
+            name (str): Limiter of the bucket
+            key (str): Bucket key, e.g. client address
+            rate (float): Tokens refilled per second
+            burst (int): Tokens of a full bucket
+            now (float): Current time in seconds since the epoch
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until
+                the bucket has a token
+        """
+        params = {
+            "b_name": name,
+            "b_key": key,
+            "b_now": now,
+            "b_rate": rate,
+            "b_burst": burst,
+        }
+        try:
+            async with self.engine.begin() as connection:
+                retry_after = await connection.scalar(
+                    take_login_token_stmt(), params
+                )
+                if retry_after is not None:
+                    return retry_after
+                await connection.execute(
+                    insert(LoginBucket),
+                    {
+                        "name": name,
+                        "key": key,
+                        "tokens": burst - 1,
+                        "updated_at": now,
+                    },
+                )
+                return 0.0
+        except IntegrityError:
+            # Another worker created the bucket meanwhile
+            async with self.engine.begin() as connection:
+                return await connection.scalar(take_login_token_stmt(), params)
+
+    async def delete_idle_login_buckets(
+        self, name: str, before: float
+    ) -> None:
+        # Buckets idle long enough are full, the same as missing ones
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                delete_idle_login_buckets_stmt(),
+                {"name": name, "before": before},
+            )
+
+
+class ShardedAsyncRepository(AsyncRepository):
+    """
+    Repository of users split over shards by username.
+
+    A user is read and written in the shard its username hashes to,
+    users of batches are grouped by shard and the shards are written
+    concurrently. Pages of users are read from all shards concurrently
+    and merged by id. Ids of new users are allocated from a sequence
+    in the main database, so they are unique across shards and don't
+    change when a user is moved to another shard or shards are
+    reordered. Emails are unique within a shard only. Refresh tokens,
+    login buckets and the id sequence are kept in the main database,
+    the engine of AsyncRepository.
+    """
+
+    def __init__(
+        self,
+        shards: Mapping[str, AsyncEngine | EngineRouter],
+        engine: AsyncEngine | EngineRouter | None = None,
+        vnodes: int = 64,
+    ) -> None:
+        super().__init__(engine)
+        self.shards = {
+            name: AsyncRepository(shard) for name, shard in shards.items()
+        }
+        self.ring = get_hash_ring(tuple(self.shards), vnodes)
+
+    def get_shard(self, username: str) -> AsyncRepository:
+        return self.shards[self.ring.get_shard(username)]
+
+    def group_by_shard(self, usernames: list[str]) -> dict[str, list[int]]:
+        groups: dict[str, list[int]] = {}
+        for index, username in enumerate(usernames):
+            groups.setdefault(self.ring.get_shard(username), []).append(index)
+        return groups
+
+    async def generate_schema(self) -> None:
+        await super().generate_schema()
+        await asyncio.gather(
+            *(shard.generate_schema() for shard in self.shards.values())
+        )
+
+    async def create_fake_data(self) -> None:
+        for user in get_fake_users():
+            await self.create_user(user.to_dict())
+
+    async def get_max_user_id(self) -> int:
+        async def get_shard_max(shard: AsyncRepository) -> int:
+            async with shard.engine.connect() as connection:
+                return await connection.scalar(select(func.max(User.id))) or 0
+
+        maxima = await asyncio.gather(
+            *(get_shard_max(shard) for shard in self.shards.values())
+        )
+        return max(maxima)
+
+    async def allocate_user_ids(self, count: int) -> list[int]:
+        """
+        Allocate ids of new users from the sequence in the main database.
+
+        A missing sequence starts after the greatest id in the shards,
+        e.g. of users moved from an unsharded database.
+
+        Args:
+            count (int): Number of ids
+
+        Returns:
+            list[int]: Increasing ids no user has
+        """
+        if not count:
+            return []
+        params = {"b_name": USER_ID_SEQUENCE, "b_count": count}
+        async with self.engine.begin() as connection:
+            last_id = await connection.scalar(allocate_ids_stmt(), params)
+        if last_id is None:
+            start = await self.get_max_user_id()
+            try:
+                async with self.engine.begin() as connection:
+                    await connection.execute(
+                        insert(IdSequence),
+                        {"name": USER_ID_SEQUENCE, "last_id": start},
+                    )
+            except IntegrityError:
+                # Started by another worker meanwhile
+                pass
+            async with self.engine.begin() as connection:
+                last_id = await connection.scalar(allocate_ids_stmt(), params)
+        return list(range(last_id - count + 1, last_id + 1))
+
+    async def get_user_by_id(self, user_id: int) -> dict:
+        # Ids don't tell the shard, every shard is asked
+        results = await asyncio.gather(
+            *(shard.get_user_by_id(user_id) for shard in self.shards.values()),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, dict):
+                return result
+            if not isinstance(result, DataNotFoundException):
+                raise result
+        raise DataNotFoundException
+
+    async def get_user_by_username(self, username: str) -> dict:
+        return await self.get_shard(username).get_user_by_username(username)
+
+    async def get_user_columns(
+        self, username: str, fields: tuple[str, ...]
+    ) -> Row:
+        return await self.get_shard(username).get_user_columns(
+            username, fields
+        )
+
+    async def create_user(self, user: dict) -> None:
+        (user_id,) = await self.allocate_user_ids(1)
+        await self.get_shard(user["username"]).create_user(
+            user | {"id": user_id}
+        )
+
+    async def list_users(
+        self,
+        fields: Sequence[str],
+        user_filter: UserFilter,
+        after: tuple | None = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """
+        Get a page of users of all shards ordered by get_page_order.
+
+        Every shard returns up to limit users after after, the pages
+        are merged and cut to limit.
+
+        Args:
+            fields (Sequence[str]): Names of fields from USER_FIELDS
+            user_filter (UserFilter): Salary and promotion date ranges
+            after (tuple | None): Values of get_page_order columns
+                of the last user of previous page
+            limit (int): Maximum number of users in page
+
+        Returns:
+            list[dict]: Users with fields and get_page_order columns
+        """
+        order = get_page_order(user_filter)
+        pages = await asyncio.gather(
+            *(
+                shard.list_users(fields, user_filter, after, limit)
+                for shard in self.shards.values()
+            )
+        )
+        merged = heapq.merge(
+            *pages, key=lambda row: tuple(row[name] for name in order)
+        )
+        return [row for row, _ in zip(merged, range(limit))]
+
+    async def create_users(self, users: list[dict]) -> list[bool]:
+        user_ids = await self.allocate_user_ids(len(users))
+        users = [
+            user | {"id": user_id} for user, user_id in zip(users, user_ids)
+        ]
+        groups = self.group_by_shard([user["username"] for user in users])
+        names = list(groups)
+        results = await asyncio.gather(
+            *(
+                self.shards[name].create_users(
+                    [users[index] for index in groups[name]]
+                )
+                for name in names
+            )
+        )
+        created = [False] * len(users)
+        for name, shard_created in zip(names, results):
+            for index, ok in zip(groups[name], shard_created):
+                created[index] = ok
+        return created
+
+    async def update_users(
+        self, updates: list[UserUpdate]
+    ) -> list[UserUpdateResult]:
+        groups = self.group_by_shard(
+            [user_update.username for user_update in updates]
+        )
+        names = list(groups)
+        results = await asyncio.gather(
+            *(
+                self.shards[name].update_users(
+                    [updates[index] for index in groups[name]]
+                )
+                for name in names
+            )
+        )
+        ordered: list[UserUpdateResult | None] = [None] * len(updates)
+        for name, shard_results in zip(names, results):
+            for index, result in zip(groups[name], shard_results):
+                ordered[index] = result
+        return [result for result in ordered if result is not None]
+
+    async def update_password_hash(
+        self, username: str, hashed_password: str
+    ) -> None:
+        await self.get_shard(username).update_password_hash(
+            username, hashed_password
+        )
+
+
+@cache
+def get_repository() -> AsyncRepository:
+    """
+    Get repository of the configured databases.
+
+    The repository is built once, like the engines it uses,
+    dispose_engines drops it with them.
+
+    Returns:
+        AsyncRepository: ShardedAsyncRepository if DATABASE_SHARDS
+            is set, AsyncRepository otherwise
+    """
+    shards = get_shard_routers()
+    if shards:
+        return ShardedAsyncRepository(
+            shards, vnodes=get_settings().database_shard_vnodes
+        )
+    return AsyncRepository()
+
 
 if __name__ == "__main__":
     db = Repository()
@@ -0,0 +1,278 @@
+"""
+Move users between shards after the list of shards changes.
+
+Users of every old shard are scanned by id in batches, users whose
+username hashes to another shard on the new ring are copied there
+and then deleted from the old shard. Users already present in the new
+shard are not copied again, so an interrupted run can be repeated.
+A user whose email belongs to another user of the new shard is
+reported as a conflict and stays in the old shard.
+Only users whose shard changed are moved, about 1/N of them when
+a shard is added to N. Users keep their ids.
+
+Run with writes stopped, then restart the service with the new
+DATABASE_SHARDS:
+    python -m shift_fastapi_service.reshard \\
+        --from "s0=sqlite:///s0.db,s1=sqlite:///s1.db" \\
+        --to "s0=sqlite:///s0.db,s1=sqlite:///s1.db,s2=sqlite:///s2.db"
+"""
+
+import argparse
+import logging
+from collections import Counter
+from typing import Iterator
+
+from sqlalchemy import Engine, delete, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from shift_fastapi_service.config import Settings, get_settings
+from shift_fastapi_service.database import create_database_engine
+from shift_fastapi_service.domain import (
+    ReshardConflict,
+    ReshardReport,
+    ShardMove,
+)
+from shift_fastapi_service.exceptions import DatabaseException
+from shift_fastapi_service.models import User
+from shift_fastapi_service.repository import create_schema
+from shift_fastapi_service.sharding import HashRing
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shards(shards: str) -> dict[str, str]:
+    return Settings(database_shards=shards).get_database_shards()
+
+
+def insert_one_by_one(engine: Engine, users: list[dict]) -> list[dict]:
+    # One transaction per user, so a conflict doesn't undo the others
+    table = User.__table__
+    conflicts = []
+    for user in users:
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(table), user)
+        except IntegrityError:
+            conflicts.append(user)
+    return conflicts
+
+
+def copy_users(engine: Engine, users: list[dict]) -> list[dict]:
+    """
+    Insert users that engine doesn't have yet.
+
+    Users are inserted in one transaction, if one of them conflicts
+    with a user of the shard they are inserted one by one.
+
+    Args:
+        engine (Engine): Engine of the new shard
+        users (list[dict]): Users with their ids, which are kept
+
+    Returns:
+        list[dict]: Users that weren't inserted because of a conflict
+    """
+    table = User.__table__
+    with engine.connect() as connection:
+        existing = set(
+            connection.scalars(
+                select(table.c.username).where(
+                    table.c.username.in_([user["username"] for user in users])
+                )
+            )
+        )
+    missing = [user for user in users if user["username"] not in existing]
+    if not missing:
+        return []
+    try:
+        with engine.begin() as connection:
+            connection.execute(insert(table), missing)
+    except IntegrityError:
+        return insert_one_by_one(engine, missing)
+    return []
+
+
+def check_shard_urls(
+    old_shards: dict[str, str], new_shards: dict[str, str]
+) -> None:
+    for name in old_shards.keys() & new_shards.keys():
+        if old_shards[name] != new_shards[name]:
+            raise DatabaseException(f"shard {name} has two URLs")
+
+
+def scan_users(engine: Engine, batch_size: int) -> Iterator[list[dict]]:
+    """
+    Read all users of a shard in batches ordered by id.
+
+    Batches are read in separate transactions after the last id
+    of the previous batch, so users of read batches can be deleted.
+
+    Args:
+        engine (Engine): Engine of the shard
+        batch_size (int): Number of users in a batch
+
+    Yields:
+        list[dict]: Users with all columns
+    """
+    table = User.__table__
+    after_id = 0
+    while True:
+        with engine.connect() as connection:
+            rows = connection.execute(
+                select(table)
+                .where(table.c.id > after_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).mappings()
+            users = [dict(row) for row in rows]
+        if not users:
+            return
+        yield users
+        after_id = users[-1]["id"]
+
+
+def group_moves(
+    users: list[dict], ring: HashRing, source: str
+) -> dict[str, list[dict]]:
+    # Users of source that belong to other shards, by target shard
+    moves: dict[str, list[dict]] = {}
+    for user in users:
+        target = ring.get_shard(user["username"])
+        if target != source:
+            moves.setdefault(target, []).append(user)
+    return moves
+
+
+def move_users(
+    source: Engine, target: Engine, users: list[dict]
+) -> list[dict]:
+    # Users are deleted from source once copied, conflicts are kept there
+    conflicts = copy_users(target, users)
+    conflicting = {user["username"] for user in conflicts}
+    copied = [
+        user["username"]
+        for user in users
+        if user["username"] not in conflicting
+    ]
+    if copied:
+        table = User.__table__
+        with source.begin() as connection:
+            connection.execute(
+                delete(table).where(table.c.username.in_(copied))
+            )
+    return conflicts
+
+
+def reshard_shard(
+    source: str,
+    engines: dict[str, Engine],
+    ring: HashRing,
+    batch_size: int,
+    dry_run: bool,
+    report: ReshardReport,
+) -> None:
+    moved: Counter[str] = Counter()
+    for users in scan_users(engines[source], batch_size):
+        for target, moves in group_moves(users, ring, source).items():
+            conflicts = (
+                []
+                if dry_run
+                else move_users(engines[source], engines[target], moves)
+            )
+            moved[target] += len(moves) - len(conflicts)
+            for user in conflicts:
+                logger.warning(
+                    f"user {user['username']} conflicts in shard {target}"
+                )
+                report.conflicts.append(
+                    ReshardConflict(
+                        username=user["username"],
+                        source=source,
+                        target=target,
+                        detail="email already exists",
+                    )
+                )
+    for target, count in sorted(moved.items()):
+        report.moves.append(
+            ShardMove(source=source, target=target, users=count)
+        )
+        report.moved += count
+    logger.info(f"scanned shard {source}")
+
+
+def reshard(
+    old_shards: dict[str, str],
+    new_shards: dict[str, str],
+    settings: Settings,
+    batch_size: int = 1000,
+    dry_run: bool = False,
+) -> ReshardReport:
+    """
+    Move users from the shards of old_shards to where new_shards puts them.
+
+    Shards are identified by name, a name in both lists must have
+    the same URL. Conflicting users are reported and don't stop the run.
+
+    Args:
+        old_shards (dict[str, str]): URLs by name the users are in
+        new_shards (dict[str, str]): URLs by name to move users to
+        settings (Settings): Settings of engines, e.g. SQLite pragmas
+        batch_size (int): Number of users scanned per transaction
+        dry_run (bool): Only count users that would move
+
+    Raises:
+        DatabaseException: Raises if a shard name has two URLs
+
+    Returns:
+        ReshardReport: Numbers of moved users by old and new shard name
+            and users that couldn't be moved
+    """
+    check_shard_urls(old_shards, new_shards)
+    ring = HashRing(new_shards, settings.database_shard_vnodes)
+    engines = {
+        name: create_database_engine(
+            settings.model_copy(update={"database_url": url})
+        )
+        for name, url in (old_shards | new_shards).items()
+    }
+    report = ReshardReport()
+    try:
+        if not dry_run:
+            for name in new_shards:
+                with engines[name].begin() as connection:
+                    create_schema(connection)
+        for source in old_shards:
+            reshard_shard(source, engines, ring, batch_size, dry_run, report)
+    finally:
+        for engine in engines.values():
+            engine.dispose()
+    return report
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    settings = get_settings()
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--from",
+        dest="old_shards",
+        default=settings.database_shards,
+        help="shards users are in, DATABASE_SHARDS by default",
+    )
+    parser.add_argument("--to", dest="new_shards", required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    report = reshard(
+        parse_shards(args.old_shards),
+        parse_shards(args.new_shards),
+        settings,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
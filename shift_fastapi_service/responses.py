@@ -0,0 +1,20 @@
+from typing import Any
+
+import orjson
+import pydantic_core
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered by orjson, or by pydantic-core for models.
+
+    Views return it with models they have built themselves, so FastAPI
+    doesn't validate and serialize them again for response_model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return pydantic_core.to_json(content)
+        return orjson.dumps(content)
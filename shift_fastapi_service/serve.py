@@ -0,0 +1,249 @@
+"""
+Production server: a supervisor forking uvicorn workers.
+
+The app is imported and the listening socket is bound once, before
+workers are forked, so workers share the imported code and the socket
+and nothing else. Engines, pools, caches and log handlers are built
+by the lifespan of each worker after fork. With several workers the
+state they must agree on is shared, see share_state_between_workers.
+
+Run:
+    python -m shift_fastapi_service.serve
+"""
+
+import asyncio
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+from types import FrameType
+
+import uvicorn
+from fastapi import FastAPI
+
+from shift_fastapi_service.auth.hashing import ensure_calibration
+from shift_fastapi_service.config import Settings, get_settings, set_settings
+from shift_fastapi_service.database import dispose_engines
+from shift_fastapi_service.main import app
+from shift_fastapi_service.metrics import MetricsDirectory, registry
+from shift_fastapi_service.repository import get_repository
+
+logger = logging.getLogger(__name__)
+
+# A worker that exits sooner than this after start is restarted
+# with a delay, so a broken worker doesn't spin the supervisor
+MIN_WORKER_LIFETIME = 1.0
+
+
+def get_worker_count(settings: Settings) -> int:
+    return settings.server_workers or os.cpu_count() or 1
+
+
+def share_state_between_workers(settings: Settings) -> Settings:
+    """
+    Get settings of workers that don't share memory but must agree.
+
+    Unless PRINCIPAL_CACHE_CHECK_VERSION is set, cached users are
+    checked against the row version, so writes made by other workers
+    are seen at the cost of a version query per authenticated request.
+    Set it to false to skip the query and see other workers' writes
+    only after PRINCIPAL_CACHE_TTL. Login attempts are counted in the
+    database and metrics are summed over METRICS_DIR, a temporary
+    directory if it's not set. Tokens are cached per worker, a token
+    decodes the same in every worker.
+
+    Args:
+        settings (Settings): Service settings
+
+    Returns:
+        Settings: Settings of workers
+    """
+    update: dict[str, object] = {"login_throttle_store": "database"}
+    if settings.principal_cache_check_version is None:
+        update["principal_cache_check_version"] = True
+    if not settings.metrics_dir:
+        update["metrics_dir"] = tempfile.mkdtemp(prefix="shift-metrics-")
+    return settings.model_copy(update=update)
+
+
+def bind_socket(settings: Settings) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((settings.server_host, settings.server_port))
+    sock.listen(settings.server_backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def get_max_requests(settings: Settings) -> int | None:
+    # Jitter keeps workers from being recycled all at once
+    if not settings.server_max_requests:
+        return None
+    jitter = random.randint(0, settings.server_max_requests_jitter)
+    return settings.server_max_requests + jitter
+
+
+def run_worker(
+    app: FastAPI, sock: socket.socket, settings: Settings, index: int
+) -> None:
+    """
+    Serve app on sock until stopped by a signal or max requests.
+
+    Runs in a forked process, which exits when this returns.
+
+    Args:
+        app (FastAPI): Service app imported by the supervisor
+        sock (socket.socket): Listening socket bound by the supervisor
+        settings (Settings): Service settings
+        index (int): Worker number, selects its log file
+    """
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    logging.getLogger().handlers.clear()
+    set_settings(
+        settings.model_copy(update={"log_file_name": f"main.{index}.log"})
+    )
+    config = uvicorn.Config(
+        app,
+        loop=settings.server_loop,
+        http=settings.server_http,
+        lifespan="on",
+        access_log=settings.server_access_log,
+        limit_max_requests=get_max_requests(settings),
+        timeout_graceful_shutdown=settings.server_graceful_timeout,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Keeps workers running and stops them gracefully on SIGINT or SIGTERM.
+
+    Workers that exit, e.g. after max requests, are replaced. On stop
+    workers get SIGTERM and are killed after the graceful timeout.
+    """
+
+    def __init__(
+        self, app: FastAPI, sock: socket.socket, settings: Settings
+    ) -> None:
+        self.app = app
+        self.sock = sock
+        self.settings = settings
+        self.workers: dict[int, tuple[int, float]] = {}
+        self.stopping = False
+        self.metrics = None
+        if settings.metrics_dir:
+            self.metrics = MetricsDirectory(settings.metrics_dir, registry)
+            self.metrics.clear()
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.settings, index)
+            except BaseException:
+                logger.exception(f"worker {index} failed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = (index, time.monotonic())
+        logger.info(f"started worker {index} with pid {pid}")
+
+    def stop(self, signum: int, frame: FrameType | None) -> None:
+        if self.stopping:
+            return
+        logger.info(f"stopping {len(self.workers)} workers")
+        self.stopping = True
+        for pid in self.workers:
+            self.signal_worker(pid, signal.SIGTERM)
+
+    def signal_worker(self, pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for index in range(get_worker_count(self.settings)):
+            self.spawn(index)
+        while not self.stopping:
+            self.reap(restart=True)
+        deadline = time.monotonic() + self.settings.server_graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap(restart=False)
+        for pid in self.workers:
+            logger.warning(f"killing worker with pid {pid}")
+            self.signal_worker(pid, signal.SIGKILL)
+        while self.workers:
+            self.reap(restart=False)
+
+    def reap(self, restart: bool) -> None:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            self.workers.clear()
+            return
+        if pid == 0:
+            time.sleep(0.1)
+            return
+        index, started_at = self.workers.pop(pid)
+        if self.metrics is not None:
+            self.metrics.retire(pid)
+        logger.info(
+            f"worker {index} with pid {pid} exited "
+            f"with status {os.waitstatus_to_exitcode(status)}"
+        )
+        if restart and not self.stopping:
+            if time.monotonic() - started_at < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            self.spawn(index)
+
+
+async def create_schema() -> None:
+    await get_repository().generate_schema()
+    await dispose_engines()
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stderr,
+        format="%(asctime)s %(levelname)s:%(name)s:%(message)s",
+    )
+    settings = get_settings()
+    # Done once here, not raced by workers
+    ensure_calibration()
+    if settings.create_schema_on_startup:
+        asyncio.run(create_schema())
+        settings = settings.model_copy(
+            update={"create_schema_on_startup": False}
+        )
+    workers = get_worker_count(settings)
+    temporary_metrics_dir = None
+    if workers > 1:
+        shared = share_state_between_workers(settings)
+        if shared.metrics_dir != settings.metrics_dir:
+            temporary_metrics_dir = shared.metrics_dir
+        settings = shared
+    sock = bind_socket(settings)
+    logger.info(
+        f"listening on {settings.server_host}:{settings.server_port} "
+        f"with {workers} workers"
+    )
+    try:
+        Supervisor(app, sock, settings).run()
+    finally:
+        if temporary_metrics_dir is not None:
+            shutil.rmtree(temporary_metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Placement of users on shards by consistent hashing of username.
+
+Every shard owns vnodes points of a hash ring and a username belongs
+to the shard of the first point after the hash of the username, so
+adding or removing a shard moves only the users next to its points,
+about 1/N of them, instead of rehashing everyone. User ids don't
+depend on the shard, they are allocated from a sequence in the main
+database and kept when a user is moved.
+"""
+
+import hashlib
+from bisect import bisect_right
+from functools import cache
+from typing import Iterable
+
+from shift_fastapi_service.exceptions import DatabaseException
+
+
+def hash_key(key: str) -> int:
+    # Stable across processes, unlike hash()
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of shard names.
+    """
+
+    def __init__(self, names: Iterable[str], vnodes: int = 64) -> None:
+        points = sorted(
+            (hash_key(f"{name}#{vnode}"), name)
+            for name in names
+            for vnode in range(vnodes)
+        )
+        if not points:
+            raise DatabaseException("hash ring needs at least one shard")
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def get_shard(self, key: str) -> str:
+        index = bisect_right(self._hashes, hash_key(key))
+        return self._names[index % len(self._names)]
+
+
+@cache
+def get_hash_ring(names: tuple[str, ...], vnodes: int) -> HashRing:
+    return HashRing(names, vnodes)
@@ -1,15 +1,29 @@
+import hashlib
 import logging
-from typing import Annotated
-
-from fastapi import Depends, HTTPException, Request, Response, status
+from typing import Annotated, Callable
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from fastapi.responses import RedirectResponse
 
-from shift_fastapi_service.app import app
 from shift_fastapi_service.auth.auth import (
-    get_current_active_user,
-    get_password_hash,
+    get_current_active_principal,
+    get_current_admin_user,
+    get_password_hash_async,
 )
+from shift_fastapi_service.auth.hashing import get_hashing_pool
+from shift_fastapi_service.bulk_import import import_users
+from shift_fastapi_service.cache import get_principal_cache, get_token_cache
+from shift_fastapi_service.config import get_settings
 from shift_fastapi_service.domain import (
+    ImportReport,
+    Principal,
     User,
     UserNextPromotionDate,
     UserNotInDB,
@@ -17,14 +31,18 @@ from shift_fastapi_service.domain import (
 )
 from shift_fastapi_service.exceptions import (
     DatabaseException,
+    HashingPoolBusyException,
     NotUniqueException,
 )
-from shift_fastapi_service.repository import Repository
+from shift_fastapi_service.metrics import CONTENT_TYPE, render_metrics
+from shift_fastapi_service.repository import get_repository
+from shift_fastapi_service.responses import FastJSONResponse
 
 logger = logging.getLogger(__name__)
 
+router = APIRouter()
+
 
-@app.exception_handler(404)
 async def not_found_handler(
     request: Request, exc: Exception
 ) -> RedirectResponse:
@@ -41,7 +59,27 @@ async def not_found_handler(
     return RedirectResponse(url="/404")
 
 
-@app.get("/404", status_code=status.HTTP_404_NOT_FOUND)
+async def hashing_pool_busy_handler(
+    request: Request, exc: HashingPoolBusyException
+) -> FastJSONResponse:
+    """
+    Exception handler for password hashing pool overload.
+
+    Args:
+        request (Request): HTTP Request
+        exc (HashingPoolBusyException): Hashing pool is full
+
+    Returns:
+        FastJSONResponse: Response with HTTP status 503
+    """
+    return FastJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@router.get("/404", status_code=status.HTTP_404_NOT_FOUND)
 async def not_found() -> dict[str, str]:
     """
     View for page /404
@@ -52,70 +90,196 @@ async def not_found() -> dict[str, str]:
     return {"message": "Resource Not Found"}
 
 
-@app.get("/user/me", response_model=User)
+def get_etag(principal: Principal) -> str:
+    """
+    Get strong ETag of the representations of a user.
+
+    The tag changes with the row version, which every write
+    of the user increments.
+
+    Args:
+        principal (Principal): User
+
+    Returns:
+        str: Quoted entity tag
+    """
+    digest = hashlib.blake2b(
+        principal.username.encode(), digest_size=8
+    ).hexdigest()
+    return f'"{digest}-{principal.version}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag
+        for tag in if_none_match.split(",")
+    )
+
+
+def conditional_response(
+    request: Request, principal: Principal, render: Callable[[], dict]
+) -> Response:
+    """
+    Answer 304 Not Modified if the client has the current representation.
+
+    Args:
+        request (Request): HTTP Request, maybe with If-None-Match
+        principal (Principal): User the representation is of
+        render (Callable[[], dict]): Builds the body, called only
+            if the client's representation is stale
+
+    Returns:
+        Response: Empty response with status 304 or JSON response,
+            both with ETag
+    """
+    etag = get_etag(principal)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    return FastJSONResponse(render(), headers=headers)
+
+
+@router.get("/user/me", response_model=User)
 async def read_users_me(
-    current_user: Annotated[User, Depends(get_current_active_user)],
-) -> User:
+    request: Request,
+    principal: Annotated[Principal, Depends(get_current_active_principal)],
+) -> Response:
     """
     View to request logged user data.
 
     Args:
-        current_user (Annotated[User, Depends): User credentials
+        request (Request): HTTP Request, maybe with If-None-Match
+        principal (Annotated[Principal, Depends): User credentials
 
     Returns:
-        User: Json object obtained by marshaling the User object
+        Response: Json object with the fields of User,
+            or 304 Not Modified if ETag matches
     """
-    return current_user
+    return conditional_response(
+        request,
+        principal,
+        lambda: {
+            "username": principal.username,
+            "email": principal.email,
+            "salary": principal.salary,
+            "next_promotion_date": principal.next_promotion_date,
+            "disabled": principal.disabled,
+        },
+    )
 
 
-@app.get("/salary/me", response_model=UserSalary)
+@router.get("/salary/me", response_model=UserSalary)
 async def get_salary_for_current_user(
-    current_user: Annotated[User, Depends(get_current_active_user)],
-) -> UserSalary:
+    request: Request,
+    principal: Annotated[Principal, Depends(get_current_active_principal)],
+) -> Response:
     """
     View to request logged user salary data.
 
+    The response is built from the cached user, without the
+    UserInDB and UserSalary models.
+
     Args:
-        current_user (Annotated[User, Depends): User credentials
+        request (Request): HTTP Request, maybe with If-None-Match
+        principal (Annotated[Principal, Depends): User credentials
 
     Returns:
-        UserSalary: Json object obtained by marshaling the UserSalary object
+        Response: Json object with the fields of UserSalary,
+            or 304 Not Modified if ETag matches
     """
-    user_salary: UserSalary = current_user.get_salary()
-    return user_salary
+    return conditional_response(
+        request,
+        principal,
+        lambda: {"username": principal.username, "salary": principal.salary},
+    )
 
 
-@app.get("/promotion/me", response_model=UserNextPromotionDate)
+@router.get("/promotion/me", response_model=UserNextPromotionDate)
 async def get_next_promotion_date_for_current_user(
-    current_user: Annotated[User, Depends(get_current_active_user)],
-) -> UserNextPromotionDate:
+    request: Request,
+    principal: Annotated[Principal, Depends(get_current_active_principal)],
+) -> Response:
     """
     View to request logged user next promotion date data.
 
+    The response is built from the cached user, without the
+    UserInDB and UserNextPromotionDate models.
+
+    Args:
+        request (Request): HTTP Request, maybe with If-None-Match
+        principal (Annotated[Principal, Depends): User credentials
+
+    Returns:
+        Response: Json object with the fields of UserNextPromotionDate,
+            or 304 Not Modified if ETag matches
+    """
+    return conditional_response(
+        request,
+        principal,
+        lambda: {
+            "username": principal.username,
+            "next_promotion_date": principal.next_promotion_date,
+        },
+    )
+
+
+@router.get("/cache/stats", response_model=dict[str, dict[str, int]])
+async def get_cache_stats(
+    admin: Annotated[User, Depends(get_current_admin_user)],
+) -> Response:
+    """
+    Admin view for sizing in-process caches.
+
     Args:
-        current_user (Annotated[User, Depends): User credentials
+        admin (User): Credentials of admin user
 
     Returns:
-        UserSalary: Json object obtained by marshaling
-                    the UserNextPromotionDate  object
+        Response: Size and hit/miss/eviction counters of every cache
     """
-    user_next_promotion_date: UserNextPromotionDate = (
-        current_user.get_next_promotion_date()
+    return FastJSONResponse(
+        {
+            "principals": get_principal_cache().get_stats(),
+            "tokens": get_token_cache().get_stats(),
+        }
     )
-    return user_next_promotion_date
 
 
-@app.get("/create_schema")
-async def create_schema() -> Response:
+@router.get("/metrics")
+async def get_metrics() -> Response:
+    """
+    View for scraping metrics by Prometheus.
+
+    With METRICS_DIR, e.g. under the forking server, the metrics are
+    sums over all workers.
+
+    Returns:
+        Response: Metrics in Prometheus text format
+    """
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+
+@router.get("/create_schema")
+async def create_schema(
+    admin: Annotated[User, Depends(get_current_admin_user)],
+) -> Response:
     """
-    Utility view for generating database schema.
+    Admin view for generating database schema.
+
+    Args:
+        admin (User): Credentials of admin user
 
     Returns:
         Response: HTTP Response with HTTP status 201
     """
-    db = Repository()
+    db = get_repository()
     try:
-        db.generate_schema()
+        await db.generate_schema()
     except DatabaseException as e:
         logger.error("couldn't create database schema", exc_info=True)
         raise HTTPException(
@@ -125,7 +289,7 @@ async def create_schema() -> Response:
     return Response(status_code=status.HTTP_201_CREATED)
 
 
-@app.get("/load_data")
+@router.get("/load_data")
 async def load_data() -> Response:
     """
     Utility view for adding test data for test purposes.
@@ -133,9 +297,9 @@ async def load_data() -> Response:
     Returns:
         Response: HTTP Response with HTTP status 201
     """
-    db = Repository()
+    db = get_repository()
     try:
-        db.create_fake_data()
+        await db.create_fake_data()
     except NotUniqueException:
         logger.info("this user or user with this email already exists")
         raise HTTPException(
@@ -151,7 +315,7 @@ async def load_data() -> Response:
     return Response(status_code=status.HTTP_201_CREATED)
 
 
-@app.post(path="/user/create")
+@router.post(path="/user/create")
 async def create_user(user: UserNotInDB) -> Response:
     """
     A view for creating a new user in database
@@ -166,13 +330,13 @@ async def create_user(user: UserNotInDB) -> Response:
     Returns:
         Response: _description_
     """
-    hashed_password: str = get_password_hash(user.password)
+    hashed_password: str = await get_password_hash_async(user.password)
     user_dict = user.to_dict()
-    user_dict["hashed_password":hashed_password]
+    user_dict["hashed_password"] = hashed_password
 
-    db = Repository()
+    db = get_repository()
     try:
-        db.create_user(user_dict)
+        await db.create_user(user_dict)
     except NotUniqueException:
         logger.info(
             f"user {user.username} or user with email {user.email} already exists"
@@ -182,3 +346,39 @@ async def create_user(user: UserNotInDB) -> Response:
             detail="username or email already exists",
         )
     return Response(status_code=status.HTTP_201_CREATED)
+
+
+@router.post(path="/user/import", response_model=ImportReport)
+async def import_users_in_bulk(
+    request: Request,
+    admin: Annotated[User, Depends(get_current_admin_user)],
+    batch_size: int | None = None,
+) -> Response:
+    """
+    Admin view for creating users in bulk.
+
+    Request body is streamed and parsed as it arrives. It's CSV
+    with a header row if Content-Type is text/csv, NDJSON otherwise.
+    Every row has the fields of /user/create, rows with hashed_password
+    are rejected, pre-hashed users are imported with the CLI only.
+
+    Args:
+        request (Request): HTTP Request with NDJSON or CSV body
+        admin (User): Credentials of admin user
+        batch_size (int | None): Number of users inserted
+            in one transaction
+
+    Returns:
+        Response: ImportReport with numbers of rows and created users,
+            row errors and throughput
+    """
+    content_type = request.headers.get("content-type", "")
+    file_format = "csv" if content_type.startswith("text/csv") else "ndjson"
+    report = await import_users(
+        chunks=request.stream(),
+        file_format=file_format,
+        db=get_repository(),
+        hashing_pool=get_hashing_pool(),
+        batch_size=batch_size or get_settings().bulk_import_batch_size,
+    )
+    return FastJSONResponse(report)
@@ -33,3 +33,40 @@ def temp_test_dir() -> Generator[Path, Any, None]:
         yield test_dir_path
     finally:
         remove_test_dir(test_dir_path)
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        help="run microbenchmarks marked with benchmark",
+    )
+    parser.addoption(
+        "--bcrypt-rounds",
+        type=int,
+        default=4,
+        help="bcrypt cost of microbenchmarked password hashes",
+    )
+    parser.addoption(
+        "--threshold-scale",
+        type=float,
+        default=1.0,
+        help="multiplier of microbenchmark thresholds for slower machines",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line(
+        "markers", "benchmark: microbenchmark, run with --run-benchmarks"
+    )
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    if config.getoption("--run-benchmarks"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="needs --run-benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Generator
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from shift_fastapi_service.app import create_app
+from shift_fastapi_service.auth.auth import get_key_set
+from shift_fastapi_service.auth.hashing import get_pwd_context
+from shift_fastapi_service.config import Settings, set_settings
+
+
+class TestCreateApp:
+
+    @pytest.fixture
+    def settings(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> Generator[Settings, Any, None]:
+        monkeypatch.chdir(tmp_path)
+        settings = Settings(
+            secret_key=SecretStr("secret"),
+            database_url=f"sqlite+pysqlite:///{tmp_path / 'test.db'}",
+            create_schema_on_startup=True,
+            bcrypt_rounds=4,
+            login_throttle_enabled=False,
+        )
+        get_key_set.cache_clear()
+        yield settings
+        set_settings(None)
+        get_key_set.cache_clear()
+        get_pwd_context.cache_clear()
+
+    def test_app_serves_after_startup(self, settings: Settings) -> None:
+        app = create_app(settings)
+
+        async def scenario() -> list[int]:
+            transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as client:
+                    statuses = [(await client.get("/load_data")).status_code]
+                    response = await client.post(
+                        "/token",
+                        data={"username": "alice", "password": "alice12345"},
+                    )
+                    statuses.append(response.status_code)
+                    token = response.json()["access_token"]
+                    response = await client.get(
+                        "/user/me",
+                        headers={"Authorization": f"Bearer {token}"},
+                    )
+                    statuses.append(response.status_code)
+                    response = await client.get("/cache/stats")
+                    statuses.append(response.status_code)
+            return statuses
+
+        assert asyncio.run(scenario()) == [201, 200, 200, 401]
+
+    def test_import_requires_admin(self, settings: Settings) -> None:
+        app = create_app(
+            settings.model_copy(update={"admin_usernames": "alice"})
+        )
+        rows = (
+            b'{"username": "bob", "email": "bob@bob.com", "salary": 1, '
+            b'"next_promotion_date": "2030-01-01", "hashed_password": "x"}'
+        )
+
+        async def scenario() -> list[int]:
+            transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as client:
+                    await client.get("/load_data")
+                    statuses = [
+                        (
+                            await client.post("/user/import", content=rows)
+                        ).status_code
+                    ]
+                    response = await client.post(
+                        "/token",
+                        data={"username": "alice", "password": "alice12345"},
+                    )
+                    token = response.json()["access_token"]
+                    response = await client.post(
+                        "/user/import",
+                        content=rows,
+                        headers={"Authorization": f"Bearer {token}"},
+                    )
+                    statuses.append(response.status_code)
+                    statuses.append(response.json()["created"])
+            return statuses
+
+        assert asyncio.run(scenario()) == [401, 200, 0]
+
+    def test_create_schema_requires_admin(self, settings: Settings) -> None:
+        app = create_app(
+            settings.model_copy(update={"admin_usernames": "alice"})
+        )
+
+        async def scenario() -> list[int]:
+            transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as client:
+                    await client.get("/load_data")
+                    statuses = [
+                        (await client.get("/create_schema")).status_code
+                    ]
+                    response = await client.post(
+                        "/token",
+                        data={"username": "alice", "password": "alice12345"},
+                    )
+                    token = response.json()["access_token"]
+                    response = await client.get(
+                        "/create_schema",
+                        headers={"Authorization": f"Bearer {token}"},
+                    )
+                    statuses.append(response.status_code)
+            return statuses
+
+        assert asyncio.run(scenario()) == [401, 201]
+
+    def test_import_has_no_side_effects(self, tmp_path: Path) -> None:
+        environ = {
+            name: value
+            for name, value in os.environ.items()
+            if name not in ("SECRET_KEY", "ALGORITHM")
+        }
+        subprocess.run(
+            [sys.executable, "-c", "import shift_fastapi_service.main"],
+            cwd=tmp_path,
+            env=environ | {"PYTHONPATH": str(Path(__file__).parent.parent)},
+            check=True,
+        )
+        assert list(tmp_path.iterdir()) == []
@@ -1,14 +1,19 @@
-from datetime import date
-from typing import Literal
-from unittest.mock import MagicMock, patch
+import asyncio
+from datetime import date, timedelta
+from typing import Any, Generator, Literal
+from unittest.mock import AsyncMock, patch
 
 import pytest
 from fastapi import HTTPException
+from jose import JWTError
 
 import shift_fastapi_service.auth.auth as auth
-from shift_fastapi_service.domain import UserInDB
+import shift_fastapi_service.auth.keys as keys
+from shift_fastapi_service.cache import TTLCache, get_token_cache
+from shift_fastapi_service.config import Settings
+from shift_fastapi_service.domain import Principal, UserInDB
 from shift_fastapi_service.exceptions import DataNotFoundException
-from shift_fastapi_service.repository import Repository
+from shift_fastapi_service.repository import AsyncRepository
 
 
 class TestHashVerifyPassword:
@@ -56,38 +61,45 @@ TEST_USER_IN_DB = UserInDB(**TEST_USER)
 class TestGetUser:
 
     @pytest.fixture
-    def user_and_db_for_validation(self) -> tuple[UserInDB, Repository]:
-        db = Repository()
-        db.get_user_by_username = MagicMock(return_value=TEST_USER)
-        return auth.get_user(db, TEST_USER["username"]), db
+    def user_and_db_for_validation(
+        self,
+    ) -> tuple[UserInDB, AsyncRepository]:
+        db = AsyncRepository()
+        db.get_user_by_username = AsyncMock(return_value=TEST_USER)
+        return asyncio.run(auth.get_user(db, TEST_USER["username"])), db
 
     def test_get_valid_user(
-        self, user_and_db_for_validation: tuple[UserInDB, Repository]
+        self, user_and_db_for_validation: tuple[UserInDB, AsyncRepository]
     ) -> None:
         valid_user, db = user_and_db_for_validation
         assert valid_user.username == TEST_USER["username"]
         assert valid_user.hashed_password == TEST_USER["hashed_password"]
-        db.get_user_by_username.assert_called_once_with(TEST_USER["username"])
+        db.get_user_by_username.assert_awaited_once_with(TEST_USER["username"])
 
     @pytest.fixture
-    def db_with_side_effect(self) -> Repository:
-        db = Repository()
-        db.get_user_by_username = MagicMock(side_effect=DataNotFoundException)
+    def db_with_side_effect(self) -> AsyncRepository:
+        db = AsyncRepository()
+        db.get_user_by_username = AsyncMock(side_effect=DataNotFoundException)
         return db
 
     def test_data_not_found_raises(
-        self, db_with_side_effect: Repository
+        self, db_with_side_effect: AsyncRepository
     ) -> None:
         with pytest.raises(HTTPException):
-            auth.get_user(db_with_side_effect, TEST_USER["username"])
+            asyncio.run(
+                auth.get_user(db_with_side_effect, TEST_USER["username"])
+            )
 
 
 class TestAuthenticateUser:
 
     def get_user_with_auth_state(
-        self, state: bool = True
+        self,
+        state: bool = True,
+        needs_update: bool = False,
+        db: AsyncRepository | None = None,
     ) -> UserInDB | Literal[False]:
-        db: Repository = Repository()
+        db = db or AsyncRepository()
         password = "alice"
         with patch(
             "shift_fastapi_service.auth.auth.get_user", autospec=True
@@ -96,10 +108,14 @@ class TestAuthenticateUser:
             with patch(
                 "shift_fastapi_service.auth.auth.verify_password",
                 autospec=True,
-            ) as mock_verify_password:
+            ) as mock_verify_password, patch(
+                "shift_fastapi_service.auth.auth.password_needs_update",
+                autospec=True,
+            ) as mock_needs_update:
                 mock_verify_password.return_value = state
-                return auth.authenticate_user(
-                    db, TEST_USER["username"], password
+                mock_needs_update.return_value = needs_update
+                return asyncio.run(
+                    auth.authenticate_user(db, TEST_USER["username"], password)
                 )
 
     @pytest.fixture
@@ -124,3 +140,166 @@ class TestAuthenticateUser:
         self, not_authenticated_user: UserInDB
     ) -> None:
         assert not_authenticated_user is False
+
+    def test_outdated_hash_rehashed(self) -> None:
+        db = AsyncRepository()
+        db.update_password_hash = AsyncMock()
+        user = self.get_user_with_auth_state(needs_update=True, db=db)
+        assert isinstance(user, UserInDB)
+        db.update_password_hash.assert_awaited_once()
+        username, hashed_password = db.update_password_hash.await_args.args
+        assert username == TEST_USER["username"]
+        assert auth.verify_password("alice", hashed_password)
+
+    def test_current_hash_not_rehashed(self) -> None:
+        db = AsyncRepository()
+        db.update_password_hash = AsyncMock()
+        self.get_user_with_auth_state(needs_update=False, db=db)
+        db.update_password_hash.assert_not_awaited()
+
+
+class TestPrincipalCacheVersion:
+    """
+    The row is written by another worker, which can't invalidate
+    the cache of this one.
+    """
+
+    def db_with_row(self, row: dict) -> AsyncRepository:
+        async def get_user_columns(
+            username: str, fields: tuple[str, ...]
+        ) -> tuple:
+            return tuple(row[field] for field in fields)
+
+        db = AsyncRepository()
+        db.get_user_columns = AsyncMock(side_effect=get_user_columns)
+        return db
+
+    def get_principal(self, db: AsyncRepository, check: bool) -> Principal:
+        principal_cache: TTLCache[str, Principal] = TTLCache(10, 60.0)
+        principal_cache.set(
+            TEST_USER["username"],
+            Principal.from_dict(TEST_USER | {"version": 3}),
+        )
+        settings = Settings(principal_cache_check_version=check)
+        with (
+            patch.object(auth, "get_settings", return_value=settings),
+            patch.object(
+                auth, "get_principal_cache", return_value=principal_cache
+            ),
+        ):
+            return asyncio.run(auth.get_principal(db, TEST_USER["username"]))
+
+    def test_current_principal_served_from_cache(self) -> None:
+        db = self.db_with_row(TEST_USER | {"salary": 99, "version": 3})
+        assert self.get_principal(db, check=True).salary == 10
+        db.get_user_columns.assert_awaited_once_with(
+            TEST_USER["username"], ("version",)
+        )
+
+    def test_principal_written_elsewhere_reloaded(self) -> None:
+        db = self.db_with_row(TEST_USER | {"salary": 99, "version": 4})
+        principal = self.get_principal(db, check=True)
+        assert (principal.salary, principal.version) == (99, 4)
+
+    def test_version_not_checked_by_default(self) -> None:
+        db = self.db_with_row(TEST_USER | {"salary": 99, "version": 4})
+        assert self.get_principal(db, check=False).salary == 10
+        db.get_user_columns.assert_not_awaited()
+
+
+class TestDecodeAccessToken:
+
+    @pytest.fixture
+    def token_cache(self) -> Generator[TTLCache, Any, None]:
+        token_cache = get_token_cache()
+        token_cache.clear()
+        yield token_cache
+        token_cache.clear()
+
+    @pytest.fixture
+    def token(self) -> str:
+        return auth.create_access_token(
+            data={"sub": TEST_USER["username"]},
+            expires_delta=timedelta(minutes=1),
+        )
+
+    def test_signature_verified_once(
+        self, token_cache: TTLCache, token: str
+    ) -> None:
+        with patch(
+            "shift_fastapi_service.auth.keys.jwt.decode",
+            wraps=keys.jwt.decode,
+        ) as mock_decode:
+            first = auth.decode_access_token(token)
+            second = auth.decode_access_token(token)
+        assert first == second
+        assert first["sub"] == TEST_USER["username"]
+        mock_decode.assert_called_once()
+
+    def test_cached_entry_expires_with_token(
+        self, token_cache: TTLCache, token: str
+    ) -> None:
+        auth.decode_access_token(token)
+        ((expires_at, _),) = token_cache._entries.values()
+        assert expires_at <= token_cache.clock() + 60
+
+    def test_expired_cached_token_rejected(
+        self, token_cache: TTLCache, token: str
+    ) -> None:
+        payload = auth.decode_access_token(token)
+        with patch(
+            "shift_fastapi_service.auth.auth.time.time",
+            return_value=payload["exp"] + 1,
+        ):
+            with pytest.raises(JWTError):
+                auth.decode_access_token(token)
+
+
+class TestClaimsPrincipal:
+
+    @pytest.fixture
+    def claims(self) -> dict:
+        principal = Principal.from_dict(TEST_USER | {"version": 3})
+        return {"sub": TEST_USER["username"]} | principal.to_claims()
+
+    def db_with_version(self, version: int) -> AsyncRepository:
+        db = AsyncRepository()
+        db.get_user_columns = AsyncMock(return_value=(version,))
+        return db
+
+    def test_claims_used_without_db(self, claims: dict) -> None:
+        db = AsyncRepository()
+        db.get_user_columns = AsyncMock()
+        principal = asyncio.run(
+            auth.get_claims_principal(db, claims, strict=False)
+        )
+        assert principal.to_user_in_db().get_salary().salary == (
+            TEST_USER["salary"]
+        )
+        assert principal.next_promotion_date == (
+            TEST_USER["next_promotion_date"]
+        )
+        db.get_user_columns.assert_not_awaited()
+
+    def test_strict_claims_with_current_version(self, claims: dict) -> None:
+        db = self.db_with_version(3)
+        with patch(
+            "shift_fastapi_service.auth.auth.get_principal"
+        ) as mock_get_principal:
+            principal = asyncio.run(
+                auth.get_claims_principal(db, claims, strict=True)
+            )
+        assert principal.version == 3
+        mock_get_principal.assert_not_called()
+
+    def test_strict_stale_claims_loaded_from_db(self, claims: dict) -> None:
+        db = self.db_with_version(4)
+        fresh = Principal.from_dict(TEST_USER | {"salary": 99, "version": 4})
+        with patch(
+            "shift_fastapi_service.auth.auth.get_principal",
+            AsyncMock(return_value=fresh),
+        ):
+            principal = asyncio.run(
+                auth.get_claims_principal(db, claims, strict=True)
+            )
+        assert principal.salary == 99
@@ -0,0 +1,32 @@
+import pytest
+
+from benchmarks import micro
+
+
+@pytest.fixture(scope="module")
+def bcrypt_rounds(pytestconfig: pytest.Config) -> int:
+    return pytestconfig.getoption("--bcrypt-rounds")
+
+
+@pytest.fixture(scope="module")
+def primitives(bcrypt_rounds: int) -> dict:
+    return micro.get_primitives(bcrypt_rounds)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name", list(micro.THRESHOLDS))
+def test_primitive_within_threshold(
+    name: str,
+    primitives: dict,
+    bcrypt_rounds: int,
+    pytestconfig: pytest.Config,
+) -> None:
+    timing = micro.measure(name, primitives[name])
+    threshold = micro.get_threshold(
+        name, bcrypt_rounds, pytestconfig.getoption("--threshold-scale")
+    )
+    micro.print_timing(timing, threshold)
+    assert timing.best <= threshold, (
+        f"{name} takes {timing.best * 1e6:.2f}us per call, "
+        f"threshold is {threshold * 1e6:.2f}us"
+    )
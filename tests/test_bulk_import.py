@@ -0,0 +1,160 @@
+import asyncio
+import json
+from datetime import date
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import shift_fastapi_service.bulk_import as bulk_import
+from shift_fastapi_service.auth.hashing import HashingPool, verify_password
+from shift_fastapi_service.domain import ImportReport
+from shift_fastapi_service.repository import AsyncRepository
+
+HASHED_PASSWORD = (
+    "$2b$12$5fNFi0mWbDlm9r8c.mqT4uI8tLcUnAp6wUQIpsJF3FdKzLe2Ci8Bq"
+)
+
+
+def user_row(i: int, **fields) -> dict:
+    return {
+        "username": f"user{i}",
+        "email": f"user{i}@example.com",
+        "salary": i,
+        "next_promotion_date": "2030-01-01",
+        "hashed_password": HASHED_PASSWORD,
+    } | fields
+
+
+async def as_chunks(data: bytes, size: int) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+async def collect(chunks: AsyncIterator[bytes], file_format) -> list:
+    return [
+        record
+        async for record in bulk_import.iter_records(chunks, file_format)
+    ]
+
+
+class TestIterRecords:
+
+    def test_ndjson_split_across_chunks(self) -> None:
+        data = b'{"username": "alice"}\n\n{"username": "bob"}\nnot json\n'
+        records = asyncio.run(collect(as_chunks(data, 3), "ndjson"))
+        assert records[:2] == [
+            (1, {"username": "alice"}),
+            (2, {"username": "bob"}),
+        ]
+        row, error = records[2]
+        assert row == 3
+        assert isinstance(error, str)
+
+    def test_csv_with_header(self) -> None:
+        data = b"username,salary\r\nalice,10\r\nbob\r\n"
+        records = asyncio.run(collect(as_chunks(data, 5), "csv"))
+        assert records[0] == (1, {"username": "alice", "salary": "10"})
+        assert records[1] == (2, "expected 2 values")
+
+
+class TestImportUsers:
+
+    @pytest.fixture
+    def import_ndjson(self, tmp_path: Path):
+        def run(
+            rows: list[dict], allow_hashed_password: bool = True
+        ) -> tuple[ImportReport, dict]:
+            async def scenario() -> tuple[ImportReport, dict]:
+                engine = create_async_engine(
+                    f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+                )
+                db = AsyncRepository(engine)
+                hashing_pool = HashingPool(workers=1, queue_size=1)
+                try:
+                    await db.generate_schema()
+                    await db.create_user(
+                        user_row(0)
+                        | {
+                            "next_promotion_date": date(2030, 1, 1),
+                            "disabled": False,
+                        }
+                    )
+                    data = b"\n".join(json.dumps(row).encode() for row in rows)
+                    report = await bulk_import.import_users(
+                        as_chunks(data, 64),
+                        "ndjson",
+                        db,
+                        hashing_pool,
+                        2,
+                        allow_hashed_password=allow_hashed_password,
+                    )
+                    user = await db.get_user_by_username("user1")
+                    return report, user
+                finally:
+                    hashing_pool.shutdown()
+                    await engine.dispose()
+
+            return asyncio.run(scenario())
+
+        return run
+
+    def test_conflicts_reported_per_row(self, import_ndjson) -> None:
+        rows = [
+            user_row(1, hashed_password=None, password="secret"),
+            user_row(0),
+            user_row(2),
+            user_row(3, email="user2@example.com"),
+            user_row(4, salary="a lot"),
+            user_row(5),
+        ]
+        report, user = import_ndjson(rows)
+        assert report.rows == 6
+        assert report.created == 3
+        assert [error.row for error in report.errors] == [2, 4, 5]
+        assert verify_password("secret", user["hashed_password"])
+
+    def test_hashed_password_rejected_by_default(self, import_ndjson) -> None:
+        rows = [
+            user_row(1, hashed_password=None, password="secret"),
+            user_row(2),
+        ]
+        report, user = import_ndjson(rows, allow_hashed_password=False)
+        assert report.created == 1
+        assert [error.row for error in report.errors] == [2]
+        assert verify_password("secret", user["hashed_password"])
+
+    def test_batch_larger_than_parameter_limit(self, tmp_path: Path) -> None:
+        # Python builds of SQLite often raise the default limit of 32766
+        select_parameters: list[int] = []
+
+        def record(conn, cursor, statement, parameters, context, many):
+            if statement.startswith("SELECT"):
+                select_parameters.append(len(parameters))
+
+        async def scenario() -> list[bool]:
+            engine = create_async_engine(
+                f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+            )
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+            db = AsyncRepository(engine)
+            try:
+                await db.generate_schema()
+                users = [
+                    user_row(i)
+                    | {
+                        "next_promotion_date": date(2030, 1, 1),
+                        "disabled": False,
+                    }
+                    for i in range(20_000)
+                ]
+                return await db.create_users(users + users[:1])
+            finally:
+                await engine.dispose()
+
+        created = asyncio.run(scenario())
+        assert created.count(True) == 20_000
+        assert created[-1] is False
+        assert max(select_parameters) < 32766
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from shift_fastapi_service.cache import TTLCache
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTTLCache:
+
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        return FakeClock()
+
+    @pytest.fixture
+    def cache(self, clock: FakeClock) -> TTLCache[str, int]:
+        return TTLCache(max_size=2, ttl=10.0, clock=clock)
+
+    def test_hit_and_miss_counted(self, cache: TTLCache[str, int]) -> None:
+        cache.set("alice", 1)
+        assert cache.get("alice") == 1
+        assert cache.get("bob") is None
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 1
+
+    def test_entry_expires(
+        self, cache: TTLCache[str, int], clock: FakeClock
+    ) -> None:
+        cache.set("alice", 1)
+        clock.now = 10.0
+        assert cache.get("alice") is None
+        assert cache.stats.expirations == 1
+
+    def test_expires_at_is_capped_by_ttl(
+        self, cache: TTLCache[str, int], clock: FakeClock
+    ) -> None:
+        cache.set("alice", 1, expires_at=100.0)
+        clock.now = 10.0
+        assert cache.get("alice") is None
+
+    def test_least_recently_used_evicted(
+        self, cache: TTLCache[str, int]
+    ) -> None:
+        cache.set("alice", 1)
+        cache.set("bob", 2)
+        cache.get("alice")
+        cache.set("carol", 3)
+        assert cache.get("bob") is None
+        assert cache.get("alice") == 1
+        assert cache.stats.evictions == 1
+
+    def test_concurrent_misses_loaded_once(
+        self, cache: TTLCache[str, int]
+    ) -> None:
+        loads = 0
+
+        async def loader() -> int:
+            nonlocal loads
+            loads += 1
+            await asyncio.sleep(0.01)
+            return 1
+
+        async def scenario() -> list[int]:
+            return await asyncio.gather(
+                *(cache.get_or_load("alice", loader) for _ in range(10))
+            )
+
+        assert asyncio.run(scenario()) == [1] * 10
+        assert loads == 1
+        assert cache.get("alice") == 1
+
+    def test_invalidated_while_loading_not_stored(
+        self, cache: TTLCache[str, int]
+    ) -> None:
+        async def loader() -> int:
+            await asyncio.sleep(0)
+            cache.invalidate("alice")
+            return 1
+
+        assert asyncio.run(cache.get_or_load("alice", loader)) == 1
+        assert cache.get("alice") is None
+
+    def test_load_error_raised_to_all_waiters(
+        self, cache: TTLCache[str, int]
+    ) -> None:
+        async def loader() -> int:
+            await asyncio.sleep(0.01)
+            raise KeyError("alice")
+
+        async def scenario() -> list:
+            return await asyncio.gather(
+                *(cache.get_or_load("alice", loader) for _ in range(3)),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(result, KeyError) for result in results)
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+import shift_fastapi_service.auth.hashing as hashing
+from shift_fastapi_service.exceptions import HashingPoolBusyException
+
+
+class TestHashingPool:
+
+    PLAIN_PASSWORD = "PlainPassword12345"
+
+    @pytest.fixture
+    def pool(self):
+        pool = hashing.HashingPool(workers=1, queue_size=0)
+        yield pool
+        pool.shutdown()
+
+    def test_hash_verified_in_pool(self, pool: hashing.HashingPool) -> None:
+        async def scenario() -> bool:
+            hashed_password = await pool.run(
+                hashing.get_password_hash, self.PLAIN_PASSWORD
+            )
+            return await pool.run(
+                hashing.verify_password, self.PLAIN_PASSWORD, hashed_password
+            )
+
+        assert asyncio.run(scenario()) is True
+
+    def test_full_pool_raises(self, pool: hashing.HashingPool) -> None:
+        release = threading.Event()
+
+        async def scenario() -> None:
+            busy = asyncio.create_task(pool.run(release.wait))
+            await asyncio.sleep(0)
+            try:
+                await pool.run(hashing.get_password_hash, self.PLAIN_PASSWORD)
+            finally:
+                release.set()
+                await busy
+
+        with pytest.raises(HashingPoolBusyException):
+            asyncio.run(scenario())
+        assert pool.pending == 0
+
+    def test_cancelled_call_holds_slot_until_done(
+        self, pool: hashing.HashingPool
+    ) -> None:
+        started = threading.Event()
+        release = threading.Event()
+
+        def job() -> None:
+            started.set()
+            release.wait()
+
+        async def scenario() -> None:
+            busy = asyncio.create_task(pool.run(job))
+            await asyncio.to_thread(started.wait)
+            busy.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await busy
+            try:
+                # the job still runs, a new call is rejected
+                assert pool.pending == 1
+                with pytest.raises(HashingPoolBusyException):
+                    await pool.run(
+                        hashing.get_password_hash, self.PLAIN_PASSWORD
+                    )
+            finally:
+                release.set()
+
+        asyncio.run(scenario())
+        pool.executor.shutdown(wait=True)
+        assert pool.pending == 0
+
+
+class TestCalibration:
+
+    def test_calibrated_rounds_loaded(self, tmp_path: Path) -> None:
+        path = tmp_path / "calibration.json"
+        hashing.save_calibration(path, rounds=12, seconds=0.2)
+        assert hashing.load_calibrated_rounds(path) == 12
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            "not json",
+            json.dumps({"rounds": 99}),
+            json.dumps({"rounds": 4}),
+            "{}",
+        ],
+    )
+    def test_invalid_calibration_ignored(
+        self, tmp_path: Path, content: str
+    ) -> None:
+        path = tmp_path / "calibration.json"
+        path.write_text(content)
+        assert hashing.load_calibrated_rounds(path) is None
+
+    def test_missing_calibration_ignored(self, tmp_path: Path) -> None:
+        assert hashing.load_calibrated_rounds(tmp_path / "missing") is None
+
+    def test_rounds_within_target(self) -> None:
+        rounds, seconds = hashing.calibrate_bcrypt_rounds(
+            0.005, min_rounds=hashing.MIN_BCRYPT_ROUNDS
+        )
+        assert hashing.MIN_BCRYPT_ROUNDS <= rounds < 10
+        assert rounds == hashing.MIN_BCRYPT_ROUNDS or seconds <= 0.005
+
+    def test_rounds_not_below_floor(
+        self, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        rounds, _ = hashing.calibrate_bcrypt_rounds(1e-9, min_rounds=5)
+        assert rounds == 5
+        assert "not going below 5 rounds" in caplog.text
+
+    def test_only_weaker_cost_needs_update(self) -> None:
+        context = hashing.create_pwd_context(5)
+        assert not context.needs_update(context.hash("password"))
+        weaker = hashing.create_pwd_context(4).hash("password")
+        assert context.needs_update(weaker)
+        stronger = hashing.create_pwd_context(6).hash("password")
+        assert not context.needs_update(stronger)
+        assert context.verify("password", stronger)
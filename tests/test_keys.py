@@ -0,0 +1,99 @@
+from pathlib import Path
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jose import JWTError, jwt
+
+from shift_fastapi_service.auth.keys import load_key_set
+from shift_fastapi_service.exceptions import AuthConfigException
+
+CLAIMS = {"sub": "alice"}
+
+
+def write_private_key(path: Path, private_key) -> None:
+    path.write_bytes(
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+
+
+class TestKeySet:
+
+    @pytest.fixture
+    def keys_dir(self, tmp_path: Path) -> Path:
+        write_private_key(
+            tmp_path / "ec-1.pem", ec.generate_private_key(ec.SECP256R1())
+        )
+        write_private_key(
+            tmp_path / "rsa-1.pem",
+            rsa.generate_private_key(public_exponent=65537, key_size=2048),
+        )
+        return tmp_path
+
+    def test_token_signed_with_kid(self, keys_dir: Path) -> None:
+        key_set = load_key_set("secret", "HS256", str(keys_dir), "ec-1")
+        token = key_set.encode(CLAIMS)
+        assert jwt.get_unverified_header(token) == {
+            "alg": "ES256",
+            "typ": "JWT",
+            "kid": "ec-1",
+        }
+        assert key_set.decode(token) == CLAIMS
+
+    def test_token_verified_with_jwks(self, keys_dir: Path) -> None:
+        key_set = load_key_set(None, None, str(keys_dir), "rsa-1")
+        jwks = key_set.get_jwks()
+        assert [key["kid"] for key in jwks["keys"]] == ["ec-1", "rsa-1"]
+        assert all("d" not in key for key in jwks["keys"])
+        (key,) = [key for key in jwks["keys"] if key["kid"] == "rsa-1"]
+        token = key_set.encode(CLAIMS)
+        assert jwt.decode(token, key, algorithms=["RS256"]) == CLAIMS
+
+    def test_rotation_keeps_old_tokens_valid(self, keys_dir: Path) -> None:
+        old_token = load_key_set(
+            "secret", "HS256", str(keys_dir), "ec-1"
+        ).encode(CLAIMS)
+        secret_token = load_key_set("secret", "HS256", None, None).encode(
+            CLAIMS
+        )
+        key_set = load_key_set("secret", "HS256", str(keys_dir), "rsa-1")
+        assert key_set.decode(old_token) == CLAIMS
+        assert key_set.decode(secret_token) == CLAIMS
+
+    def test_removed_key_rejected(self, keys_dir: Path) -> None:
+        token = load_key_set(None, None, str(keys_dir), "ec-1").encode(CLAIMS)
+        (keys_dir / "ec-1.pem").unlink()
+        key_set = load_key_set(None, None, str(keys_dir), "rsa-1")
+        with pytest.raises(JWTError):
+            key_set.decode(token)
+
+    def test_public_key_verifies_but_cant_sign(self, keys_dir: Path) -> None:
+        token = load_key_set(None, None, str(keys_dir), "ec-1").encode(CLAIMS)
+        private_key = serialization.load_pem_private_key(
+            (keys_dir / "ec-1.pem").read_bytes(), None
+        )
+        (keys_dir / "ec-1.pem").write_bytes(
+            private_key.public_key().public_bytes(
+                serialization.Encoding.PEM,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            )
+        )
+        key_set = load_key_set(None, None, str(keys_dir), "rsa-1")
+        assert key_set.decode(token) == CLAIMS
+        with pytest.raises(AuthConfigException):
+            load_key_set(None, None, str(keys_dir), "ec-1")
+
+    def test_eddsa_key_not_supported(self, tmp_path: Path) -> None:
+        write_private_key(
+            tmp_path / "ed-1.pem", ed25519.Ed25519PrivateKey.generate()
+        )
+        with pytest.raises(AuthConfigException):
+            load_key_set(None, None, str(tmp_path), "ed-1")
+
+    def test_signing_key_required(self) -> None:
+        with pytest.raises(AuthConfigException):
+            load_key_set(None, None, None, None)
@@ -1,4 +1,8 @@
+import atexit
+import json
+import logging
 import os
+import time
 from pathlib import Path
 from typing import Any, Generator
 from unittest.mock import patch
@@ -6,11 +10,18 @@ from unittest.mock import patch
 import pytest
 
 import shift_fastapi_service.logs as logs
+from shift_fastapi_service.config import Settings
 from shift_fastapi_service.exceptions import LoggingConfigException
 
 LOG_DIR = logs.LOG_DIR_NAME
 
 
+@pytest.fixture(autouse=True)
+def stop_logging() -> Generator[None, Any, None]:
+    yield
+    logs.stop_logging()
+
+
 @pytest.fixture
 def path_with_log_dir_exists(
     temp_test_dir: Path,
@@ -85,3 +96,72 @@ class TestInitLogging:
         ) as mock_func:
             logs.init_logging(log_root=root_dir_path)
         mock_func.assert_not_called()
+
+
+class TestQueueLogging:
+
+    MESSAGES = 100
+    SLOW_EMIT_SECONDS = 0.01
+
+    def read_log(self, log_root: Path) -> list[str]:
+        logs.stop_logging()
+        main_log_path = log_root / LOG_DIR / logs.MAIN_LOG_NAME
+        return main_log_path.read_text().splitlines()
+
+    def test_records_written_by_listener(self, tmp_path: Path) -> None:
+        logs.init_logging(log_root=tmp_path, settings=Settings())
+        logging.getLogger("test").warning("user %s logged in", "alice")
+        lines = self.read_log(tmp_path)
+        assert lines[-1].endswith("WARNING:test:user alice logged in")
+
+    def test_json_format(self, tmp_path: Path) -> None:
+        settings = Settings(log_format="json")
+        logs.init_logging(log_root=tmp_path, settings=settings)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("test").exception("failed")
+        entry = json.loads(self.read_log(tmp_path)[0])
+        assert entry["message"] == "failed"
+        assert entry["logger"] == "test"
+        assert "ValueError: boom" in entry["exc_info"]
+
+    def test_logger_levels_applied(self, tmp_path: Path) -> None:
+        settings = Settings(log_levels="test.quiet=ERROR")
+        logs.init_logging(log_root=tmp_path, settings=settings)
+        logging.getLogger("test.quiet").warning("dropped")
+        logging.getLogger("test.loud").warning("kept")
+        lines = self.read_log(tmp_path)
+        assert not any("dropped" in line for line in lines)
+        assert any("kept" in line for line in lines)
+        logging.getLogger("test.quiet").setLevel(logging.NOTSET)
+
+    def test_reinit_does_not_add_exit_hooks(self, tmp_path: Path) -> None:
+        logs.init_logging(log_root=tmp_path, settings=Settings())
+        callbacks = atexit._ncallbacks()
+        logs.init_logging(log_root=tmp_path, settings=Settings())
+        logs.stop_logging()
+        assert atexit._ncallbacks() == callbacks
+
+    def test_invalid_logger_levels_raise(self) -> None:
+        with pytest.raises(LoggingConfigException):
+            logs.get_logger_levels("sqlalchemy.engine")
+
+    def test_log_call_does_not_wait_for_io(self, tmp_path: Path) -> None:
+        logs.init_logging(log_root=tmp_path, settings=Settings())
+        logger = logging.getLogger("test")
+        handler = logs.listener.handlers[0]
+        emit = handler.emit
+
+        def slow_emit(record: logging.LogRecord) -> None:
+            time.sleep(self.SLOW_EMIT_SECONDS)
+            emit(record)
+
+        with patch.object(handler, "emit", slow_emit):
+            start = time.perf_counter()
+            for i in range(self.MESSAGES):
+                logger.warning("message %d", i)
+            elapsed = time.perf_counter() - start
+            lines = self.read_log(tmp_path)
+        assert elapsed / self.MESSAGES < self.SLOW_EMIT_SECONDS / 10
+        assert len(lines) == self.MESSAGES
@@ -0,0 +1,256 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from shift_fastapi_service import metrics
+
+
+class TestHistogram:
+
+    @pytest.fixture
+    def histogram(self) -> metrics.Histogram:
+        return metrics.Histogram(
+            "latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0)
+        )
+
+    def test_observations_counted_in_buckets(
+        self, histogram: metrics.Histogram
+    ) -> None:
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, "/user/me")
+        series = histogram.get("/user/me")
+        assert series.counts == [2, 1, 1]
+        assert series.count == 4
+        assert series.sum == pytest.approx(2.65)
+
+    def test_rendered_buckets_cumulative(
+        self, histogram: metrics.Histogram
+    ) -> None:
+        histogram.observe(0.05, "/user/me")
+        histogram.observe(0.5, "/user/me")
+        lines = list(histogram.render())
+        assert lines[:2] == [
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+        ]
+        assert lines[2:] == [
+            'latency_seconds_bucket{route="/user/me",le="0.1"} 1',
+            'latency_seconds_bucket{route="/user/me",le="1.0"} 2',
+            'latency_seconds_bucket{route="/user/me",le="+Inf"} 2',
+            'latency_seconds_sum{route="/user/me"} 0.55',
+            'latency_seconds_count{route="/user/me"} 2',
+        ]
+
+    def test_bound_series_observed(self, histogram: metrics.Histogram) -> None:
+        series = histogram.labels("/user/me")
+        series.observe(0.05)
+        histogram.observe(0.5, "/user/me")
+        assert histogram.get("/user/me") is series
+        assert series.counts == [1, 1, 0]
+
+    @pytest.mark.benchmark
+    def test_observe_takes_microseconds(
+        self, histogram: metrics.Histogram, pytestconfig: pytest.Config
+    ) -> None:
+        observations = 100_000
+        series = histogram.labels("/user/me")
+        start = time.perf_counter()
+        for _ in range(observations):
+            series.observe(0.01)
+        elapsed = time.perf_counter() - start
+        scale = pytestconfig.getoption("--threshold-scale")
+        assert elapsed / observations < 2e-6 * scale
+
+
+class TestCounter:
+
+    def test_label_values_escaped(self) -> None:
+        counter = metrics.Counter("errors_total", "Errors.", ("reason",))
+        counter.inc('bad "token"')
+        assert list(counter.render())[-1] == (
+            'errors_total{reason="bad \\"token\\""} 1.0'
+        )
+
+    def test_registry_rejects_duplicate_names(self) -> None:
+        registry = metrics.Registry()
+        registry.counter("errors_total", "Errors.")
+        with pytest.raises(ValueError):
+            registry.counter("errors_total", "Errors.")
+
+
+class TestMetricsDirectory:
+    """
+    Workers are registries of the same metrics writing files
+    under their pids.
+    """
+
+    @pytest.fixture
+    def registry(self) -> metrics.Registry:
+        registry = metrics.Registry()
+        registry.counter("requests_total", "Requests.", ("route",))
+        registry.gauge("requests_in_flight", "Requests in flight.")
+        registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        return registry
+
+    @pytest.fixture
+    def directory(
+        self, tmp_path: Path, registry: metrics.Registry
+    ) -> metrics.MetricsDirectory:
+        directory = metrics.MetricsDirectory(tmp_path / "metrics", registry)
+        directory.clear()
+        return directory
+
+    def write_worker(
+        self,
+        directory: metrics.MetricsDirectory,
+        pid: int,
+        requests: int,
+        in_flight: int,
+    ) -> None:
+        worker = directory.registry.clone()
+        worker.metrics["requests_total"].inc("/user/me", amount=requests)
+        worker.metrics["requests_in_flight"].inc(amount=in_flight)
+        for _ in range(requests):
+            worker.metrics["latency_seconds"].observe(0.5)
+        directory.write_file(pid, worker.dump())
+
+    def get_values(
+        self, registry: metrics.Registry
+    ) -> tuple[float, float, list[int] | None]:
+        series = registry.metrics["latency_seconds"].get()
+        return (
+            registry.metrics["requests_total"].get("/user/me"),
+            registry.metrics["requests_in_flight"].get(),
+            series.counts if series else None,
+        )
+
+    def test_workers_summed(self, directory: metrics.MetricsDirectory) -> None:
+        self.write_worker(directory, 100, requests=3, in_flight=1)
+        self.write_worker(directory, 101, requests=4, in_flight=2)
+        assert self.get_values(directory.collect()) == (7.0, 3.0, [0, 7, 0])
+
+    def test_exited_workers_keep_counters(
+        self, directory: metrics.MetricsDirectory
+    ) -> None:
+        self.write_worker(directory, 100, requests=3, in_flight=1)
+        self.write_worker(directory, 101, requests=4, in_flight=2)
+        directory.retire(100)
+        self.write_worker(directory, 102, requests=1, in_flight=0)
+        directory.retire(101)
+        assert not directory.get_file(100).exists()
+        assert self.get_values(directory.collect()) == (8.0, 0.0, [0, 8, 0])
+
+    def test_worker_retired_while_reading_counted_once(
+        self,
+        directory: metrics.MetricsDirectory,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        self.write_worker(directory, 100, requests=3, in_flight=1)
+        self.write_worker(directory, 101, requests=4, in_flight=2)
+        read = directory.read
+        retired = False
+
+        def read_then_retire(name: str | int) -> dict:
+            # the supervisor retires a worker the reader has listed
+            nonlocal retired
+            if not retired:
+                retired = True
+                directory.retire(101)
+            return read(name)
+
+        monkeypatch.setattr(directory, "read", read_then_retire)
+        assert self.get_values(directory.collect()) == (7.0, 1.0, [0, 7, 0])
+
+    def test_worker_writes_file_of_its_pid(
+        self, directory: metrics.MetricsDirectory
+    ) -> None:
+        directory.write()
+        names = [file.stem for file in directory.path.glob("*.json")]
+        assert names == [str(os.getpid())]
+
+
+class TestMetricsMiddleware:
+
+    REQUESTS = 2000
+
+    @pytest.fixture
+    def app(self) -> FastAPI:
+        app = FastAPI()
+        app.add_middleware(metrics.MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def get_item(item_id: int) -> dict:
+            return {"id": item_id}
+
+        return app
+
+    def get(self, app: FastAPI, *paths: str) -> list[int]:
+        async def scenario() -> list[int]:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                return [(await client.get(path)).status_code for path in paths]
+
+        return asyncio.run(scenario())
+
+    def test_requests_labeled_with_route_template(self, app: FastAPI) -> None:
+        before = metrics.http_requests_total.get(
+            "GET", "/items/{item_id}", "200"
+        )
+        assert self.get(app, "/items/1", "/items/2", "/items/x") == [
+            200,
+            200,
+            422,
+        ]
+        route = "/items/{item_id}"
+        assert metrics.http_requests_total.get("GET", route, "200") == (
+            before + 2
+        )
+        assert metrics.http_requests_total.get("GET", route, "422") >= 1
+        assert metrics.http_request_duration_seconds.get("GET", route)
+
+    def test_unmatched_requests_share_label(self, app: FastAPI) -> None:
+        before = metrics.http_requests_total.get(
+            "GET", metrics.UNMATCHED_ROUTE, "404"
+        )
+        self.get(app, "/missing/1", "/missing/2")
+        assert metrics.http_requests_total.get(
+            "GET", metrics.UNMATCHED_ROUTE, "404"
+        ) == (before + 2)
+
+    @pytest.mark.benchmark
+    def test_overhead_takes_microseconds(
+        self, pytestconfig: pytest.Config
+    ) -> None:
+        scope = {"type": "http", "method": "GET", "path": "/"}
+        start_message = {"type": "http.response.start", "status": 200}
+
+        async def endpoint(scope, receive, send) -> None:
+            await send(start_message)
+
+        async def receive() -> dict:
+            return {"type": "http.request"}
+
+        async def send(message: dict) -> None:
+            pass
+
+        async def run(app) -> float:
+            start = time.perf_counter()
+            for _ in range(self.REQUESTS):
+                await app(scope, receive, send)
+            return time.perf_counter() - start
+
+        async def scenario() -> tuple[float, float]:
+            bare = await run(endpoint)
+            measured = await run(metrics.MetricsMiddleware(endpoint))
+            return bare, measured
+
+        bare, measured = asyncio.run(scenario())
+        scale = pytestconfig.getoption("--threshold-scale")
+        assert (measured - bare) / self.REQUESTS < 10e-6 * scale
@@ -0,0 +1,904 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import Connection, Executable, create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import shift_fastapi_service.repository as repository
+from shift_fastapi_service.cache import get_principal_cache
+from shift_fastapi_service.database import (
+    READ_YOUR_WRITES_COOKIE,
+    EngineRouter,
+    ReadYourWritesMiddleware,
+)
+from shift_fastapi_service.domain import (
+    Principal,
+    UserFilter,
+    UserUpdate,
+    UserUpdateResult,
+)
+from shift_fastapi_service.exceptions import (
+    DataNotFoundException,
+    NotUniqueException,
+    RefreshTokenReusedException,
+)
+from shift_fastapi_service.migrations import schema_migration
+from shift_fastapi_service.models import Base
+from shift_fastapi_service.repository import (
+    USER_FIELDS,
+    AsyncRepository,
+    Repository,
+    create_schema,
+    get_page_order,
+    list_users_stmt,
+)
+
+TEST_USER: dict = {
+    "username": "bob",
+    "email": "bob@bob.com",
+    "salary": 20,
+    "next_promotion_date": date(year=2026, month=1, day=1),
+    "disabled": False,
+    "hashed_password": "sdfadfsd93bkadskfjs923bzsa",
+}
+
+
+def percentile(values: list[float], rank: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * rank))]
+
+
+def explain_query_plan(
+    connection: Connection, stmt: Executable, params: dict | None = None
+) -> str:
+    # Expanded state renders IN lists as separate parameters
+    state = stmt.compile(connection).construct_expanded_state(params)
+    rows = connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {state.statement}",
+        tuple(state.parameters[name] for name in state.positiontup or ()),
+    ).all()
+    return "\n".join(row.detail for row in rows)
+
+
+async def create_repository(db_path: Path) -> AsyncRepository:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    db = AsyncRepository(engine)
+    await db.generate_schema()
+    await db.create_user(TEST_USER)
+    return db
+
+
+class TestAsyncRepository:
+
+    @pytest.fixture
+    def db_path(self, tmp_path: Path) -> Path:
+        return tmp_path / "test.db"
+
+    def test_get_user_by_username(self, db_path: Path) -> None:
+        async def scenario() -> dict:
+            db = await create_repository(db_path)
+            try:
+                return await db.get_user_by_username(TEST_USER["username"])
+            finally:
+                await db.engine.dispose()
+
+        user = asyncio.run(scenario())
+        assert user == TEST_USER
+
+    def test_not_found_raises(self, db_path: Path) -> None:
+        async def scenario() -> None:
+            db = await create_repository(db_path)
+            try:
+                await db.get_user_by_username("not" + TEST_USER["username"])
+            finally:
+                await db.engine.dispose()
+
+        with pytest.raises(DataNotFoundException):
+            asyncio.run(scenario())
+
+    def test_not_unique_raises(self, db_path: Path) -> None:
+        async def scenario() -> None:
+            db = await create_repository(db_path)
+            try:
+                await db.create_user(TEST_USER)
+            finally:
+                await db.engine.dispose()
+
+        with pytest.raises(NotUniqueException):
+            asyncio.run(scenario())
+
+    def test_get_user_columns(self, db_path: Path) -> None:
+        async def scenario() -> tuple:
+            db = await create_repository(db_path)
+            try:
+                return await db.get_user_columns(
+                    TEST_USER["username"], ("username", "salary")
+                )
+            finally:
+                await db.engine.dispose()
+
+        row = asyncio.run(scenario())
+        assert tuple(row) == (TEST_USER["username"], TEST_USER["salary"])
+
+    def test_principal_loaded_from_columns(self, db_path: Path) -> None:
+        async def scenario() -> Principal:
+            db = await create_repository(db_path)
+            try:
+                row = await db.get_user_columns(
+                    TEST_USER["username"], Principal.__slots__
+                )
+                return Principal(*row)
+            finally:
+                await db.engine.dispose()
+
+        principal = asyncio.run(scenario())
+        assert principal.to_user_in_db().model_dump() == TEST_USER
+
+    def test_columns_of_missing_user_raise(self, db_path: Path) -> None:
+        async def scenario() -> None:
+            db = await create_repository(db_path)
+            try:
+                await db.get_user_columns("nobody", ("salary",))
+            finally:
+                await db.engine.dispose()
+
+        with pytest.raises(DataNotFoundException):
+            asyncio.run(scenario())
+
+
+class TestGenerateSchema:
+
+    def test_missing_column_added(self, tmp_path: Path) -> None:
+        db_path = tmp_path / "test.db"
+        with sqlite3.connect(db_path) as connection:
+            connection.execute(
+                "CREATE TABLE user_account (id INTEGER PRIMARY KEY, "
+                "username VARCHAR(50) UNIQUE, email VARCHAR(50) UNIQUE, "
+                "salary INTEGER, next_promotion_date DATE, "
+                "disabled BOOLEAN, hashed_password VARCHAR)"
+            )
+            connection.execute(
+                "INSERT INTO user_account VALUES "
+                "(1, 'bob', 'bob@bob.com', 20, '2026-01-01', 0, 'x')"
+            )
+        engine = create_engine(f"sqlite+pysqlite:///{db_path}")
+        db = Repository(engine)
+        db.generate_schema()
+        db.generate_schema()
+        (version,) = db.get_user_columns("bob", ("version",))
+        engine.dispose()
+        assert version == 1
+
+
+class TestEventLoopNotBlocked:
+    """
+    A coroutine must not wait for in-flight database queries.
+
+    Queries are held by an exclusive lock taken by another connection,
+    so every query in flight is waiting for the database.
+    """
+
+    PROBES = 200
+    PROBE_INTERVAL = 0.001
+
+    async def probe_latencies(
+        self, db: AsyncRepository, db_path: Path, in_flight: int
+    ) -> list[float]:
+        lock = sqlite3.connect(db_path, isolation_level=None)
+        lock.execute("BEGIN EXCLUSIVE")
+        queries = [
+            asyncio.create_task(db.get_user_by_username(TEST_USER["username"]))
+            for _ in range(in_flight)
+        ]
+        latencies = []
+        try:
+            for _ in range(self.PROBES):
+                start = time.perf_counter()
+                await asyncio.sleep(self.PROBE_INTERVAL)
+                latencies.append(
+                    time.perf_counter() - start - self.PROBE_INTERVAL
+                )
+        finally:
+            lock.execute("COMMIT")
+            lock.close()
+            await asyncio.gather(*queries)
+        return latencies
+
+    def test_p99_does_not_grow_with_in_flight_queries(
+        self, tmp_path: Path
+    ) -> None:
+        db_path = tmp_path / "test.db"
+
+        async def scenario() -> tuple[float, float]:
+            db = await create_repository(db_path)
+            try:
+                single = await self.probe_latencies(db, db_path, in_flight=1)
+                many = await self.probe_latencies(db, db_path, in_flight=32)
+            finally:
+                await db.engine.dispose()
+            return percentile(single, 0.99), percentile(many, 0.99)
+
+        p99_single, p99_many = asyncio.run(scenario())
+        assert p99_many < max(p99_single * 5, 0.02)
+
+
+class TestListUsers:
+
+    USERS = 10
+
+    @pytest.fixture
+    def db_path(self, tmp_path: Path) -> Path:
+        return tmp_path / "test.db"
+
+    def list_pages(
+        self, db_path: Path, user_filter: UserFilter, limit: int
+    ) -> list[list[dict]]:
+        async def scenario() -> list[list[dict]]:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+            db = AsyncRepository(engine)
+            try:
+                await db.generate_schema()
+                await db.create_users(
+                    [
+                        TEST_USER
+                        | {
+                            "username": f"user{i}",
+                            "email": f"user{i}@example.com",
+                            "salary": i % 4,
+                            "next_promotion_date": date(2030, 1, 10 - i),
+                        }
+                        for i in range(self.USERS)
+                    ]
+                )
+                order = get_page_order(user_filter)
+                pages = []
+                after = None
+                while True:
+                    page = await db.list_users(
+                        ("username",), user_filter, after, limit
+                    )
+                    if not page:
+                        return pages
+                    pages.append(page)
+                    after = tuple(page[-1][name] for name in order)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(scenario())
+
+    def test_pages_cover_all_users(self, db_path: Path) -> None:
+        pages = self.list_pages(db_path, UserFilter(), limit=3)
+        assert [len(page) for page in pages] == [3, 3, 3, 1]
+        usernames = [user["username"] for page in pages for user in page]
+        assert usernames == [f"user{i}" for i in range(self.USERS)]
+
+    def test_salary_range_paged_by_salary(self, db_path: Path) -> None:
+        pages = self.list_pages(
+            db_path, UserFilter(salary_min=1, salary_max=2), limit=2
+        )
+        usernames = [user["username"] for page in pages for user in page]
+        assert usernames == ["user1", "user5", "user9", "user2", "user6"]
+
+    def test_promotion_range_paged_by_date(self, db_path: Path) -> None:
+        pages = self.list_pages(
+            db_path,
+            UserFilter(
+                promotion_from=date(2030, 1, 3), promotion_to=date(2030, 1, 6)
+            ),
+            limit=3,
+        )
+        usernames = [user["username"] for page in pages for user in page]
+        assert usernames == ["user7", "user6", "user5", "user4"]
+
+    def test_salary_and_promotion_ranges(self, db_path: Path) -> None:
+        pages = self.list_pages(
+            db_path,
+            UserFilter(salary_min=2, promotion_to=date(2030, 1, 6)),
+            limit=1,
+        )
+        usernames = [user["username"] for page in pages for user in page]
+        assert usernames == ["user6", "user7"]
+
+    def test_page_is_searched_by_primary_key(self) -> None:
+        stmt = list_users_stmt(("username",), UserFilter(), (10_000,), 100)
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        with engine.connect() as connection:
+            plan = explain_query_plan(connection, stmt)
+        assert "USING INTEGER PRIMARY KEY (rowid>?)" in plan
+
+
+USERNAME_SEARCH = (
+    "SEARCH user_account USING COVERING INDEX "
+    "ix_user_account_username_auth (username=?)"
+)
+USERNAME_UPDATE = (
+    "SEARCH user_account USING INDEX "
+    "ix_user_account_username_auth (username=?)"
+)
+PRIMARY_KEY_RANGE = "SEARCH user_account USING INTEGER PRIMARY KEY (rowid>?)"
+SALARY_RANGE = (
+    "SEARCH user_account USING INDEX "
+    "ix_user_account_salary_id (salary>? AND salary<?)"
+)
+REFRESH_TOKEN_SEARCH = (
+    "SEARCH refresh_token USING INDEX "
+    "sqlite_autoindex_refresh_token_1 (token_hash=?)"
+)
+
+# Statement of every *_stmt function of repository, its parameters
+# and expected plan
+QUERY_PLANS: dict[str, list[tuple[Executable, dict, str]]] = {
+    "get_user_by_id_stmt": [
+        (
+            repository.get_user_by_id_stmt(),
+            {"user_id": 1},
+            "SEARCH user_account USING INTEGER PRIMARY KEY (rowid=?)",
+        )
+    ],
+    "get_user_by_username_stmt": [
+        (
+            repository.get_user_by_username_stmt(),
+            {"username": "bob"},
+            USERNAME_SEARCH,
+        )
+    ],
+    "get_user_columns_stmt": [
+        (
+            repository.get_user_columns_stmt(Principal.__slots__),
+            {"username": "bob"},
+            USERNAME_SEARCH,
+        ),
+        (
+            repository.get_user_columns_stmt(("version",)),
+            {"username": "bob"},
+            USERNAME_SEARCH,
+        ),
+    ],
+    "list_users_stmt": [
+        (
+            list_users_stmt(USER_FIELDS, UserFilter(), None, 100),
+            {},
+            PRIMARY_KEY_RANGE,
+        ),
+        (
+            list_users_stmt(("username",), UserFilter(), (10,), 100),
+            {},
+            PRIMARY_KEY_RANGE,
+        ),
+        (
+            list_users_stmt(
+                USER_FIELDS, UserFilter(salary_min=1, salary_max=9), None, 100
+            ),
+            {},
+            SALARY_RANGE,
+        ),
+        (
+            list_users_stmt(
+                ("username", "salary"),
+                UserFilter(salary_min=1, salary_max=9),
+                (5, 10),
+                100,
+            ),
+            {},
+            SALARY_RANGE,
+        ),
+        (
+            list_users_stmt(
+                ("username",),
+                UserFilter(
+                    salary_min=1,
+                    promotion_from=date(2030, 1, 1),
+                    promotion_to=date(2031, 1, 1),
+                ),
+                (5, 10),
+                100,
+            ),
+            {},
+            "SEARCH user_account USING INDEX "
+            "ix_user_account_salary_id (salary>?)",
+        ),
+        (
+            list_users_stmt(
+                ("username", "next_promotion_date"),
+                UserFilter(
+                    promotion_from=date(2030, 1, 1),
+                    promotion_to=date(2031, 1, 1),
+                ),
+                (date(2030, 6, 1), 10),
+                100,
+            ),
+            {},
+            "SEARCH user_account USING INDEX "
+            "ix_user_account_next_promotion_date_id "
+            "(next_promotion_date>? AND next_promotion_date<?)",
+        ),
+    ],
+    "existing_usernames_stmt": [
+        (
+            repository.existing_usernames_stmt(["bob", "alice"]),
+            {},
+            USERNAME_SEARCH,
+        )
+    ],
+    "conflicting_users_stmt": [
+        (
+            repository.conflicting_users_stmt(["bob"], ["bob@bob.com"]),
+            {},
+            "MULTI-INDEX OR\nINDEX 1\n" + USERNAME_SEARCH + "\nINDEX 2\n"
+            "SEARCH user_account USING INDEX ix_user_account_email (email=?)",
+        )
+    ],
+    "update_users_stmt": [
+        (
+            repository.update_users_stmt(),
+            {
+                "b_username": "bob",
+                "b_salary": 1,
+                "b_next_promotion_date": None,
+            },
+            USERNAME_UPDATE,
+        )
+    ],
+    "update_password_hash_stmt": [
+        (
+            repository.update_password_hash_stmt(),
+            {"b_username": "bob", "b_hashed_password": "x"},
+            USERNAME_UPDATE,
+        )
+    ],
+    "delete_expired_refresh_tokens_stmt": [
+        (
+            repository.delete_expired_refresh_tokens_stmt(),
+            {"username": "bob", "now": datetime(2030, 1, 1)},
+            "SEARCH refresh_token USING INDEX "
+            "ix_refresh_token_username (username=?)",
+        )
+    ],
+    "get_refresh_token_stmt": [
+        (
+            repository.get_refresh_token_stmt(),
+            {"token_hash": "x"},
+            REFRESH_TOKEN_SEARCH,
+        )
+    ],
+    "use_refresh_token_stmt": [
+        (
+            repository.use_refresh_token_stmt(),
+            {"b_token_hash": "x", "b_now": datetime(2030, 1, 1)},
+            REFRESH_TOKEN_SEARCH,
+        )
+    ],
+    "revoke_refresh_token_family_stmt": [
+        (
+            repository.revoke_refresh_token_family_stmt(),
+            {"b_family_id": "x"},
+            "SEARCH refresh_token USING INDEX "
+            "ix_refresh_token_family_id (family_id=?)",
+        )
+    ],
+    "take_login_token_stmt": [
+        (
+            repository.take_login_token_stmt(),
+            {
+                "b_name": "client",
+                "b_key": "10.0.0.1",
+                "b_now": 0.0,
+                "b_rate": 1.0,
+                "b_burst": 20,
+            },
+            "SEARCH login_bucket USING INDEX "
+            "sqlite_autoindex_login_bucket_1 (name=? AND key=?)",
+        )
+    ],
+    "allocate_ids_stmt": [
+        (
+            repository.allocate_ids_stmt(),
+            {"b_name": "user_account", "b_count": 10},
+            "SEARCH id_sequence USING INDEX "
+            "sqlite_autoindex_id_sequence_1 (name=?)",
+        )
+    ],
+    "delete_idle_login_buckets_stmt": [
+        (
+            repository.delete_idle_login_buckets_stmt(),
+            {"name": "client", "before": 0.0},
+            "SEARCH login_bucket USING INDEX "
+            "ix_login_bucket_name_updated_at (name=? AND updated_at<?)",
+        )
+    ],
+}
+
+
+class TestQueryPlans:
+    """
+    Plans of repository queries on a migrated SQLite database.
+
+    Lists walk the primary key from the cursor and stop at the limit,
+    any other query is an index search, so a SCAN is a regression.
+    """
+
+    @pytest.fixture
+    def connection(self):
+        engine = create_engine("sqlite://")
+        with engine.begin() as connection:
+            create_schema(connection)
+            yield connection
+        engine.dispose()
+
+    def test_every_query_has_plan(self) -> None:
+        stmt_functions = {
+            name for name in vars(repository) if name.endswith("_stmt")
+        }
+        assert stmt_functions == set(QUERY_PLANS)
+
+    @pytest.mark.parametrize("name", list(QUERY_PLANS))
+    def test_query_plan(self, name: str, connection: Connection) -> None:
+        for stmt, params, expected in QUERY_PLANS[name]:
+            plan = explain_query_plan(connection, stmt, params)
+            assert plan == expected
+            assert "SCAN" not in plan
+            assert "TEMP B-TREE" not in plan
+
+    def test_migrated_database_has_same_plans(self, tmp_path: Path) -> None:
+        db_path = tmp_path / "test.db"
+        with closing(sqlite3.connect(db_path)) as connection:
+            connection.execute(
+                "CREATE TABLE user_account (id INTEGER PRIMARY KEY, "
+                "username VARCHAR(50) UNIQUE, email VARCHAR(50) UNIQUE, "
+                "salary INTEGER, next_promotion_date DATE, "
+                "disabled BOOLEAN, hashed_password VARCHAR)"
+            )
+        engine = create_engine(f"sqlite+pysqlite:///{db_path}")
+        Repository(engine).generate_schema()
+        with engine.connect() as connection:
+            versions = connection.scalars(select(schema_migration.c.version))
+            assert list(versions) == [1, 2, 3, 4, 5]
+            plans = {
+                name: [
+                    explain_query_plan(connection, stmt, params)
+                    for stmt, params, _ in queries
+                ]
+                for name, queries in QUERY_PLANS.items()
+            }
+        engine.dispose()
+        assert plans == {
+            name: [expected for _, _, expected in queries]
+            for name, queries in QUERY_PLANS.items()
+        }
+
+
+class TestUpdateUsers:
+
+    def test_batch_update(self, tmp_path: Path) -> None:
+        principal_cache = get_principal_cache()
+        principal_cache.set(TEST_USER["username"], "stale principal")
+        new_date = date(year=2027, month=2, day=2)
+
+        async def scenario() -> tuple[list[UserUpdateResult], dict]:
+            db = await create_repository(tmp_path / "test.db")
+            try:
+                results = await db.update_users(
+                    [
+                        UserUpdate(username=TEST_USER["username"], salary=30),
+                        UserUpdate(username="not" + TEST_USER["username"]),
+                        UserUpdate(
+                            username=TEST_USER["username"],
+                            next_promotion_date=new_date,
+                        ),
+                    ]
+                )
+                user = await db.get_user_by_username(TEST_USER["username"])
+                (user["version"],) = await db.get_user_columns(
+                    TEST_USER["username"], ("version",)
+                )
+                return results, user
+            finally:
+                await db.engine.dispose()
+
+        results, user = asyncio.run(scenario())
+        assert [result.updated for result in results] == [True, False, False]
+        assert user["salary"] == 30
+        assert user["version"] == 2
+        assert user["next_promotion_date"] == TEST_USER["next_promotion_date"]
+        assert principal_cache.get(TEST_USER["username"]) is None
+
+
+class TestRefreshTokens:
+
+    NOW = datetime(year=2025, month=1, day=1)
+
+    def rotate(
+        self, db_path: Path, tokens: list[str], now: datetime = NOW
+    ) -> list[str | Exception]:
+        async def scenario() -> list[str | Exception]:
+            db = await create_repository(db_path)
+            try:
+                await db.create_refresh_token(
+                    token_hash="0",
+                    family_id="family",
+                    username=TEST_USER["username"],
+                    expires_at=self.NOW + timedelta(days=1),
+                    now=self.NOW,
+                )
+                results: list[str | Exception] = []
+                for i, token in enumerate(tokens, start=1):
+                    try:
+                        results.append(
+                            await db.rotate_refresh_token(
+                                token_hash=token,
+                                new_token_hash=str(i),
+                                expires_at=now + timedelta(days=1),
+                                now=now,
+                            )
+                        )
+                    except Exception as e:
+                        results.append(e)
+                return results
+            finally:
+                await db.engine.dispose()
+
+        return asyncio.run(scenario())
+
+    def test_rotation_chain(self, tmp_path: Path) -> None:
+        results = self.rotate(tmp_path / "test.db", ["0", "1", "2"])
+        assert results == [TEST_USER["username"]] * 3
+
+    def test_reuse_revokes_family(self, tmp_path: Path) -> None:
+        results = self.rotate(tmp_path / "test.db", ["0", "0", "1"])
+        assert results[0] == TEST_USER["username"]
+        assert isinstance(results[1], RefreshTokenReusedException)
+        assert isinstance(results[2], DataNotFoundException)
+
+    def test_expired_token_rejected(self, tmp_path: Path) -> None:
+        (result,) = self.rotate(
+            tmp_path / "test.db", ["0"], now=self.NOW + timedelta(days=2)
+        )
+        assert isinstance(result, DataNotFoundException)
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def sync_replicas(primary: Path, replicas: list[Path]) -> None:
+    with closing(sqlite3.connect(primary)) as source:
+        for replica in replicas:
+            with closing(sqlite3.connect(replica)) as target:
+                source.backup(target)
+
+
+def set_salary(db_path: Path, username: str, salary: int) -> None:
+    with closing(sqlite3.connect(db_path)) as connection:
+        connection.execute(
+            "UPDATE user_account SET salary = ? WHERE username = ?",
+            (salary, username),
+        )
+        connection.commit()
+
+
+class TestReplicaRouting:
+    """
+    Replicas are SQLite files the test copies the primary into.
+
+    After a sync each replica gets its own salary of TEST_USER,
+    so the salary read tells which database served the read.
+    """
+
+    REPLICA_SALARIES = [100, 200]
+
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        return FakeClock()
+
+    def make_router(
+        self,
+        tmp_path: Path,
+        clock: FakeClock,
+        policy: str = "round_robin",
+        replica_paths: list[Path] | None = None,
+    ) -> EngineRouter:
+        if replica_paths is None:
+            replica_paths = [
+                tmp_path / f"replica{i}.db"
+                for i in range(len(self.REPLICA_SALARIES))
+            ]
+        return EngineRouter(
+            create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"),
+            [
+                create_async_engine(f"sqlite+aiosqlite:///{path}")
+                for path in replica_paths
+            ],
+            policy=policy,  # type: ignore[arg-type]
+            read_your_writes_seconds=5.0,
+            retry_seconds=10.0,
+            clock=clock,
+            wall_clock=clock,
+        )
+
+    async def create_replicated_user(
+        self, db: AsyncRepository, tmp_path: Path, clock: FakeClock
+    ) -> None:
+        await db.generate_schema()
+        await db.create_user(TEST_USER)
+        replicas = [
+            tmp_path / f"replica{i}.db"
+            for i in range(len(self.REPLICA_SALARIES))
+        ]
+        sync_replicas(tmp_path / "test.db", replicas)
+        for replica, salary in zip(replicas, self.REPLICA_SALARIES):
+            set_salary(replica, TEST_USER["username"], salary)
+        clock.now += 10
+
+    async def read_salary(self, db: AsyncRepository) -> int:
+        (salary,) = await db.get_user_columns(
+            TEST_USER["username"], ("salary",)
+        )
+        return salary
+
+    async def close(self, router: EngineRouter) -> None:
+        await router.dispose()
+        await router.primary.dispose()
+
+    def test_reads_go_to_replicas_round_robin(
+        self, tmp_path: Path, clock: FakeClock
+    ) -> None:
+        async def scenario() -> list[int]:
+            router = self.make_router(tmp_path, clock)
+            db = AsyncRepository(router)
+            try:
+                await self.create_replicated_user(db, tmp_path, clock)
+                return [await self.read_salary(db) for _ in range(4)]
+            finally:
+                await self.close(router)
+
+        assert asyncio.run(scenario()) == [100, 200, 100, 200]
+
+    def test_writer_pinned_to_primary(
+        self, tmp_path: Path, clock: FakeClock
+    ) -> None:
+        async def scenario() -> list[int]:
+            router = self.make_router(tmp_path, clock)
+            db = AsyncRepository(router)
+            try:
+                await self.create_replicated_user(db, tmp_path, clock)
+                await db.update_users(
+                    [UserUpdate(username=TEST_USER["username"], salary=30)]
+                )
+                salaries = [await self.read_salary(db) for _ in range(2)]
+                clock.now += 5
+                salaries.append(await self.read_salary(db))
+                return salaries
+            finally:
+                await self.close(router)
+
+        assert asyncio.run(scenario()) == [30, 30, 100]
+
+    def make_worker(self, router: EngineRouter) -> FastAPI:
+        app = FastAPI()
+        app.add_middleware(ReadYourWritesMiddleware)
+        db = AsyncRepository(router)
+
+        @app.put("/salary/{salary}")
+        async def write_salary(salary: int) -> None:
+            await db.update_users(
+                [UserUpdate(username=TEST_USER["username"], salary=salary)]
+            )
+
+        @app.get("/salary")
+        async def read_salary() -> int:
+            return await self.read_salary(db)
+
+        return app
+
+    def test_writer_pinned_across_workers(
+        self, tmp_path: Path, clock: FakeClock
+    ) -> None:
+        """
+        Workers have their own routers, only the cookie of the client
+        tells the worker that didn't serve the write about it.
+        """
+
+        async def scenario() -> tuple[str, list[int]]:
+            routers = [self.make_router(tmp_path, clock) for _ in range(2)]
+            writer, reader = [
+                httpx.AsyncClient(
+                    transport=httpx.ASGITransport(
+                        app=self.make_worker(router)
+                    ),
+                    base_url="http://test",
+                )
+                for router in routers
+            ]
+            try:
+                await self.create_replicated_user(
+                    AsyncRepository(routers[0]), tmp_path, clock
+                )
+                response = await writer.put("/salary/30")
+                cookie = response.cookies[READ_YOUR_WRITES_COOKIE]
+                headers = {"cookie": f"{READ_YOUR_WRITES_COOKIE}={cookie}"}
+                salaries = [
+                    (await reader.get("/salary", headers=headers)).json(),
+                    (await reader.get("/salary")).json(),
+                ]
+                clock.now += 5
+                salaries.append(
+                    (await reader.get("/salary", headers=headers)).json()
+                )
+                return response.headers["set-cookie"], salaries
+            finally:
+                await writer.aclose()
+                await reader.aclose()
+                for router in routers:
+                    await self.close(router)
+
+        set_cookie, salaries = asyncio.run(scenario())
+        assert "Max-Age=5;" in set_cookie
+        assert salaries == [30, 100, 200]
+
+    def test_new_user_found_before_replication(
+        self, tmp_path: Path, clock: FakeClock
+    ) -> None:
+        async def scenario() -> dict:
+            router = self.make_router(tmp_path, clock)
+            db = AsyncRepository(router)
+            try:
+                await self.create_replicated_user(db, tmp_path, clock)
+                user = TEST_USER | {"username": "carol", "email": "c@c.com"}
+                await db.create_user(user)
+                return await db.get_user_by_username("carol")
+            finally:
+                await self.close(router)
+
+        assert asyncio.run(scenario())["username"] == "carol"
+
+    def test_least_busy_replica_chosen(
+        self, tmp_path: Path, clock: FakeClock
+    ) -> None:
+        async def scenario() -> list[int]:
+            router = self.make_router(tmp_path, clock, policy="least_busy")
+            db = AsyncRepository(router)
+            try:
+                await self.create_replicated_user(db, tmp_path, clock)
+                async with router.connect_reader():
+                    return [await self.read_salary(db) for _ in range(3)]
+            finally:
+                await self.close(router)
+
+        assert asyncio.run(scenario()) == [200, 200, 200]
+
+    def test_unavailable_replica_falls_back_to_primary(
+        self, tmp_path: Path, clock: FakeClock
+    ) -> None:
+        async def scenario() -> list[int | None]:
+            router = self.make_router(
+                tmp_path, clock, replica_paths=[tmp_path / "missing" / "db"]
+            )
+            db = AsyncRepository(router)
+            try:
+                await db.generate_schema()
+                await db.create_user(TEST_USER)
+                clock.now += 10
+                salaries: list[int | None] = [await self.read_salary(db)]
+                salaries.append(router.choose_replica())
+                clock.now += 10
+                salaries.append(router.choose_replica())
+                await router.check_replicas()
+                salaries.append(router.choose_replica())
+                return salaries
+            finally:
+                await self.close(router)
+
+        assert asyncio.run(scenario()) == [TEST_USER["salary"], None, 0, None]
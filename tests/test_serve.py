@@ -0,0 +1,51 @@
+from pathlib import Path
+from unittest.mock import patch
+
+from shift_fastapi_service.config import Settings
+from shift_fastapi_service.serve import (
+    get_max_requests,
+    get_worker_count,
+    share_state_between_workers,
+)
+
+
+class TestServe:
+
+    def test_max_requests_jittered(self) -> None:
+        settings = Settings(
+            server_max_requests=100, server_max_requests_jitter=10
+        )
+        limits = {get_max_requests(settings) for _ in range(200)}
+        assert limits <= set(range(100, 111))
+        assert len(limits) > 1
+
+    def test_max_requests_disabled(self) -> None:
+        assert get_max_requests(Settings(server_max_requests=0)) is None
+
+    def test_worker_count_defaults_to_cpu_count(self) -> None:
+        with patch("os.cpu_count", return_value=8):
+            assert get_worker_count(Settings()) == 8
+            assert get_worker_count(Settings(server_workers=3)) == 3
+
+    def test_workers_share_state(self) -> None:
+        settings = share_state_between_workers(Settings())
+        try:
+            assert settings.principal_cache_check_version
+            assert settings.login_throttle_store == "database"
+            assert Path(settings.metrics_dir).is_dir()
+        finally:
+            Path(settings.metrics_dir).rmdir()
+
+    def test_configured_version_check_kept(self, tmp_path: Path) -> None:
+        settings = share_state_between_workers(
+            Settings(
+                principal_cache_check_version=False, metrics_dir=str(tmp_path)
+            )
+        )
+        assert settings.principal_cache_check_version is False
+
+    def test_configured_metrics_dir_kept(self, tmp_path: Path) -> None:
+        settings = share_state_between_workers(
+            Settings(metrics_dir=str(tmp_path))
+        )
+        assert settings.metrics_dir == str(tmp_path)
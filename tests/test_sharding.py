@@ -0,0 +1,339 @@
+import asyncio
+import sqlite3
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from shift_fastapi_service.config import Settings, set_settings
+from shift_fastapi_service.database import dispose_engines
+from shift_fastapi_service.domain import UserFilter, UserUpdate
+from shift_fastapi_service.exceptions import DataNotFoundException
+from shift_fastapi_service.repository import (
+    ShardedAsyncRepository,
+    get_page_order,
+    get_repository,
+)
+from shift_fastapi_service.reshard import reshard
+from shift_fastapi_service.sharding import HashRing
+
+USERNAMES = [f"user{i}" for i in range(60)]
+
+
+def make_user(username: str) -> dict:
+    return {
+        "username": username,
+        "email": f"{username}@example.com",
+        "salary": 10,
+        "next_promotion_date": date(2030, 1, 1),
+        "disabled": False,
+        "hashed_password": "hash",
+    }
+
+
+def count_users(db_path: Path) -> int:
+    with closing(sqlite3.connect(db_path)) as connection:
+        return connection.execute(
+            "SELECT count(*) FROM user_account"
+        ).fetchone()[0]
+
+
+class TestHashRing:
+
+    def test_shards_balanced(self) -> None:
+        ring = HashRing(["s0", "s1", "s2"])
+        counts = {"s0": 0, "s1": 0, "s2": 0}
+        for i in range(9000):
+            counts[ring.get_shard(f"user{i}")] += 1
+        assert all(2000 < count < 4000 for count in counts.values())
+
+    def test_added_shard_takes_keys_of_others_only(self) -> None:
+        old = HashRing(["s0", "s1", "s2"])
+        new = HashRing(["s0", "s1", "s2", "s3"])
+        keys = [f"user{i}" for i in range(9000)]
+        moved = [
+            key for key in keys if old.get_shard(key) != new.get_shard(key)
+        ]
+        assert all(new.get_shard(key) == "s3" for key in moved)
+        assert 0.15 < len(moved) / len(keys) < 0.35
+
+
+class ShardedDatabases:
+
+    def shard_paths(self, tmp_path: Path, count: int) -> dict[str, Path]:
+        return {f"s{i}": tmp_path / f"s{i}.db" for i in range(count)}
+
+    def make_repository(
+        self, tmp_path: Path, shard_paths: dict[str, Path]
+    ) -> ShardedAsyncRepository:
+        return ShardedAsyncRepository(
+            {
+                name: create_async_engine(f"sqlite+aiosqlite:///{path}")
+                for name, path in shard_paths.items()
+            },
+            engine=create_async_engine(
+                f"sqlite+aiosqlite:///{tmp_path / 'main.db'}"
+            ),
+        )
+
+    async def close(self, db: ShardedAsyncRepository) -> None:
+        await db.engine.dispose()
+        for shard in db.shards.values():
+            await shard.engine.dispose()
+
+    async def create_users(
+        self, tmp_path: Path, shard_paths: dict[str, Path]
+    ) -> None:
+        db = self.make_repository(tmp_path, shard_paths)
+        try:
+            await db.generate_schema()
+            await db.create_users([make_user(name) for name in USERNAMES])
+        finally:
+            await self.close(db)
+
+
+class TestShardedAsyncRepository(ShardedDatabases):
+
+    def test_user_stored_in_one_shard(self, tmp_path: Path) -> None:
+        shard_paths = self.shard_paths(tmp_path, 3)
+
+        async def scenario() -> dict:
+            db = self.make_repository(tmp_path, shard_paths)
+            try:
+                await db.generate_schema()
+                await db.create_user(make_user("alice"))
+                return await db.get_user_by_username("alice")
+            finally:
+                await self.close(db)
+
+        assert asyncio.run(scenario())["username"] == "alice"
+        assert sorted(count_users(path) for path in shard_paths.values()) == [
+            0,
+            0,
+            1,
+        ]
+
+    @pytest.mark.parametrize(
+        "user_filter", [UserFilter(), UserFilter(salary_min=10)]
+    )
+    def test_pages_merged_from_shards(
+        self, tmp_path: Path, user_filter: UserFilter
+    ) -> None:
+        shard_paths = self.shard_paths(tmp_path, 3)
+        order = get_page_order(user_filter)
+
+        async def scenario() -> tuple[list[dict], list[str]]:
+            await self.create_users(tmp_path, shard_paths)
+            db = self.make_repository(tmp_path, shard_paths)
+            try:
+                rows: list[dict] = []
+                after = None
+                while True:
+                    page = await db.list_users(
+                        ("username",), user_filter, after, limit=7
+                    )
+                    rows.extend(page)
+                    if len(page) < 7:
+                        break
+                    after = tuple(page[-1][name] for name in order)
+                users = [
+                    await db.get_user_by_id(row["id"]) for row in rows[:5]
+                ]
+                return rows, [user["username"] for user in users]
+            finally:
+                await self.close(db)
+
+        rows, usernames = asyncio.run(scenario())
+        ids = [row["id"] for row in rows]
+        assert ids == sorted(set(ids))
+        assert sorted(row["username"] for row in rows) == sorted(USERNAMES)
+        assert usernames == [row["username"] for row in rows[:5]]
+        assert all(count_users(path) for path in shard_paths.values())
+
+    def test_batches_keep_order(self, tmp_path: Path) -> None:
+        shard_paths = self.shard_paths(tmp_path, 3)
+
+        async def scenario() -> tuple[list[bool], list[str | None]]:
+            await self.create_users(tmp_path, shard_paths)
+            db = self.make_repository(tmp_path, shard_paths)
+            try:
+                created = await db.create_users(
+                    [make_user("new1"), make_user("user1"), make_user("new2")]
+                )
+                results = await db.update_users(
+                    [
+                        UserUpdate(username=username, salary=20)
+                        for username in ("user2", "nobody", "new2", "user3")
+                    ]
+                )
+                return created, [result.detail for result in results]
+            finally:
+                await self.close(db)
+
+        created, details = asyncio.run(scenario())
+        assert created == [True, False, True]
+        assert details == [None, "user not found", None, None]
+
+    def test_missing_id_raises(self, tmp_path: Path) -> None:
+        async def scenario() -> None:
+            db = self.make_repository(tmp_path, self.shard_paths(tmp_path, 2))
+            try:
+                await db.generate_schema()
+                await db.get_user_by_id(1023)
+            finally:
+                await self.close(db)
+
+        with pytest.raises(DataNotFoundException):
+            asyncio.run(scenario())
+
+
+def to_urls(paths: dict[str, Path]) -> dict[str, str]:
+    return {name: f"sqlite+pysqlite:///{path}" for name, path in paths.items()}
+
+
+class TestGetRepository(ShardedDatabases):
+
+    def test_built_once_until_engines_disposed(self, tmp_path: Path) -> None:
+        shards = ",".join(
+            f"{name}=sqlite+aiosqlite:///{path}"
+            for name, path in self.shard_paths(tmp_path, 2).items()
+        )
+        set_settings(
+            Settings(
+                database_url=f"sqlite+aiosqlite:///{tmp_path / 'main.db'}",
+                database_shards=shards,
+            )
+        )
+        try:
+            db = get_repository()
+            assert isinstance(db, ShardedAsyncRepository)
+            assert get_repository() is db
+            asyncio.run(dispose_engines())
+            assert get_repository() is not db
+        finally:
+            asyncio.run(dispose_engines())
+            set_settings(None)
+
+
+class TestReshard(ShardedDatabases):
+
+    def read_ids(
+        self, tmp_path: Path, shard_paths: dict[str, Path]
+    ) -> dict[str, int]:
+        async def scenario() -> dict[str, int]:
+            db = self.make_repository(tmp_path, shard_paths)
+            try:
+                rows = await db.list_users(
+                    ("username",), UserFilter(), limit=len(USERNAMES)
+                )
+                ids = {row["username"]: row["id"] for row in rows}
+                # found by id in whatever shard the user is now
+                for username, user_id in list(ids.items())[:10]:
+                    user = await db.get_user_by_id(user_id)
+                    assert user["username"] == username
+                return ids
+            finally:
+                await self.close(db)
+
+        return asyncio.run(scenario())
+
+    def test_ids_kept_when_moved_or_reordered(self, tmp_path: Path) -> None:
+        old_paths = self.shard_paths(tmp_path, 2)
+        new_paths = self.shard_paths(tmp_path, 3)
+        asyncio.run(self.create_users(tmp_path, old_paths))
+        ids = self.read_ids(tmp_path, old_paths)
+        reshard(to_urls(old_paths), to_urls(new_paths), Settings())
+        reordered = dict(reversed(new_paths.items()))
+        assert self.read_ids(tmp_path, reordered) == ids
+        assert sorted(ids.values()) == list(range(1, len(USERNAMES) + 1))
+
+    def test_sequence_starts_after_moved_users(self, tmp_path: Path) -> None:
+        shard_paths = self.shard_paths(tmp_path, 2)
+
+        async def scenario() -> dict:
+            db = self.make_repository(tmp_path, shard_paths)
+            try:
+                await db.generate_schema()
+                # a user moved from an unsharded database keeps its id
+                await db.shards["s0"].create_user(
+                    make_user("old") | {"id": 41}
+                )
+                await db.create_user(make_user("new"))
+                return await db.get_user_by_id(42)
+            finally:
+                await self.close(db)
+
+        assert asyncio.run(scenario())["username"] == "new"
+
+    def test_users_found_after_reshard(self, tmp_path: Path) -> None:
+        old_paths = self.shard_paths(tmp_path, 2)
+        new_paths = self.shard_paths(tmp_path, 3)
+
+        async def read_users() -> list[str]:
+            db = self.make_repository(tmp_path, new_paths)
+            try:
+                return [
+                    (await db.get_user_by_username(name))["username"]
+                    for name in USERNAMES
+                ]
+            finally:
+                await self.close(db)
+
+        asyncio.run(self.create_users(tmp_path, old_paths))
+        settings = Settings()
+        planned = reshard(
+            to_urls(old_paths), to_urls(new_paths), settings, dry_run=True
+        )
+        moved = reshard(
+            to_urls(old_paths), to_urls(new_paths), settings, batch_size=7
+        )
+        again = reshard(to_urls(new_paths), to_urls(new_paths), settings)
+        assert moved == planned
+        assert {move.target for move in moved.moves} == {"s2"}
+        assert moved.moved == count_users(new_paths["s2"]) > 0
+        assert again.moved == 0
+        assert not moved.conflicts
+        assert asyncio.run(read_users()) == USERNAMES
+
+    def test_conflict_reported_and_run_goes_on(self, tmp_path: Path) -> None:
+        old_paths = self.shard_paths(tmp_path, 2)
+        new_paths = self.shard_paths(tmp_path, 3)
+        asyncio.run(self.create_users(tmp_path, old_paths))
+        ring = HashRing(to_urls(new_paths), Settings().database_shard_vnodes)
+        username = next(
+            name for name in USERNAMES if ring.get_shard(name) == "s2"
+        )
+
+        async def take_email() -> None:
+            db = self.make_repository(tmp_path, {"s2": new_paths["s2"]})
+            try:
+                await db.generate_schema()
+                await db.shards["s2"].create_user(
+                    make_user("other")
+                    | {"id": 1000, "email": f"{username}@example.com"}
+                )
+            finally:
+                await self.close(db)
+
+        asyncio.run(take_email())
+        settings = Settings()
+        planned = reshard(
+            to_urls(old_paths), to_urls(new_paths), settings, dry_run=True
+        )
+        report = reshard(
+            to_urls(old_paths), to_urls(new_paths), settings, batch_size=7
+        )
+        assert [conflict.username for conflict in report.conflicts] == [
+            username
+        ]
+        assert report.conflicts[0].target == "s2"
+        assert report.moved == planned.moved - 1
+        assert count_users(new_paths["s2"]) == report.moved + 1
+        # the conflicting user stays where it was
+        total = sum(count_users(path) for path in new_paths.values())
+        assert total == len(USERNAMES) + 1
+        again = reshard(to_urls(new_paths), to_urls(new_paths), settings)
+        assert again.moved == 0
+        assert len(again.conflicts) == 1
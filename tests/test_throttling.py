@@ -0,0 +1,197 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+
+from shift_fastapi_service.auth.throttling import (
+    DatabaseTokenBucketLimiter,
+    LoginThrottle,
+    TokenBucketLimiter,
+    get_client_address,
+)
+from shift_fastapi_service.config import Settings
+from shift_fastapi_service.models import LoginBucket
+from shift_fastapi_service.repository import AsyncRepository
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTokenBucketLimiter:
+
+    @pytest.fixture
+    def clock(self) -> FakeClock:
+        return FakeClock()
+
+    @pytest.fixture
+    def limiter(self, clock: FakeClock) -> TokenBucketLimiter:
+        return TokenBucketLimiter(rate=0.5, burst=2, max_keys=3, clock=clock)
+
+    def test_burst_allowed_then_limited(
+        self, limiter: TokenBucketLimiter
+    ) -> None:
+        assert limiter.acquire("alice") == 0
+        assert limiter.acquire("alice") == 0
+        assert limiter.acquire("alice") == pytest.approx(2.0)
+        assert limiter.acquire("bob") == 0
+
+    def test_bucket_refilled(
+        self, limiter: TokenBucketLimiter, clock: FakeClock
+    ) -> None:
+        limiter.acquire("alice")
+        limiter.acquire("alice")
+        clock.now = 2.0
+        assert limiter.acquire("alice") == 0
+        assert limiter.acquire("alice") > 0
+
+    def test_idle_buckets_evicted(
+        self, limiter: TokenBucketLimiter, clock: FakeClock
+    ) -> None:
+        limiter.acquire("alice")
+        limiter.acquire("bob")
+        clock.now = 4.0
+        limiter.acquire("carol")
+        assert len(limiter) == 1
+
+    def test_least_recently_used_evicted_above_max_keys(
+        self, limiter: TokenBucketLimiter
+    ) -> None:
+        for key in ("alice", "bob", "carol", "dave"):
+            limiter.acquire(key)
+        assert len(limiter) == 3
+        assert limiter.acquire("alice") == 0
+        assert limiter.acquire("alice") == 0
+
+
+class TestLoginThrottle:
+
+    def test_username_limited_across_clients(self) -> None:
+        clock = FakeClock()
+        throttle = LoginThrottle(
+            by_client=TokenBucketLimiter(1.0, 10, 100, clock=clock),
+            by_username=TokenBucketLimiter(1.0, 2, 100, clock=clock),
+        )
+        assert asyncio.run(throttle.check("10.0.0.1", "alice")) == 0
+        assert asyncio.run(throttle.check("10.0.0.2", "alice")) == 0
+        assert asyncio.run(throttle.check("10.0.0.3", "alice")) > 0
+        assert asyncio.run(throttle.check("10.0.0.3", "bob")) == 0
+
+
+class TestDatabaseTokenBucketLimiter:
+    """
+    Each limiter stands for a server worker with its own engine,
+    the workers share the database file.
+    """
+
+    WORKERS = 3
+
+    def acquire_all(
+        self, db_path: Path, attempts: list[tuple[float, str]]
+    ) -> tuple[list[float], int]:
+        clock = FakeClock()
+
+        async def scenario() -> tuple[list[float], int]:
+            repositories = [
+                AsyncRepository(
+                    create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+                )
+                for _ in range(self.WORKERS)
+            ]
+            await repositories[0].generate_schema()
+            limiters = [
+                DatabaseTokenBucketLimiter(
+                    "client", rate=0.5, burst=2, get_db=lambda: db, clock=clock
+                )
+                for db in repositories
+            ]
+            try:
+                results = []
+                for i, (now, key) in enumerate(attempts):
+                    clock.now = now
+                    limiter = limiters[i % self.WORKERS]
+                    results.append(await limiter.acquire(key))
+                async with repositories[0].engine.connect() as connection:
+                    buckets = await connection.scalar(
+                        select(func.count()).select_from(LoginBucket)
+                    )
+                return results, buckets
+            finally:
+                for db in repositories:
+                    await db.engine.dispose()
+
+        return asyncio.run(scenario())
+
+    def test_burst_shared_by_workers(self, tmp_path: Path) -> None:
+        attempts = [(now, "10.0.0.1") for now in (0.0, 0.0, 0.0, 1.0)]
+        results, _ = self.acquire_all(tmp_path / "test.db", attempts)
+        assert results == [0, 0, pytest.approx(2.0), pytest.approx(1.0)]
+
+    def test_bucket_refilled(self, tmp_path: Path) -> None:
+        attempts = [(now, "10.0.0.1") for now in (0.0, 0.0, 2.0, 2.0)]
+        results, _ = self.acquire_all(tmp_path / "test.db", attempts)
+        assert results[2] == 0
+        assert results[3] > 0
+
+    def test_idle_buckets_deleted(self, tmp_path: Path) -> None:
+        attempts = [(0.0, "10.0.0.1"), (0.0, "10.0.0.2"), (4.5, "10.0.0.3")]
+        _, buckets = self.acquire_all(tmp_path / "test.db", attempts)
+        assert buckets == 1
+
+
+class TestSettings:
+
+    @pytest.mark.parametrize(
+        "field", ["login_client_rate", "login_username_rate"]
+    )
+    def test_zero_rate_rejected(self, field: str) -> None:
+        with pytest.raises(ValidationError):
+            Settings(**{field: 0})
+        settings = Settings.from_env({field.upper(): "0"})
+        assert getattr(settings, field) == Settings.model_fields[field].default
+
+    def test_zero_burst_rejected(self) -> None:
+        with pytest.raises(ValidationError):
+            Settings(login_client_burst=0)
+
+
+class TestGetClientAddress:
+
+    def make_request(self, forwarded_for: str | None) -> Request:
+        headers = []
+        if forwarded_for is not None:
+            headers.append((b"x-forwarded-for", forwarded_for.encode()))
+        return Request(
+            {
+                "type": "http",
+                "method": "POST",
+                "headers": headers,
+                "client": ("172.18.0.2", 40000),
+            }
+        )
+
+    @pytest.mark.parametrize(
+        "forwarded_for, hops, expected",
+        [
+            ("203.0.113.7", 0, "172.18.0.2"),
+            (None, 1, "172.18.0.2"),
+            ("203.0.113.7", 1, "203.0.113.7"),
+            ("1.1.1.1, 203.0.113.7", 1, "203.0.113.7"),
+            ("1.1.1.1, 203.0.113.7, 10.0.0.5", 2, "203.0.113.7"),
+            ("203.0.113.7", 2, "203.0.113.7"),
+        ],
+    )
+    def test_client_taken_behind_trusted_proxies(
+        self, forwarded_for: str | None, hops: int, expected: str
+    ) -> None:
+        request = self.make_request(forwarded_for)
+        assert get_client_address(request, hops) == expected
@@ -0,0 +1,92 @@
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from shift_fastapi_service import views
+from shift_fastapi_service.admin.views import decode_cursor, encode_cursor
+from shift_fastapi_service.domain import Principal
+
+TEST_PRINCIPAL = Principal(
+    username="bob",
+    email="bob@bob.com",
+    salary=20,
+    next_promotion_date=date(year=2026, month=1, day=1),
+    disabled=False,
+    hashed_password="sdfadfsd93bkadskfjs923bzsa",
+    version=3,
+)
+
+
+def make_request(if_none_match: str | None = None) -> Request:
+    headers = []
+    if if_none_match is not None:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+class TestConditionalResponse:
+
+    @pytest.fixture
+    def etag(self) -> str:
+        return views.get_etag(TEST_PRINCIPAL)
+
+    def test_etag_changes_with_version(self, etag: str) -> None:
+        principal = Principal(
+            *(getattr(TEST_PRINCIPAL, name) for name in Principal.__slots__)
+        )
+        principal.version += 1
+        assert views.get_etag(principal) != etag
+
+    @pytest.mark.parametrize(
+        "if_none_match", ['"other"', "", None, '"other", W/"other"']
+    )
+    def test_body_sent_if_etag_differs(
+        self, if_none_match: str | None, etag: str
+    ) -> None:
+        response = views.conditional_response(
+            make_request(if_none_match), TEST_PRINCIPAL, lambda: {"a": 1}
+        )
+        assert response.status_code == 200
+        assert response.body == b'{"a":1}'
+        assert response.headers["etag"] == etag
+
+    @pytest.mark.parametrize("template", ["{}", "W/{}", '"other", {}', "*"])
+    def test_not_modified_if_etag_matches(
+        self, template: str, etag: str
+    ) -> None:
+        def render() -> dict:
+            raise AssertionError("body must not be rendered")
+
+        response = views.conditional_response(
+            make_request(template.format(etag)), TEST_PRINCIPAL, render
+        )
+        assert response.status_code == 304
+        assert response.body == b""
+        assert response.headers["etag"] == etag
+
+
+class TestPageCursor:
+
+    @pytest.mark.parametrize(
+        "order, row",
+        [
+            (("id",), {"id": 42}),
+            (("salary", "id"), {"id": 42, "salary": 50000}),
+            (
+                ("next_promotion_date", "id"),
+                {"id": 42, "next_promotion_date": date(2030, 1, 1)},
+            ),
+        ],
+    )
+    def test_cursor_decoded_to_keyset(
+        self, order: tuple[str, ...], row: dict
+    ) -> None:
+        cursor = encode_cursor(row, order)
+        assert decode_cursor(cursor, order) == tuple(row[n] for n in order)
+
+    @pytest.mark.parametrize("cursor", ["42", "x,42", "50000,42,1"])
+    def test_cursor_of_other_order_rejected(self, cursor: str) -> None:
+        with pytest.raises(HTTPException):
+            decode_cursor(cursor, ("salary", "id"))